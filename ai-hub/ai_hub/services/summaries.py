@@ -89,9 +89,13 @@ Summary of {instruction} in a sentence:"""
         prompt = shorten_text(prompt, max_length=12000, margin=20, how="center")
 
     openai_client = lab.get_async_client(provider)
+    llm_call_metadata: Dict[str, object] = {}
     try:
-        response = await openai_client.chat.completions.create(
-            model=model_llm,
+        # Cached: regenerating a clustering doesn't summarize the same messages again
+        response, llm_call_metadata = await lab.cached_chat_completion(
+            openai_client,
+            provider,
+            model_llm,
             messages=[
                 {
                     "role": "system",
@@ -122,7 +126,7 @@ Summary of {instruction} in a sentence:"""
     return lab.JobResult(
         value=summary,
         result_type=lab.ResultType.string,
-        metadata=message.metadata,
+        metadata={**message.metadata, **llm_call_metadata},
     )
 
 
@@ -19,8 +19,10 @@ from phospho_backend.security import (
 )
 from phospho_backend.services.log import create_task_and_process_logs
 from phospho_backend.services.mongo.emails import send_quota_exceeded_email
+from phospho_backend.utils import GzipRoute
 
-router = APIRouter(tags=["Logs"])
+# The phospho SDK sends gzipped batches of log events
+router = APIRouter(tags=["Logs"], route_class=GzipRoute)
 
 
 @router.post(
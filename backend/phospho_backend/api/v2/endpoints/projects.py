@@ -1,12 +1,14 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Response
 from propelauth_py.types.user import OrgApiKeyValidation  # type: ignore
 
 from phospho_backend.api.v2.models import (
     FlattenedTasks,
     FlattenedTasksRequest,
     QuerySessionsTasksRequest,
+    QueryTasksPageRequest,
     Sessions,
     Tasks,
+    TasksPage,
 )
 from phospho_backend.security import (
     authenticate_org_key,
@@ -15,10 +17,19 @@ from phospho_backend.security import (
 from phospho_backend.services.mongo.sessions import get_all_sessions
 from phospho_backend.services.mongo.tasks import (
     fetch_flattened_tasks,
+    fetch_flattened_tasks_rows,
+    flattened_tasks_to_arrow,
     get_all_tasks,
+    get_tasks_page,
+    serialize_arrow_table,
     update_from_flattened_tasks,
 )
 
+ARROW_MEDIA_TYPES = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
 router = APIRouter(tags=["Projects"])
 
 
@@ -69,6 +80,39 @@ async def post_tasks(
     return Tasks(tasks=tasks)
 
 
+@router.post(
+    "/projects/{project_id}/tasks/page",
+    response_model=TasksPage,
+    description="Fetch a page of the tasks of a project, using a cursor",
+)
+async def post_tasks_page(
+    project_id: str,
+    query: QueryTasksPageRequest,
+    org: OrgApiKeyValidation = Depends(authenticate_org_key),
+) -> TasksPage:
+    """
+    Fetch a page of the tasks of a project, from the most recent to the oldest.
+
+    Pass the next_cursor of the response as the cursor of the next request to get the
+    next page. next_cursor is None on the last page.
+
+    The filters are combined as AND conditions on the different fields.
+    """
+    await verify_propelauth_org_owns_project_id(org, project_id)
+    if query.filters.user_id is not None:
+        if query.filters.metadata is None:
+            query.filters.metadata = {}
+        query.filters.metadata["user_id"] = query.filters.user_id
+
+    tasks, next_cursor = await get_tasks_page(
+        project_id=project_id,
+        filters=query.filters,
+        page_size=query.page_size,
+        cursor=query.cursor,
+    )
+    return TasksPage(tasks=tasks, next_cursor=next_cursor)
+
+
 @router.post(
     "/projects/{project_id}/tasks/flat",
     response_model=FlattenedTasks,
@@ -78,12 +122,31 @@ async def get_flattened_tasks(
     project_id: str,
     flattened_tasks_request: FlattenedTasksRequest,
     org: OrgApiKeyValidation = Depends(authenticate_org_key),
-) -> FlattenedTasks:
+) -> FlattenedTasks | Response:
     """
     Get all the tasks of a project in a flattened format.
+
+    With format="arrow" or format="parquet", the rows are returned as a columnar
+    table (Arrow IPC stream or Parquet file) instead of json.
     """
     await verify_propelauth_org_owns_project_id(org, project_id)
 
+    if flattened_tasks_request.format in ARROW_MEDIA_TYPES:
+        rows = await fetch_flattened_tasks_rows(
+            project_id=project_id,
+            limit=flattened_tasks_request.limit,
+            with_events=flattened_tasks_request.with_events,
+            with_sessions=flattened_tasks_request.with_sessions,
+            keep_removed_events=flattened_tasks_request.with_removed_events,
+        )
+        content = serialize_arrow_table(
+            flattened_tasks_to_arrow(rows), format=flattened_tasks_request.format
+        )
+        return Response(
+            content=content,
+            media_type=ARROW_MEDIA_TYPES[flattened_tasks_request.format],
+        )
+
     flattened_tasks = await fetch_flattened_tasks(
         project_id=project_id,
         limit=flattened_tasks_request.limit,
@@ -35,6 +35,7 @@ from .projects import (
     Projects,
     ProjectUpdateRequest,
     QuerySessionsTasksRequest,
+    QueryTasksPageRequest,
     UserMetadata,
     Users,
 )
@@ -45,5 +46,6 @@ from .tasks import (
     TaskFlagRequest,
     TaskHumanEvalRequest,
     Tasks,
+    TasksPage,
     TaskUpdateRequest,
 )
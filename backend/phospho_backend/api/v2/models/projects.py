@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic import BaseModel, Field
 
 from phospho_backend.db.models import (
@@ -54,6 +56,8 @@ class FlattenedTasksRequest(BaseModel):
     with_events: bool = True
     with_sessions: bool = True
     with_removed_events: bool = False
+    # json: FlattenedTasks. arrow: Arrow IPC stream. parquet: Parquet file.
+    format: Literal["json", "arrow", "parquet"] = "json"
 
 
 class ComputeJobsRequest(BaseModel):
@@ -64,3 +68,10 @@ class ComputeJobsRequest(BaseModel):
 class QuerySessionsTasksRequest(BaseModel):
     filters: ProjectDataFilters = Field(default_factory=ProjectDataFilters)
     limit: int | None = 1000
+
+
+class QueryTasksPageRequest(BaseModel):
+    filters: ProjectDataFilters = Field(default_factory=ProjectDataFilters)
+    page_size: int = Field(default=1000, ge=1, le=10_000)
+    # Returned as next_cursor by the previous page. None to get the first page.
+    cursor: str | None = None
@@ -11,6 +11,12 @@ class Tasks(BaseModel):
     tasks: list[Task]
 
 
+class TasksPage(BaseModel):
+    tasks: list[Task]
+    # Cursor of the next page, None if this is the last page
+    next_cursor: str | None = None
+
+
 class TaskCreationRequest(BaseModel):
     task_id: str | None = Field(default_factory=generate_uuid)
     session_id: str | None = None
@@ -89,6 +89,15 @@ async def connect_and_init_db():
             mongo_db[MONGODB_NAME]["tasks"].create_index(
                 ["project_id", "created_at"], background=True
             )
+            # Keyset pagination of the tasks
+            mongo_db[MONGODB_NAME]["tasks"].create_index(
+                [
+                    "project_id",
+                    ("created_at", pymongo.DESCENDING),
+                    ("id", pymongo.DESCENDING),
+                ],
+                background=True,
+            )
             mongo_db[MONGODB_NAME]["tasks"].create_index(
                 ["project_id", "flag"], background=True
             )
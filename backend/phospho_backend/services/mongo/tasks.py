@@ -1,6 +1,10 @@
+import base64
+import json
 from collections import defaultdict
 from typing import Literal, cast
 
+import pyarrow as pa  # type: ignore
+import pyarrow.parquet as pq  # type: ignore
 import pydantic
 from fastapi import HTTPException
 from loguru import logger
@@ -509,7 +513,96 @@ async def get_all_tasks(
     return valid_tasks
 
 
-async def fetch_flattened_tasks(
+def encode_tasks_cursor(created_at: int, task_id: str) -> str:
+    """
+    Encode the position of a task in the list of tasks sorted by
+    (created_at, id) descending, as an opaque cursor.
+    """
+    return base64.urlsafe_b64encode(json.dumps([created_at, task_id]).encode()).decode()
+
+
+def decode_tasks_cursor(cursor: str) -> tuple[int, str]:
+    try:
+        created_at, task_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(created_at, int) or not isinstance(task_id, str):
+            raise ValueError("Invalid cursor content")
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+    return created_at, task_id
+
+
+async def get_tasks_page(
+    project_id: str,
+    filters: ProjectDataFilters | None = None,
+    page_size: int = 1000,
+    cursor: str | None = None,
+    get_events: bool = True,
+) -> tuple[list[Task], str | None]:
+    """
+    Get a page of the tasks of a project, from the most recent to the oldest.
+
+    This uses keyset pagination on (created_at, id): the cost of fetching a page
+    doesn't depend on its position, unlike $skip.
+
+    Returns:
+    - The tasks of the page.
+    - The cursor of the next page, or None if this is the last page.
+    """
+    mongo_db = await get_mongo_db()
+
+    query_builder = QueryBuilder(
+        project_id=project_id,
+        filters=filters,
+        fetch_objects="tasks",
+    )
+    pipeline = await query_builder.build()
+
+    if cursor is not None:
+        created_at, task_id = decode_tasks_cursor(cursor)
+        pipeline.append(
+            {
+                "$match": {
+                    "$or": [
+                        {"created_at": {"$lt": created_at}},
+                        {"created_at": created_at, "id": {"$lt": task_id}},
+                    ]
+                }
+            }
+        )
+    pipeline.extend(
+        [
+            {"$sort": {"created_at": -1, "id": -1}},
+            {"$limit": page_size},
+            # Get rid of the raw_input and raw_output fields
+            {
+                "$project": {
+                    "additional_input": 0,
+                    "additional_output": 0,
+                }
+            },
+        ]
+    )
+    if get_events:
+        query_builder.merge_events(foreignField="task_id", force=True)
+        query_builder.deduplicate_tasks_events()
+
+    tasks = await mongo_db["tasks"].aggregate(pipeline).to_list(length=page_size)
+
+    valid_tasks = [Task.model_validate(data) for data in tasks]
+    for task in valid_tasks:
+        # Remove the _id field from the task metadata
+        if task.metadata is not None:
+            task.metadata = filter_nonjsonable_keys(task.metadata)
+
+    next_cursor = None
+    if len(valid_tasks) == page_size:
+        last_task = valid_tasks[-1]
+        next_cursor = encode_tasks_cursor(last_task.created_at, last_task.id)
+
+    return valid_tasks, next_cursor
+
+
+async def fetch_flattened_tasks_rows(
     project_id: str,
     limit: int | None = 1000,
     pagination: Pagination | None = None,
@@ -518,7 +611,7 @@ async def fetch_flattened_tasks(
     keep_removed_events: bool = False,
     sort_get_most_recent: bool = True,
     filters: ProjectDataFilters | None = None,
-) -> list[FlattenedTask]:
+) -> list[dict[str, object]]:
     """
     Get a flattened representation of the tasks of a project for analytics.
 
@@ -536,7 +629,8 @@ async def fetch_flattened_tasks(
     - filters parameter: filters to apply to the tasks.
 
     Returns:
-    - A list of FlattenedTask objects.
+    - A list of rows, with the fields of FlattenedTask and the task_metadata.{key} fields.
+    The rows aren't validated.
     """
 
     if filters is None:
@@ -649,7 +743,6 @@ async def fetch_flattened_tasks(
 
     logger.info(f"Got: {len(flattened_tasks)} results")
 
-    new_flattened_tasks = []
     for task in flattened_tasks:
         # Remove the _id field
         if "_id" in task.keys():
@@ -664,15 +757,116 @@ async def fetch_flattened_tasks(
                     # TODO: Handle nested fields. For now, cast to string
                     task[f"task_metadata.{key}"] = str(value)
             del task["task_metadata"]
-        # Convert to a FlattenedTask model
-        new_task = FlattenedTask.model_validate(task)
-        new_flattened_tasks.append(new_task)
+
+    return flattened_tasks
+
+
+async def fetch_flattened_tasks(
+    project_id: str,
+    limit: int | None = 1000,
+    pagination: Pagination | None = None,
+    with_events: bool = True,
+    with_sessions: bool = True,
+    keep_removed_events: bool = False,
+    sort_get_most_recent: bool = True,
+    filters: ProjectDataFilters | None = None,
+) -> list[FlattenedTask]:
+    """
+    Get a flattened representation of the tasks of a project for analytics, as a list
+    of FlattenedTask objects. See fetch_flattened_tasks_rows for the parameters.
+    """
+    flattened_tasks = await fetch_flattened_tasks_rows(
+        project_id=project_id,
+        limit=limit,
+        pagination=pagination,
+        with_events=with_events,
+        with_sessions=with_sessions,
+        keep_removed_events=keep_removed_events,
+        sort_get_most_recent=sort_get_most_recent,
+        filters=filters,
+    )
+    new_flattened_tasks = [
+        FlattenedTask.model_validate(task) for task in flattened_tasks
+    ]
 
     logger.info(f"Returning: {len(new_flattened_tasks)} unnested results")
 
     return new_flattened_tasks
 
 
+# Types of the columns of the flattened tasks. The task_metadata.{key} columns are
+# inferred from their values.
+FLATTENED_TASK_ARROW_TYPES: dict[str, pa.DataType] = {
+    "task_id": pa.string(),
+    "task_input": pa.string(),
+    "task_output": pa.string(),
+    "task_eval": pa.string(),
+    "task_eval_source": pa.string(),
+    "task_eval_at": pa.int64(),
+    "task_created_at": pa.int64(),
+    "task_position": pa.int64(),
+    "session_id": pa.string(),
+    "session_length": pa.int64(),
+    "event_id": pa.string(),
+    "event_name": pa.string(),
+    "event_created_at": pa.int64(),
+    "event_removal_reason": pa.string(),
+    "event_removed": pa.bool_(),
+    "event_confirmed": pa.bool_(),
+    "event_score_range_value": pa.float64(),
+    "event_score_range_min": pa.float64(),
+    "event_score_range_max": pa.float64(),
+    "event_score_range_score_type": pa.string(),
+    "event_score_range_label": pa.string(),
+    "event_source": pa.string(),
+    "event_categories": pa.list_(pa.string()),
+}
+
+
+def flattened_tasks_to_arrow(flattened_tasks: list[dict[str, object]]) -> pa.Table:
+    """
+    Convert rows of flattened tasks to an Arrow table, built column by column.
+
+    Columns whose values have mixed types (eg. a task_metadata field that is sometimes
+    a str, sometimes an int) are cast to str.
+    """
+    # Keep the columns in the order they first appear
+    columns: dict[str, None] = {}
+    for task in flattened_tasks:
+        for column in task.keys():
+            columns.setdefault(column)
+
+    arrays = []
+    for column in columns:
+        values = [task.get(column) for task in flattened_tasks]
+        try:
+            array = pa.array(values, type=FLATTENED_TASK_ARROW_TYPES.get(column))
+        except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+            array = pa.array(
+                [None if value is None else str(value) for value in values],
+                type=pa.string(),
+            )
+        arrays.append(array)
+    return pa.Table.from_arrays(arrays, names=list(columns))
+
+
+def serialize_arrow_table(
+    table: pa.Table, format: Literal["arrow", "parquet"]
+) -> bytes:
+    """
+    Serialize an Arrow table to the Arrow IPC stream format or to Parquet.
+    """
+    sink = pa.BufferOutputStream()
+    if format == "arrow":
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    elif format == "parquet":
+        pq.write_table(table, sink, compression="zstd")
+    else:
+        raise ValueError(f"Unsupported format: {format}")
+    return sink.getvalue().to_pybytes()
+
+
 async def update_from_flattened_tasks(
     org_id: str,
     project_id: str,
@@ -2,11 +2,15 @@ import datetime
 import re
 import time
 import uuid
+import zlib
 from collections import Counter
+from typing import Callable
 
 import httpx
-import tiktoken
+from fastapi import HTTPException, Request, Response
+from fastapi.routing import APIRoute
 from loguru import logger
+from phospho.utils import count_tokens
 
 
 def get_most_common(items):
@@ -52,11 +56,7 @@ def fits_in_context_window(prompt: str, context_window_size: int) -> bool:
     Check if the prompt fits in the context window
     context_window_size is the number of tokens of the context window
     """
-    encoding = tiktoken.get_encoding("cl100k_base")
-
-    num_tokens = len(encoding.encode(prompt))
-
-    return num_tokens <= context_window_size
+    return count_tokens(prompt) <= context_window_size
 
 
 def get_last_week_timestamps() -> tuple[int, int]:
@@ -126,3 +126,56 @@ def generate_valid_name(key, display_warning=False):
         logger.warning(f"Invalid name '{key}' was sanitized to '{valid_name}'.")
 
     return valid_name
+
+
+class GzipRequest(Request):
+    """
+    Request whose body is transparently decompressed if it was sent
+    with the header `Content-Encoding: gzip` (eg. batches of logs from the phospho SDK)
+    """
+
+    # Larger decompressed bodies are rejected, so that a small request can't exhaust the memory
+    max_decompressed_bytes = 64 * 1024 * 1024
+
+    async def body(self) -> bytes:
+        if not hasattr(self, "_body"):
+            body = await super().body()
+            if "gzip" in self.headers.getlist("Content-Encoding"):
+                # 16 + MAX_WBITS: gzip header and trailer
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                try:
+                    body = decompressor.decompress(
+                        body, self.max_decompressed_bytes + 1
+                    )
+                except zlib.error as e:
+                    raise HTTPException(
+                        status_code=400, detail=f"Invalid gzip request body: {e}"
+                    )
+                if len(body) > self.max_decompressed_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Decompressed request body is larger than {self.max_decompressed_bytes} bytes",
+                    )
+                if not decompressor.eof:
+                    raise HTTPException(
+                        status_code=400,
+                        detail="Invalid gzip request body: truncated data",
+                    )
+            self._body = body
+        return self._body
+
+
+class GzipRoute(APIRoute):
+    """
+    Use this route class in a router to accept gzipped request bodies:
+    `APIRouter(route_class=GzipRoute)`
+    """
+
+    def get_route_handler(self) -> Callable:
+        original_route_handler = super().get_route_handler()
+
+        async def custom_route_handler(request: Request) -> Response:
+            request = GzipRequest(request.scope, request.receive)
+            return await original_route_handler(request)
+
+        return custom_route_handler
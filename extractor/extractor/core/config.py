@@ -45,6 +45,13 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 ### WATCHERS ###
 EVALUATION_SOURCE = "phospho-6"  # If phospho
 FEW_SHOT_MAX_NUMBER_OF_EXAMPLES = 10
+# Number of event detection results saved to the database at once
+EVENT_DETECTION_RESULTS_BATCH_SIZE = 100
+# Number of events detected in the same LLM call (1: one call per event)
+EVENT_DETECTION_LLM_BATCH_SIZE = int(os.getenv("EVENT_DETECTION_LLM_BATCH_SIZE", 1))
+# Directory of the checkpoints of the recipe runs, to resume them if they are
+# interrupted. If None, the recipe runs are not checkpointed.
+RECIPE_CHECKPOINTS_DIR = os.getenv("RECIPE_CHECKPOINTS_DIR")
 
 
 ### SENTRY ###
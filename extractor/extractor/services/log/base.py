@@ -3,7 +3,7 @@ from typing import List, Optional, Union, cast
 from loguru import logger
 from phospho.lab.utils import get_tokenizer, num_tokens_from_messages
 from phospho.models import Task
-from phospho.utils import filter_nonjsonable_keys, is_jsonable
+from phospho.utils import count_tokens, filter_nonjsonable_keys, is_jsonable
 
 from extractor.models.log import LogEventForTasks
 from extractor.utils import generate_timestamp
@@ -81,7 +81,10 @@ def get_nb_tokens_prompt_tokens(
     if isinstance(log_event.raw_input, list):
         if all(isinstance(x, str) for x in log_event.raw_input):
             # Handle the case where the input is a list of strings
-            return sum(len(tokenizer.encode(cast(str, x))) for x in log_event.raw_input)
+            return sum(
+                count_tokens(cast(str, x), tokenizer=tokenizer)
+                for x in log_event.raw_input
+            )
         if all(isinstance(x, dict) for x in log_event.raw_input):
             # Assume it's a list of messages
             return num_tokens_from_messages(
@@ -90,7 +93,7 @@ def get_nb_tokens_prompt_tokens(
                 tokenizer=tokenizer,
             )
     # Encode the string input
-    return len(tokenizer.encode(log_event.input))
+    return count_tokens(log_event.input, tokenizer=tokenizer)
 
 
 def get_nb_tokens_completion_tokens(
@@ -129,14 +132,15 @@ def get_nb_tokens_completion_tokens(
             if all(isinstance(x, str) for x in raw_output_nonull):
                 tokenizer = get_tokenizer(model)
                 return sum(
-                    len(tokenizer.encode(cast(str, x))) for x in raw_output_nonull
+                    count_tokens(cast(str, x), tokenizer=tokenizer)
+                    for x in raw_output_nonull
                 )
             # If it's a list of dict, assume it's a list of streamed chunks
             if all(isinstance(x, dict) for x in raw_output_nonull):
                 return len(log_event.raw_output)
         if log_event.output is not None:
             tokenizer = get_tokenizer(model)
-            return len(tokenizer.encode(log_event.output))
+            return count_tokens(log_event.output, tokenizer=tokenizer)
     except Exception as e:
         logger.error(
             f"Error in get_nb_tokens_completion_tokens with model: {model}, {e}"
@@ -1,4 +1,6 @@
 import asyncio
+import hashlib
+import os
 import time
 import traceback
 from collections import defaultdict
@@ -21,6 +23,7 @@ from phospho.models import (
     Task,
 )
 
+from extractor.core import config
 from extractor.db.mongo import get_mongo_db
 from extractor.models import RoleContentMessage
 from extractor.services.data import fetch_previous_tasks
@@ -313,10 +316,17 @@ class MainPipeline:
             )
 
     async def run_events(
-        self, recipe: Optional[Recipe] = None
+        self,
+        recipe: Optional[Recipe] = None,
+        checkpoint_path: Optional[str] = None,
     ) -> Dict[str, List[Event]]:
         """
         Run the main event detection pipeline on the messages
+
+        :param checkpoint_path: Path of a SQLite file where the results saved in the
+            database are checkpointed. If the run is interrupted, running it again with
+            the same checkpoint_path skips the results already saved. The file is deleted
+            once the run completes.
         """
         if self.project is None:
             self.project = await get_project_by_id(self.project_id)
@@ -334,110 +344,149 @@ class MainPipeline:
             self.workload.org_id = recipe.org_id
             self.workload.project_id = recipe.project_id
         else:
-            self.workload = lab.Workload.from_phospho_project_config(self.project)
+            self.workload = lab.Workload.from_phospho_project_config(
+                self.project, batch_size=config.EVENT_DETECTION_LLM_BATCH_SIZE
+            )
         logger.info(
             f"Running event detection pipeline for project {self.project_id} on {len(self.messages)} messages with {len(self.workload.jobs)} jobs"
         )
-        # Run
-        await self.workload.async_run(
-            messages=self.messages, executor_type="parallel_jobs"
-        )
-
-        if self.workload.results is None or self.workload.jobs is None:
-            logger.error("Worlkload.results is None")
+        if self.workload.jobs is None:
+            logger.error("Workload.jobs is None")
             return {}
+        if checkpoint_path is not None:
+            # Only committed once the results are saved in the database
+            self.workload.checkpoint_store = lab.SQLiteCheckpointStore(
+                checkpoint_path, autocommit=False
+            )
 
+        messages_by_id = {message.id: message for message in self.messages}
         events_per_task_to_return: Dict[str, List[Event]] = defaultdict(list)
         events_to_push_to_db: List[dict] = []
         job_results_to_push_to_db: List[dict] = []
         llm_calls_to_push_to_db: List[dict] = []
+        # (message_id, job_id) of the results to save
+        checkpoint_keys_to_save: List[Tuple[str, str]] = []
 
-        # Iter over the results
-        for message in self.messages:
-            results = self.workload.results.get(message.id, {})
-            for event_name, result in results.items():
-                # event_name is the primary key of the table
-                # Get back the event definition from the job metadata
-                event_definition = EventDefinition.model_validate(
-                    self.workload.jobs[result.job_id].metadata
-                )
-                task = message.metadata.get("task", None)
+        async def save_results() -> None:
+            """Save the detected events and jobs results in the database"""
+            mongo_db = await get_mongo_db()
+            # Copy the buffers: other jobs complete while the database is awaited
+            events = events_to_push_to_db.copy()
+            llm_calls = llm_calls_to_push_to_db.copy()
+            job_results = job_results_to_push_to_db.copy()
+            checkpoint_keys = checkpoint_keys_to_save.copy()
+            events_to_push_to_db.clear()
+            llm_calls_to_push_to_db.clear()
+            job_results_to_push_to_db.clear()
+            checkpoint_keys_to_save.clear()
+
+            is_saved = True
+            if len(events) > 0:
                 try:
-                    valid_task = Task.model_validate(task)
-                    task_id = valid_task.id
-                    session_id = valid_task.session_id
+                    await mongo_db["events"].insert_many(events)
                 except Exception as e:
-                    logger.warning(f"Error validating task: {e}")
-                    valid_task = None
-                    task_id = None
-                    session_id = None
-
-                # Store the LLM call in the database
-                llm_call = result.metadata.get("llm_call", None)
-                if llm_call is not None:
-                    llm_call_obj = LlmCall(
-                        **llm_call,
-                        org_id=self.org_id,
-                        project_id=self.project_id,
-                        task_id=task_id,
-                        recipe_id=result.job_metadata.get("recipe_id"),
-                    )
-                    llm_calls_to_push_to_db.append(llm_call_obj.model_dump())
-                else:
-                    logger.warning(f"No LLM call detected for event {event_name}")
-
-                detected_event_data = Event(
-                    event_name=event_name,
-                    # Events detected at the session scope are not linked to a task
-                    task_id=task_id,
-                    session_id=session_id,
-                    project_id=self.project_id,
-                    source=result.metadata.get("evaluation_source", "phospho-unknown"),
-                    webhook=event_definition.webhook,
+                    logger.error(f"Error saving detected events to the database: {e}")
+                    is_saved = False
+            if len(llm_calls) > 0:
+                try:
+                    await mongo_db["llm_calls"].insert_many(llm_calls)
+                except Exception as e:
+                    logger.error(f"Error saving LLM calls to the database: {e}")
+                    is_saved = False
+            if len(job_results) > 0:
+                try:
+                    await mongo_db["job_results"].insert_many(job_results)
+                except Exception as e:
+                    logger.error(f"Error saving job results to the database: {e}")
+                    is_saved = False
+            if self.workload.checkpoint_store is not None and is_saved:
+                # Only the results saved: the jobs that completed since stay pending
+                self.workload.checkpoint_store.commit(checkpoint_keys)
+
+        # Run, and save the results in micro-batches as they are available
+        nb_results_to_save = 0
+        async for message_id, event_name, result in self.workload.astream(
+            messages=self.messages
+        ):
+            message = messages_by_id[message_id]
+            # event_name is the primary key of the table
+            # Get back the event definition from the job metadata
+            event_definition = EventDefinition.model_validate(
+                self.workload.jobs[result.job_id].metadata
+            )
+            task = message.metadata.get("task", None)
+            try:
+                valid_task = Task.model_validate(task)
+                task_id = valid_task.id
+                session_id = valid_task.session_id
+            except Exception as e:
+                logger.warning(f"Error validating task: {e}")
+                valid_task = None
+                task_id = None
+                session_id = None
+
+            # Store the LLM call in the database
+            llm_call = result.metadata.get("llm_call", None)
+            if llm_call is not None:
+                llm_call_obj = LlmCall(
+                    **llm_call,
                     org_id=self.org_id,
-                    event_definition=event_definition,
-                    task=valid_task,
-                    score_range=result.metadata.get("score_range", None),
+                    project_id=self.project_id,
+                    task_id=task_id,
+                    recipe_id=result.job_metadata.get("recipe_id"),
                 )
+                llm_calls_to_push_to_db.append(llm_call_obj.model_dump())
+            elif result.metadata.get("batched_event_names") is None:
+                # Batched events share the LLM call, stored with the first event
+                logger.warning(f"No LLM call detected for event {event_name}")
+
+            detected_event_data = Event(
+                event_name=event_name,
+                # Events detected at the session scope are not linked to a task
+                task_id=task_id,
+                session_id=session_id,
+                project_id=self.project_id,
+                source=result.metadata.get("evaluation_source", "phospho-unknown"),
+                webhook=event_definition.webhook,
+                org_id=self.org_id,
+                event_definition=event_definition,
+                task=valid_task,
+                score_range=result.metadata.get("score_range", None),
+            )
 
-                if result.value:
-                    logger.info(f"Event {event_name} detected for task {task_id}")
-                    if (
-                        event_definition.webhook is not None
-                        and event_definition.webhook != ""
-                    ):
-                        logger.info(f"Webhook url: {event_definition.webhook}")
-                        await trigger_webhook(
-                            url=event_definition.webhook,
-                            json=detected_event_data.model_dump(),
-                            headers=event_definition.webhook_headers,
-                        )
-                    events_to_push_to_db.append(detected_event_data.model_dump())
-
-                events_per_task_to_return[message.id].append(detected_event_data)
-                # Save the prediction
-                result.task_id = task_id
-                if result.job_metadata.get("recipe_id") is None:
-                    logger.error(f"No recipe_id found for event {event_name}.")
-                job_results_to_push_to_db.append(result.model_dump())
-
-        # Save the detected events and jobs results in the database
-        mongo_db = await get_mongo_db()
-        if len(events_to_push_to_db) > 0:
-            try:
-                await mongo_db["events"].insert_many(events_to_push_to_db)
-            except Exception as e:
-                logger.error(f"Error saving detected events to the database: {e}")
-        if len(llm_calls_to_push_to_db) > 0:
-            try:
-                await mongo_db["llm_calls"].insert_many(llm_calls_to_push_to_db)
-            except Exception as e:
-                logger.error(f"Error saving LLM calls to the database: {e}")
-        if len(job_results_to_push_to_db) > 0:
-            try:
-                await mongo_db["job_results"].insert_many(job_results_to_push_to_db)
-            except Exception as e:
-                logger.error(f"Error saving job results to the database: {e}")
+            if result.value:
+                logger.info(f"Event {event_name} detected for task {task_id}")
+                if (
+                    event_definition.webhook is not None
+                    and event_definition.webhook != ""
+                ):
+                    logger.info(f"Webhook url: {event_definition.webhook}")
+                    await trigger_webhook(
+                        url=event_definition.webhook,
+                        json=detected_event_data.model_dump(),
+                        headers=event_definition.webhook_headers,
+                    )
+                events_to_push_to_db.append(detected_event_data.model_dump())
+
+            events_per_task_to_return[message.id].append(detected_event_data)
+            # Save the prediction
+            result.task_id = task_id
+            if result.job_metadata.get("recipe_id") is None:
+                logger.error(f"No recipe_id found for event {event_name}.")
+            job_results_to_push_to_db.append(result.model_dump())
+            checkpoint_keys_to_save.append((message_id, event_name))
+
+            nb_results_to_save += 1
+            if nb_results_to_save >= config.EVENT_DETECTION_RESULTS_BATCH_SIZE:
+                await save_results()
+                nb_results_to_save = 0
+
+        await save_results()
+        if checkpoint_path is not None and self.workload.checkpoint_store is not None:
+            # The run is complete: a new run starts from scratch
+            self.workload.checkpoint_store.close()
+            self.workload.checkpoint_store = None
+            os.remove(checkpoint_path)
 
         return events_per_task_to_return
 
@@ -756,7 +805,16 @@ class MainPipeline:
         await self.set_input(tasks=tasks, tasks_ids=tasks_ids)
 
         if recipe.recipe_type == "event_detection":
-            await self.run_events(recipe=recipe)
+            checkpoint_path = None
+            if config.RECIPE_CHECKPOINTS_DIR is not None:
+                # A retry of the same run (same recipe and tasks) resumes from its checkpoint
+                messages_ids = ",".join(sorted(message.id for message in self.messages))
+                run_hash = hashlib.sha256(messages_ids.encode("utf-8")).hexdigest()[:16]
+                os.makedirs(config.RECIPE_CHECKPOINTS_DIR, exist_ok=True)
+                checkpoint_path = os.path.join(
+                    config.RECIPE_CHECKPOINTS_DIR, f"{recipe.id}_{run_hash}.sqlite"
+                )
+            await self.run_events(recipe=recipe, checkpoint_path=checkpoint_path)
             await self.compute_session_info_pipeline()
         elif recipe.recipe_type == "sentiment_language":
             await self.run_sentiment_and_language()
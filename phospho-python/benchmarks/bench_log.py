@@ -0,0 +1,515 @@
+"""
+Benchmarks of the overhead of logging with the phospho SDK.
+
+Measures the latency and the memory allocated per call of the logging path (phospho.log,
+phospho.wrap, streaming, and the helpers they use), and the end-to-end throughput of the
+logs sent to a local stub of the backend.
+
+```
+python benchmarks/bench_log.py --output results.json
+python benchmarks/bench_log.py --compare results.json --max-regression 0.2
+```
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+import phospho
+from phospho.extractor import extract_data_from_input, extract_data_from_output
+from phospho.log_queue import Event, LogQueue
+from phospho.utils import convert_content_to_loggable_content, filter_nonjsonable_keys
+
+from stub_server import StubServer
+
+try:
+    from openai.types.chat import (
+        ChatCompletion,
+        ChatCompletionChunk,
+        ChatCompletionMessage,
+    )
+    from openai.types.chat.chat_completion import Choice
+    from openai.types.chat.chat_completion_chunk import Choice as ChunkChoice
+    from openai.types.chat.chat_completion_chunk import ChoiceDelta
+    from openai.types.completion_usage import CompletionUsage
+except ImportError:
+    raise ImportError(
+        "Please install the `openai` package to run the benchmarks: `pip install openai`"
+    )
+
+logger = logging.getLogger(__name__)
+
+RESULTS_VERSION = 1
+
+
+# Representative payloads
+
+
+def make_query(nb_messages: int = 6) -> Dict[str, Any]:
+    messages = [{"role": "system", "content": "You are a helpful assistant. " * 10}]
+    for i in range(nb_messages - 1):
+        role = "user" if i % 2 == 0 else "assistant"
+        messages.append(
+            {"role": role, "content": f"Message {i}. " + "Lorem ipsum " * 20}
+        )
+    return {"model": "gpt-4o-mini", "messages": messages, "temperature": 0.7}
+
+
+def make_completion(nb_words: int = 200) -> ChatCompletion:
+    return ChatCompletion(
+        id="chatcmpl-bench",
+        choices=[
+            Choice(
+                finish_reason="stop",
+                index=0,
+                message=ChatCompletionMessage(
+                    content="word " * nb_words, role="assistant"
+                ),
+            )
+        ],
+        created=1700819716,
+        model="gpt-4o-mini",
+        object="chat.completion",
+        usage=CompletionUsage(
+            completion_tokens=nb_words, prompt_tokens=500, total_tokens=nb_words + 500
+        ),
+    )
+
+
+def make_chunks(nb_chunks: int = 100) -> List[ChatCompletionChunk]:
+    chunks = [
+        ChatCompletionChunk(
+            id="chatcmpl-bench",
+            choices=[
+                ChunkChoice(
+                    delta=ChoiceDelta(content="word "), finish_reason=None, index=0
+                )
+            ],
+            created=1700819716,
+            model="gpt-4o-mini",
+            object="chat.completion.chunk",
+        )
+        for _ in range(nb_chunks - 1)
+    ]
+    chunks.append(
+        ChatCompletionChunk(
+            id="chatcmpl-bench",
+            choices=[ChunkChoice(delta=ChoiceDelta(), finish_reason="stop", index=0)],
+            created=1700819716,
+            model="gpt-4o-mini",
+            object="chat.completion.chunk",
+        )
+    )
+    return chunks
+
+
+class FakeStream:
+    """Similar to the openai Stream object"""
+
+    def __init__(self, chunks: List[ChatCompletionChunk]):
+        self._iterator = iter(chunks)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._iterator)
+
+
+# Measurement
+
+
+def measure(
+    name: str,
+    fn: Callable[[], Any],
+    nb_calls: int,
+    items_per_call: int = 1,
+    nb_alloc_samples: int = 50,
+    after: Optional[Callable[[], Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Time nb_calls calls of fn, then measure the peak memory allocated by a call.
+
+    :param items_per_call: Number of items (eg. streamed chunks) processed by a call.
+    :param after: Called after the measurements, eg. to empty the log queue.
+    """
+    for _ in range(min(100, nb_calls)):
+        fn()
+    if after is not None:
+        after()
+
+    timings: List[int] = []
+    gc.collect()
+    for _ in range(nb_calls):
+        start = time.perf_counter_ns()
+        fn()
+        timings.append(time.perf_counter_ns() - start)
+    if after is not None:
+        after()
+
+    tracemalloc.start()
+    alloc_peaks: List[int] = []
+    for _ in range(nb_alloc_samples):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        fn()
+        alloc_peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    tracemalloc.stop()
+    if after is not None:
+        after()
+
+    timings.sort()
+    mean_us = statistics.fmean(timings) / 1_000
+
+    def percentile(p: float) -> float:
+        return timings[min(len(timings) - 1, int(p * len(timings)))] / 1_000
+
+    return {
+        "name": name,
+        "kind": "latency",
+        "nb_calls": nb_calls,
+        "items_per_call": items_per_call,
+        "mean_us": round(mean_us, 3),
+        "p50_us": round(percentile(0.50), 3),
+        "p95_us": round(percentile(0.95), 3),
+        "p99_us": round(percentile(0.99), 3),
+        "mean_us_per_item": round(mean_us / items_per_call, 3),
+        "ops_per_s": round(1e6 / mean_us, 1) if mean_us > 0 else None,
+        "alloc_peak_bytes": int(statistics.median(alloc_peaks)),
+    }
+
+
+def drain_log_queue() -> None:
+    if phospho.log_queue is not None:
+        phospho.log_queue.get_batch()
+        phospho.log_queue.events.clear()
+
+
+# Benchmarks
+
+
+def bench_helpers(nb_calls: int) -> List[Dict[str, Any]]:
+    query = make_query()
+    completion = make_completion()
+    kwargs = {"user_id": "user", "metadata": {"plan": "pro"}, "not_json": object()}
+    event_content = {"task_id": "task", "input": "hello", "output": "world"}
+    log_queue = LogQueue(max_events=100_000)
+
+    def queue_append_get_batch():
+        log_queue.append(Event(id="task", content=event_content))
+        log_queue.get_batch()
+
+    return [
+        measure(
+            "convert_content_to_loggable_content",
+            lambda: convert_content_to_loggable_content(completion),
+            nb_calls,
+        ),
+        measure(
+            "extract_data_from_input",
+            lambda: extract_data_from_input(input=query),
+            nb_calls,
+        ),
+        measure(
+            "extract_data_from_output",
+            lambda: extract_data_from_output(output=completion),
+            nb_calls,
+        ),
+        measure(
+            "filter_nonjsonable_keys",
+            lambda: filter_nonjsonable_keys(kwargs),
+            nb_calls,
+        ),
+        measure("log_queue_append_get_batch", queue_append_get_batch, nb_calls),
+    ]
+
+
+def bench_log(nb_calls: int) -> List[Dict[str, Any]]:
+    query = make_query()
+    completion = make_completion()
+
+    def fake_create(**kwargs) -> ChatCompletion:
+        return completion
+
+    wrapped_create = phospho.wrap(fake_create)
+
+    return [
+        measure(
+            "log_strings",
+            lambda: phospho.log(input="The user input", output="The app output"),
+            nb_calls,
+            after=drain_log_queue,
+        ),
+        measure(
+            "log_openai",
+            lambda: phospho.log(input=query, output=completion),
+            nb_calls,
+            after=drain_log_queue,
+        ),
+        measure(
+            "log_openai_with_metadata",
+            lambda: phospho.log(
+                input=query,
+                output=completion,
+                user_id="user",
+                version_id="v1",
+                metadata={"plan": "pro", "country": "fr"},
+            ),
+            nb_calls,
+            after=drain_log_queue,
+        ),
+        measure(
+            "wrap_openai",
+            lambda: wrapped_create(**query),
+            nb_calls,
+            after=drain_log_queue,
+        ),
+    ]
+
+
+def bench_stream(nb_calls: int, nb_chunks: int) -> List[Dict[str, Any]]:
+    query = make_query()
+    chunks = make_chunks(nb_chunks)
+
+    def stream():
+        response = FakeStream(chunks)
+        phospho.log(input=query, output=response, stream=True)
+        for _ in response:
+            pass
+
+    return [
+        measure(
+            f"stream_{nb_chunks}_chunks",
+            stream,
+            nb_calls,
+            items_per_call=nb_chunks,
+            nb_alloc_samples=10,
+            after=drain_log_queue,
+        )
+    ]
+
+
+def bench_contention(nb_calls: int, nb_threads: int) -> List[Dict[str, Any]]:
+    """Throughput of phospho.log called from several threads at the same time."""
+    query = make_query()
+    completion = make_completion()
+    nb_calls_per_thread = nb_calls // nb_threads
+
+    def worker():
+        for _ in range(nb_calls_per_thread):
+            phospho.log(input=query, output=completion)
+
+    threads = [threading.Thread(target=worker) for _ in range(nb_threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    drain_log_queue()
+
+    return [
+        {
+            "name": f"log_openai_{nb_threads}_threads",
+            "kind": "throughput",
+            "nb_calls": nb_calls_per_thread * nb_threads,
+            "elapsed_s": round(elapsed, 4),
+            "ops_per_s": round(nb_calls_per_thread * nb_threads / elapsed, 1),
+        }
+    ]
+
+
+def bench_end_to_end(
+    server: StubServer, nb_events: int, nb_senders: int, async_mode: bool = False
+) -> Dict[str, Any]:
+    """Log nb_events events and wait until the stub backend received all of them."""
+    query = make_query()
+    completion = make_completion()
+
+    phospho.init(
+        api_key="bench",
+        project_id="bench",
+        base_url=server.base_url,
+        tick=0.05,
+        nb_senders=nb_senders,
+        async_mode=async_mode,
+    )
+    server.reset()
+
+    start = time.perf_counter()
+    if async_mode:
+        import asyncio
+
+        async def log_events():
+            for _ in range(nb_events):
+                phospho.log(input=query, output=completion)
+            await phospho.aflush()
+            while server.nb_events < nb_events:
+                await asyncio.sleep(0.01)
+                await phospho.aflush()
+
+        asyncio.run(log_events())
+        received = True
+    else:
+        for _ in range(nb_events):
+            phospho.log(input=query, output=completion)
+        phospho.flush()
+        received = server.wait_for_events(nb_events)
+    elapsed = time.perf_counter() - start
+    phospho.consumer.stop()
+
+    name = f"end_to_end_{nb_senders}_senders" + ("_async" if async_mode else "")
+    return {
+        "name": name,
+        "kind": "throughput",
+        "nb_calls": nb_events,
+        "elapsed_s": round(elapsed, 4),
+        "ops_per_s": round(nb_events / elapsed, 1),
+        "nb_requests": server.nb_requests,
+        "nb_bytes_sent": server.nb_bytes,
+        "complete": received and server.nb_events >= nb_events,
+    }
+
+
+# Results
+
+
+def get_metadata() -> Dict[str, Any]:
+    try:
+        commit: Optional[str] = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "results_version": RESULTS_VERSION,
+        "phospho_version": phospho.__version__,
+        "python_version": platform.python_version(),
+        "platform": platform.platform(),
+        "git_commit": commit,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def print_results(results: List[Dict[str, Any]]) -> None:
+    print(
+        f"{'benchmark':<40} {'mean (us)':>12} {'p95 (us)':>12} {'ops/s':>12} {'alloc (B)':>12}"
+    )
+    for result in results:
+        print(
+            f"{result['name']:<40} {result.get('mean_us', ''):>12} {result.get('p95_us', ''):>12} "
+            + f"{result.get('ops_per_s', ''):>12} {result.get('alloc_peak_bytes', ''):>12}"
+        )
+
+
+def compare_results(
+    results: List[Dict[str, Any]],
+    baseline_results: List[Dict[str, Any]],
+    max_regression: float,
+) -> List[str]:
+    """
+    Compare the throughput (ops/s) of each benchmark to the baseline.
+
+    :returns: The names of the benchmarks slower than the baseline by more than max_regression.
+    """
+    baseline = {result["name"]: result for result in baseline_results}
+    regressions = []
+    print(f"\n{'benchmark':<40} {'baseline ops/s':>15} {'ops/s':>12} {'change':>8}")
+    for result in results:
+        baseline_result = baseline.get(result["name"])
+        if baseline_result is None or not baseline_result.get("ops_per_s"):
+            continue
+        change = result["ops_per_s"] / baseline_result["ops_per_s"] - 1
+        flag = ""
+        if change < -max_regression:
+            regressions.append(result["name"])
+            flag = " <- regression"
+        print(
+            f"{result['name']:<40} {baseline_result['ops_per_s']:>15} {result['ops_per_s']:>12} "
+            + f"{change:>+8.1%}{flag}"
+        )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--output", help="Write the results to this json file")
+    parser.add_argument("--compare", help="Compare the results to this json file")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=0.2,
+        help="With --compare, exit with an error if a benchmark is slower by this ratio",
+    )
+    parser.add_argument("--quick", action="store_true", help="Run 10x fewer iterations")
+    parser.add_argument(
+        "--stub-latency",
+        type=float,
+        default=0.0,
+        help="Latency of the stub backend for the end-to-end benchmarks (in seconds)",
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.ERROR)
+    scale = 10 if args.quick else 1
+
+    with StubServer(latency=args.stub_latency) as server:
+        # Stop the consumer, so that the latency benchmarks only measure the logging path.
+        # The log queue is emptied between benchmarks so that it doesn't grow.
+        phospho.init(
+            api_key="bench", project_id="bench", base_url=server.base_url, tick=0.01
+        )
+        phospho.consumer.stop()
+        results: List[Dict[str, Any]] = []
+        results += bench_helpers(nb_calls=20_000 // scale)
+        results += bench_log(nb_calls=10_000 // scale)
+        results += bench_stream(nb_calls=200 // scale, nb_chunks=100)
+        results += bench_stream(nb_calls=20 // scale, nb_chunks=1000)
+        results += bench_contention(nb_calls=20_000 // scale, nb_threads=4)
+
+        for nb_senders in [1, 4]:
+            results.append(
+                bench_end_to_end(
+                    server, nb_events=20_000 // scale, nb_senders=nb_senders
+                )
+            )
+        results.append(
+            bench_end_to_end(
+                server, nb_events=20_000 // scale, nb_senders=4, async_mode=True
+            )
+        )
+
+    print_results(results)
+    output = {"metadata": get_metadata(), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline["results"], args.max_regression)
+        if regressions:
+            print(f"\nRegressions: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""
+A local stand-in for the phospho backend, used to benchmark the SDK without network.
+
+It accepts the batches of log events sent by the consumer (gzipped or not) and counts them.
+"""
+
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubServer:
+    """Run the stub backend in a background thread: `with StubServer() as server: ...`"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        """
+        :param port: 0 picks a free port.
+        :param latency: Time to wait before answering each request (in seconds), to
+            simulate a remote backend.
+        """
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.nb_requests = 0
+        self.nb_events = 0
+        self.nb_bytes = 0
+        # Notified every time a batch is received
+        self.received = threading.Condition(self.lock)
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                nb_bytes = len(body)
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                payload = json.loads(body) if body else {}
+                nb_events = len(payload.get("batched_log_events", []))
+                if stub.latency > 0:
+                    threading.Event().wait(stub.latency)
+                with stub.lock:
+                    stub.nb_requests += 1
+                    stub.nb_events += nb_events
+                    stub.nb_bytes += nb_bytes
+                    stub.received.notify_all()
+
+                response = json.dumps({"logged_events": []}).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def log_message(self, format, *args):
+                # Keep the benchmark output clean
+                pass
+
+        return Handler
+
+    def wait_for_events(self, nb_events: int, timeout: float = 60.0) -> bool:
+        """Wait until at least nb_events log events were received."""
+        with self.lock:
+            return self.received.wait_for(
+                lambda: self.nb_events >= nb_events, timeout=timeout
+            )
+
+    def reset(self) -> None:
+        with self.lock:
+            self.nb_requests = 0
+            self.nb_events = 0
+            self.nb_bytes = 0
+
+    def start(self) -> "StubServer":
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> "StubServer":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
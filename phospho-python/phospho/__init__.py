@@ -1,9 +1,13 @@
+import asyncio
+import importlib
 import inspect
 import logging
+import os
 from contextlib import contextmanager
 from copy import deepcopy
 from functools import wraps
 from typing import (
+    TYPE_CHECKING,
     Any,
     AsyncGenerator,
     AsyncIterable,
@@ -23,6 +27,8 @@ import pydantic
 from . import config, integrations, models, utils
 from ._version import __version__ as __version__
 from .client import Client as Client
+from .consumer import AsyncConsumer as AsyncConsumer
+from .consumer import BatchStats as BatchStats
 from .consumer import Consumer as Consumer
 from .extractor import (
     RawDataType,
@@ -30,9 +36,10 @@ from .extractor import (
     extract_data_from_output,
     extract_metadata_from_input_output,
 )
-from .log_queue import Event, LogQueue
+from .log_queue import Event, LogQueue, OverflowPolicy
+from .sampling import Sampler
+from .spill import DiskSpill
 from .tasks import TaskEntity
-from .testing import PhosphoTest
 from .utils import (
     MutableAsyncGenerator,
     MutableGenerator,
@@ -42,16 +49,39 @@ from .utils import (
     generate_uuid,
     generate_version_id,
     is_jsonable,
+    json_dumps,
+    sanitize_content,
 )
 
-try:
-    from . import lab
-except ImportError:
-    pass
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from . import lab as lab
+    from .testing import PhosphoTest as PhosphoTest
+
+# Imported on first use, to keep `import phospho` fast: phospho.lab and phospho.testing
+# import the LLM clients, and phospho.tracing imports OpenTelemetry.
+_LAZY_SUBMODULES = ["lab", "testing", "tracing"]
+_LAZY_ATTRIBUTES = {"PhosphoTest": "testing"}
+
+
+def __getattr__(name: str) -> Any:
+    if name in _LAZY_SUBMODULES:
+        return importlib.import_module(f".{name}", __name__)
+    if name in _LAZY_ATTRIBUTES:
+        module = importlib.import_module(f".{_LAZY_ATTRIBUTES[name]}", __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> List[str]:
+    return sorted(list(globals().keys()) + _LAZY_SUBMODULES + list(_LAZY_ATTRIBUTES))
+
 
 client = None
 log_queue = None
 consumer = None
+sampler: Optional[Sampler] = None
 
 latest_task_id: Optional[str] = None
 latest_session_id: Optional[str] = None
@@ -75,6 +105,19 @@ def init(
     tick: float = 0.5,
     raise_error_on_fail_to_send: bool = False,
     version_id: Optional[str] = None,
+    max_queue_size: Optional[int] = 100_000,
+    max_queue_bytes: Optional[int] = None,
+    overflow_policy: OverflowPolicy = "drop_oldest",
+    overflow_block_timeout: float = 1.0,
+    async_mode: bool = False,
+    async_http_client: Optional[Any] = None,
+    spill_dir: Optional[str] = None,
+    max_batch_size: Optional[int] = config.MAX_BATCH_SIZE,
+    max_batch_bytes: Optional[int] = config.MAX_BATCH_BYTES,
+    nb_senders: int = 1,
+    stats_hook: Optional[Callable[[BatchStats], None]] = None,
+    sample_rate: float = 1.0,
+    max_events_per_second: Optional[float] = None,
 ) -> None:
     """
     Initialize the phospho logging module.
@@ -88,6 +131,39 @@ def init(
     :param raise_error_on_fail_to_send: whether to raise an error if the consumer fails to send logs
     :param version_id: the version of the code that generated the logs. If None, the version_id
         will be set to the current date.
+    :param max_queue_size: the maximum number of log events kept in memory while waiting to be
+        sent. If None, the queue is unbounded.
+    :param max_queue_bytes: the maximum total size (in bytes, serialized as json) of the log events
+        kept in memory. If None, the size is unbounded.
+    :param overflow_policy: what to do when the queue is full: "drop_oldest", "drop_newest",
+        "block" (wait up to `overflow_block_timeout` seconds, then drop) or "sample". Dropped
+        events are counted in `phospho.nb_dropped_events()`.
+    :param overflow_block_timeout: how long `phospho.log` waits for room in the queue with the
+        "block" policy (in seconds)
+    :param async_mode: if True, logs are sent from an asyncio task running in your event loop
+        instead of a background thread, using non-blocking HTTP calls (requires `httpx`).
+        Use `await phospho.aflush()` to flush the logs.
+    :param async_http_client: in async mode, an `httpx.AsyncClient` used to send the logs, to
+        share the connection pool of your app. If None, one is created.
+    :param spill_dir: a directory where log events are written when the queue is full or when
+        they couldn't be sent, instead of being dropped or kept in memory. They are sent again
+        by the consumer, including after a restart of the process. If None, nothing is written
+        to disk.
+    :param max_batch_size: the maximum number of log events sent to phospho in one request.
+    :param max_batch_bytes: the maximum size of the log events sent to phospho in one request
+        (in bytes, serialized as json). Bigger batches are split into several requests.
+    :param nb_senders: how many requests are sent in parallel when a batch is split, eg. to
+        catch up after an outage.
+    :param stats_hook: a function called with the `phospho.BatchStats` (number of events,
+        bytes, latency, error) of every request sent to phospho.
+    :param sample_rate: the fraction of sessions that are logged, between 0 and 1. The
+        decision is a hash of the session_id, so a session is either fully logged or not
+        at all, even across processes. Tasks that aren't logged are not processed.
+    :param max_events_per_second: if set, the maximum number of tasks logged per second
+        (on average, with bursts of one second). Tasks over the limit are not logged.
+        When sampling or rate limiting, the `sample_rate` and the number of tasks dropped
+        by the rate limit (`nb_rate_limited_events`) are added to the metadata of the
+        logged tasks, to extrapolate the total number of tasks.
 
     """
 
@@ -98,6 +174,7 @@ def init(
     global client
     global log_queue
     global consumer
+    global sampler
     global default_version_id
     global session_id_override
     global task_id_override
@@ -107,17 +184,54 @@ def init(
         version_id = generate_version_id()
 
     default_version_id = version_id
-    client = Client(api_key=api_key, project_id=project_id, base_url=base_url)
-    log_queue = LogQueue()
-    consumer = Consumer(
-        log_queue=log_queue,
-        client=client,
-        tick=tick,
-        raise_error_on_fail_to_send=raise_error_on_fail_to_send,
+    client = Client(
+        api_key=api_key,
+        project_id=project_id,
+        base_url=base_url,
+        async_http_client=async_http_client,
     )
-    # Start the consumer on a separate thread (this will periodically send logs to backend)
+    log_queue = LogQueue(
+        max_events=max_queue_size,
+        max_bytes=max_queue_bytes,
+        overflow_policy=overflow_policy,
+        block_timeout=overflow_block_timeout,
+        spill=DiskSpill(spill_dir) if spill_dir is not None else None,
+    )
+    if async_mode:
+        # The consumer is a task in the running event loop. If there is no running loop yet,
+        # it's started by the first call to phospho.log made inside a loop.
+        consumer = AsyncConsumer(
+            log_queue=log_queue,
+            client=client,
+            tick=tick,
+            raise_error_on_fail_to_send=raise_error_on_fail_to_send,
+            max_batch_size=max_batch_size,
+            max_batch_bytes=max_batch_bytes,
+            nb_senders=nb_senders,
+            stats_hook=stats_hook,
+        )
+    else:
+        # The consumer runs on a separate thread
+        consumer = Consumer(
+            log_queue=log_queue,
+            client=client,
+            tick=tick,
+            raise_error_on_fail_to_send=raise_error_on_fail_to_send,
+            max_batch_size=max_batch_size,
+            max_batch_bytes=max_batch_bytes,
+            nb_senders=nb_senders,
+            stats_hook=stats_hook,
+        )
+    # Start the consumer (this will periodically send logs to backend)
     consumer.start()
 
+    if sample_rate < 1 or max_events_per_second is not None:
+        sampler = Sampler(
+            sample_rate=sample_rate, max_events_per_second=max_events_per_second
+        )
+    else:
+        sampler = None
+
     # Reset the task_id and session_id
     session_id_override = None
     task_id_override = None
@@ -134,6 +248,29 @@ def init(
         tracing_initialized = True
 
 
+def _reinit_after_fork() -> None:
+    """
+    Called in the child process after a fork, eg. in gunicorn or Celery prefork workers.
+
+    The child inherits the state of phospho.init, but not the consumer thread, and the
+    locks may have been held by threads of the parent. The locks and connections are
+    replaced, and the consumer is started again by the first call to phospho.log.
+    """
+    if client is not None:
+        client._reinit_after_fork()
+    if log_queue is not None:
+        log_queue._reinit_after_fork()
+    if consumer is not None:
+        consumer._reinit_after_fork()
+    if sampler is not None:
+        sampler._reinit_after_fork()
+
+
+# Not available on Windows, which doesn't fork
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reinit_after_fork)
+
+
 def new_session() -> str:
     """
     Sessions are used to group tasks and logs together.
@@ -196,6 +333,7 @@ def _log_single_event(
     """
     global client
     global log_queue
+    global consumer
     global latest_task_id
     global latest_session_id
     global default_version_id
@@ -203,15 +341,37 @@ def _log_single_event(
     global session_id_override
     global metadata_override
     global tracing_initialized
+    global sampler
 
     if "version_id" not in kwargs or kwargs["version_id"] is None:
         kwargs["version_id"] = default_version_id
 
+    # Task: use the task_id parameter, the task_id infered from inputs, or generate one
+    if task_id_override is not None:
+        task_id = task_id_override
+    if task_id is None:
+        task_id = generate_uuid("task_")
+
+    # Session: if None, generate a default session_id
+    if session_id_override is not None:
+        session_id = session_id_override
+    if session_id is None:
+        session_id = generate_uuid("session_")
+
+    # Sampling: the decision is taken before any processing of the content
+    sampling_metadata: Dict[str, object] = {}
+    if sampler is not None:
+        sampling_decision = sampler.sample(task_id=task_id, session_id=session_id)
+        if sampling_decision is None:
+            return {"task_id": task_id, "session_id": session_id}
+        sampling_metadata = sampling_decision
+
     input = convert_content_to_loggable_content(input)
     output = convert_content_to_loggable_content(output)
     raw_input = convert_content_to_loggable_content(raw_input)
     raw_output = convert_content_to_loggable_content(raw_output)
-    kwargs = convert_content_to_loggable_content(kwargs)
+    # Once converted, kwargs is only not json serializable if a nested dict has invalid keys
+    kwargs, kwargs_are_jsonable = sanitize_content(kwargs)
 
     assert (
         (log_queue is not None) and (client is not None)
@@ -240,18 +400,6 @@ def _log_single_event(
         input_output_to_usage_function=input_output_to_usage_function,
     )
 
-    # Task: use the task_id parameter, the task_id infered from inputs, or generate one
-    if task_id_override is not None:
-        task_id = task_id_override
-    if task_id is None:
-        task_id = generate_uuid("task_")
-
-    # Session: if None, generate a default session_id
-    if session_id_override is not None:
-        session_id = session_id_override
-    if session_id is None:
-        session_id = generate_uuid("session_")
-
     # Metadata override
     local_metadata_override = metadata_override
     if local_metadata_override is None:
@@ -262,10 +410,12 @@ def _log_single_event(
     latest_session_id = session_id
 
     # Every other kwargs will be directly stored in the logs, if it's json serializable
-    if kwargs:
-        kwargs_to_log = filter_nonjsonable_keys(kwargs)
-    else:
+    if not kwargs:
         kwargs_to_log = {}
+    elif kwargs_are_jsonable:
+        kwargs_to_log = kwargs
+    else:
+        kwargs_to_log = filter_nonjsonable_keys(kwargs)
 
     # The log event looks like this:
     log_content: Dict[str, object] = {
@@ -284,6 +434,7 @@ def _log_single_event(
         "raw_output_type_name": type(output).__name__,
         # other
         **metadata_to_log,
+        **sampling_metadata,
         **kwargs_to_log,
         **local_metadata_override,
     }
@@ -294,40 +445,47 @@ def _log_single_event(
     if task_id in log_queue.events.keys():
         # If the task_id already exists in log_queue, update the existing event content
         # Update the dict inplace
-        existing_log_content = log_queue.events[task_id].content
-
-        # Concatenate the log event output strings, unless if everything is None
-        if existing_log_content["output"] is None and log_content["output"] is None:
-            fused_output = None
-        else:
+        existing_event = log_queue.events[task_id]
+        existing_log_content = existing_event.content
+        # Size of what is added to the event, to update the size of the log_queue
+        nb_added_bytes = 0
+
+        # Concatenate the log event output strings, unless if everything is None.
+        # The chunks are accumulated in the event and only joined when it's materialized,
+        # so that logging a chunk doesn't copy the whole output.
+        new_output = log_content.pop("output")
+        if existing_event.output_parts is None and (
+            existing_log_content["output"] is not None or new_output is not None
+        ):
             if existing_log_content["output"] is None:
                 existing_log_content["output"] = ""
-            if log_content["output"] is None:
-                log_content["output"] = ""
-            fused_output = str(existing_log_content["output"]) + str(
-                log_content["output"]
-            )
-        # Concatenate the raw_outputs to keep all the intermediate results to openai
-        if (
-            existing_log_content["raw_output"] is None
-            and log_content["raw_output"] is None
+            existing_event.output_parts = [str(existing_log_content["output"])]
+        if existing_event.output_parts is not None and new_output is not None:
+            existing_event.output_parts.append(str(new_output))
+            if log_queue.max_bytes is not None:
+                # Same measure as the log_queue: the utf-8 json, without the quotes
+                nb_added_bytes += len(json_dumps(existing_event.output_parts[-1])) - 2
+        # Concatenate the raw_outputs to keep all the intermediate results to openai.
+        # The list of raw_outputs belongs to the event and is extended inplace.
+        new_raw_output = log_content.pop("raw_output")
+        if existing_event.raw_output_parts is None and (
+            existing_log_content["raw_output"] is not None or new_raw_output is not None
         ):
-            fused_raw_output = None
-        else:
-            if existing_log_content["raw_output"] is None:
-                existing_log_content["raw_output"] = []
-            if log_content["raw_output"] is None:
-                log_content["raw_output"] = []
+            existing_raw_output = existing_log_content["raw_output"]
+            if existing_raw_output is None:
+                existing_raw_output = []
             # Convert to list if not already
-            if not isinstance(existing_log_content["raw_output"], list):
-                existing_log_content["raw_output"] = [
-                    existing_log_content["raw_output"]
-                ]
-            if not isinstance(log_content["raw_output"], list):
-                log_content["raw_output"] = [log_content["raw_output"]]
-            fused_raw_output = (
-                existing_log_content["raw_output"] + log_content["raw_output"]
-            )
+            if not isinstance(existing_raw_output, list):
+                existing_raw_output = [existing_raw_output]
+            existing_event.raw_output_parts = list(existing_raw_output)
+            existing_log_content["raw_output"] = existing_event.raw_output_parts
+        if existing_event.raw_output_parts is not None and new_raw_output is not None:
+            if isinstance(new_raw_output, list):
+                existing_event.raw_output_parts.extend(new_raw_output)
+            else:
+                existing_event.raw_output_parts.append(new_raw_output)
+            if log_queue.max_bytes is not None:
+                nb_added_bytes += len(json_dumps(new_raw_output))
         # For usage metrics in metadata, apply heuristics
         fused_completion_tokens: Optional[int] = None
         if "completion_tokens" in log_content:
@@ -344,37 +502,35 @@ def _log_single_event(
             # Keep a trace of the latest timestamp. This will help computing streaming time
             "client_created_at": existing_log_content["client_created_at"],
             "last_update": log_content["client_created_at"],
-            # Concatenate the log event output strings
-            "output": fused_output,
-            "raw_output": fused_raw_output,
         }
         if fused_completion_tokens is not None:
             fused_log_content["completion_tokens"] = fused_completion_tokens
         if fused_total_tokens is not None:
             fused_log_content["total_tokens"] = fused_total_tokens
-        # TODO : Turn this bool into a parametrizable list
-        if concatenate_raw_outputs_if_task_id_exists:
-            log_content.pop("raw_output")
         existing_log_content.update(log_content)
         # Update the dict inplace
         existing_log_content.update(fused_log_content)
-        log_content = existing_log_content
         # Update the to_log status of event
-        log_queue.events[task_id].to_log = to_log
+        existing_event.to_log = to_log
+        log_queue.resize(task_id, nb_added_bytes=nb_added_bytes)
+        if to_log:
+            # The event is complete: join the output chunks once
+            existing_event.materialize()
+        log_content = existing_log_content
     else:
         # Append event to log_queue
         log_queue.append(event=Event(id=task_id, content=log_content, to_log=to_log))
 
+    # Start the consumer if needed: with async_mode, or in a forked child process
+    if consumer is not None:
+        consumer.ensure_started()
+
     if steps is not None and len(steps) > 0:
         # Manual intermediate calls tracing
-        from opentelemetry.sdk.trace import TracerProvider
-
-        from .tracing import get_batch_span_processor
+        from .tracing import get_steps_tracer
 
-        # Create a new tracer, with a simple batch span processor.
-        tracer_provider = TracerProvider()
-        tracer_provider.add_span_processor(get_batch_span_processor(client))
-        tracer = tracer_provider.get_tracer("phospho.log")
+        # The tracer and its batch span processor are reused across calls
+        tracer = get_steps_tracer(client)
 
         # Add spans for intermediate logs
         context_name = f"{task_id}_intermediate"
@@ -400,14 +556,10 @@ def _log_single_event(
         # In the backend, this will be interpreted as: all previous spans have this task_id,
         # session_id, and metadata
 
-        from opentelemetry.sdk.trace import TracerProvider
+        from .tracing import get_tracer
 
-        from .tracing import get_global_batch_span_processor
-
-        # Create a new tracer, with a simple batch span processor.
-        tracer_provider = TracerProvider()
-        tracer_provider.add_span_processor(get_global_batch_span_processor(client))
-        tracer = tracer_provider.get_tracer("phospho.log")
+        # The tracer and its global batch span processor are reused across calls
+        tracer = get_tracer(client)
 
         # Create a new span with the task_id, session_id, and metadata
         with tracer.start_as_current_span(
@@ -981,6 +1133,18 @@ def user_feedback(
         return None
 
 
+def nb_dropped_events() -> int:
+    """
+    Number of log events dropped because the log_queue was full.
+    See the `max_queue_size`, `max_queue_bytes` and `overflow_policy` parameters of `phospho.init`.
+    """
+    global log_queue
+
+    if log_queue is None:
+        return 0
+    return log_queue.nb_dropped_events
+
+
 def flush() -> None:
     """
     Flush the log_queue. This will send all the logs to phospho.
@@ -1004,6 +1168,26 @@ def flush() -> None:
             batch_span_processor.force_flush()
 
 
+async def aflush() -> None:
+    """
+    Flush the log_queue without blocking the event loop. This will send all the logs to phospho.
+
+    Use it with `phospho.init(async_mode=True)`. Otherwise, the logs are flushed in a thread.
+    """
+    global consumer
+
+    if isinstance(consumer, AsyncConsumer):
+        await consumer.asend_batch()
+        if tracing_initialized:
+            from .tracing import batch_span_processor, global_batch_span_processor
+
+            for processor in [global_batch_span_processor, batch_span_processor]:
+                if processor:
+                    await asyncio.to_thread(processor.force_flush)
+    else:
+        await asyncio.to_thread(flush)
+
+
 @contextmanager
 def tracer(
     task_id: Optional[str] = None,
@@ -1044,9 +1228,11 @@ def tracer(
             "To use tracing, you need to call phospho.init(tracing=True) first"
         )
 
-    from .tracing import get_global_batch_span_processor
+    from opentelemetry import context as otel_context
 
-    global_batch_span_processor = get_global_batch_span_processor(client)
+    from .tracing import get_global_batch_span_processor, set_phospho_attributes
+
+    get_global_batch_span_processor(client)
 
     # Override the task_id and session_id that will be used in phospho.log
     if task_id:
@@ -1063,22 +1249,25 @@ def tracer(
         metadata_override = metadata
 
     context_name = generate_uuid("local_context")
-    # Override the task_id and session_id in the global span processor
-    global_batch_span_processor.task_id = task_id_override
-    global_batch_span_processor.session_id = session_id_override
-    global_batch_span_processor.metadata = metadata_override
+    # Add the task_id and session_id to the spans started in this context
+    token = otel_context.attach(
+        set_phospho_attributes(
+            task_id=task_id_override,
+            session_id=session_id_override,
+            metadata=metadata_override,
+        )
+    )
 
     # Execute the block of code
-    yield context_name
+    try:
+        yield context_name
+    finally:
+        otel_context.detach(token)
 
     # Clean up default task_id and session_id
     task_id_override = None
     session_id_override = None
     metadata_override = None
-    # Clean up the global span processor
-    global_batch_span_processor.task_id = None
-    global_batch_span_processor.session_id = None
-    global_batch_span_processor.metadata = None
 
 
 # Do the same but with  a decorator
@@ -1130,42 +1319,64 @@ def trace(
 
 ### Requires phospho lab extras ###
 
-try:
-    import pandas as pd
 
-    def tasks_df(
-        limit: int = 1000,
-        with_events: bool = True,
-        with_sessions: bool = True,
-        with_removed_events: bool = False,
-    ) -> pd.DataFrame:
-        """
-        Get the tasks of a project in a pandas DataFrame.
-
-        The granularity of the DataFrame can be set to include events and/or sessions.
-
-        If `with_events=True`, the DataFrame will have one row per (task, event).
-        If `with_events=False`, the DataFrame will have one row per task.
-
-        If `with_sessions=True`, the DataFrame will have one row per task, with session information.
-        If `with_sessions=False`, the DataFrame will have one row per task, without session information.
-
-        If `with_removed_events=True`, the DataFrame will include removed events ; only possible if `with_events=True`.
-        If `with_removed_events=False`, the DataFrame will not include removed events.
-
-        :param limit: The maximum number of tasks to return.
-        :param with_events: Whether to include events in the DataFrame. If True, the
-            DataFrame will have one row per (task, event). If False, the DataFrame will
-            have one row per task.
-        :param with_sessions: Whether to include sessions in the DataFrame.
-        """
-        global client
-        if client is None:
-            raise ValueError("Call phospho.init() before calling phospho.tasks_df()")
-
-        # Call the client
-        # TODO : Pagination when too many tasks
-        # TODO : Other formats than pandas
+def _import_pandas(function_name: str):
+    # pandas is slow to import, so it is only imported when needed
+    try:
+        import pandas as pd
+    except ImportError:
+        raise ImportError(
+            f"{function_name} requires the pandas library. Install it with `pip install pandas`."
+        )
+    return pd
+
+
+def tasks_df(
+    limit: int = 1000,
+    with_events: bool = True,
+    with_sessions: bool = True,
+    with_removed_events: bool = False,
+    format: Literal["json", "arrow"] = "json",
+) -> "pd.DataFrame":
+    """
+    Get the tasks of a project in a pandas DataFrame.
+
+    The granularity of the DataFrame can be set to include events and/or sessions.
+
+    If `with_events=True`, the DataFrame will have one row per (task, event).
+    If `with_events=False`, the DataFrame will have one row per task.
+
+    If `with_sessions=True`, the DataFrame will have one row per task, with session information.
+    If `with_sessions=False`, the DataFrame will have one row per task, without session information.
+
+    If `with_removed_events=True`, the DataFrame will include removed events ; only possible if `with_events=True`.
+    If `with_removed_events=False`, the DataFrame will not include removed events.
+
+    :param limit: The maximum number of tasks to return.
+    :param with_events: Whether to include events in the DataFrame. If True, the
+        DataFrame will have one row per (task, event). If False, the DataFrame will
+        have one row per task.
+    :param with_sessions: Whether to include sessions in the DataFrame.
+    :param format: How the tasks are transported. "arrow" is faster and uses less
+        memory for large projects, but requires `pip install pyarrow`.
+    """
+    pd = _import_pandas("phospho.tasks_df()")
+
+    global client
+    if client is None:
+        raise ValueError("Call phospho.init() before calling phospho.tasks_df()")
+
+    # Call the client
+    # TODO : Pagination when too many tasks
+    if format == "arrow":
+        tasks_df = client.tasks_flat(
+            limit=limit,
+            with_events=with_events,
+            with_sessions=with_sessions,
+            with_removed_events=with_removed_events,
+            format="arrow",
+        ).to_pandas()
+    else:
         flattened_tasks = client.tasks_flat(
             limit=limit,
             with_events=with_events,
@@ -1174,85 +1385,67 @@ try:
         ).get("flattened_tasks", [])
         tasks_df = pd.DataFrame(flattened_tasks)
 
-        # Convert timestamps to datetime
-        for col in [
-            "task_created_at",
-            "task_eval_at",
-            "event_created_at",
-        ]:
-            if col in tasks_df.columns:
-                tasks_df[col] = pd.to_datetime(tasks_df[col], unit="s")
-
-        if not with_events:
-            # Drop columns starting with "event_"
-            tasks_df = tasks_df.loc[:, ~tasks_df.columns.str.startswith("event_")]
-
-        if not with_sessions:
-            # Drop columns starting with "session_"
-            tasks_df = tasks_df.loc[:, ~tasks_df.columns.str.startswith("session_")]
-
-        return tasks_df
-
-    def push_tasks_df(tasks_df: pd.DataFrame) -> None:
-        """
-        Update the tasks of a project from a pandas DataFrame. Warning! This will overwrite the tasks.
-
-        The format of the input DataFrame must be the same as the one returned by `phospho.tasks_df()`.
-
-        Supported columns:
-        - task_id
-        - task_metadata
-        - task_eval
-        - task_eval_source
-        - task_eval_at
-
-        To update only some fields, send a dataframe with only the fields to update.
-
-        Example: The following will label the first 3 tasks as "success".
-
-        ```
-        tasks_df = phospho.tasks_df().head(3)
-        tasks_df["task_eval"] = "success"
-        phospho.push_tasks_df(tasks_df[["task_id", "task_eval"]])
-        ```
-        """
-        global client
-        if client is None:
-            raise ValueError(
-                "Call phospho.init() before calling phospho.push_tasks_df()"
-            )
+    # Convert timestamps to datetime
+    for col in [
+        "task_created_at",
+        "task_eval_at",
+        "event_created_at",
+    ]:
+        if col in tasks_df.columns:
+            tasks_df[col] = pd.to_datetime(tasks_df[col], unit="s")
 
-        formatted_tasks_df = tasks_df
-
-        # Convert date to timestamp
-        for col in [
-            "task_created_at",
-            "task_eval_at",
-            "event_created_at",
-        ]:
-            if col in formatted_tasks_df.columns:
-                formatted_tasks_df[col] = formatted_tasks_df[col].astype(int) / 10**9
-
-        # TODO : split the dataframe in chunks if too big
-        flat_tasks_dict = formatted_tasks_df.to_dict(orient="records")
-        flattened_tasks = [
-            models.FlattenedTask.model_validate(task) for task in flat_tasks_dict
-        ]
-        client.update_tasks_flat(flattened_tasks)
+    if not with_events:
+        # Drop columns starting with "event_"
+        tasks_df = tasks_df.loc[:, ~tasks_df.columns.str.startswith("event_")]
 
-except ImportError:
+    if not with_sessions:
+        # Drop columns starting with "session_"
+        tasks_df = tasks_df.loc[:, ~tasks_df.columns.str.startswith("session_")]
 
-    def tasks_df(
-        limit: int = 1000,
-        with_events: bool = True,
-        with_sessions: bool = True,
-        with_removed_events: bool = False,
-    ) -> None:
-        raise ImportError(
-            "phospho.tasks_df() requires the pandas library. Install it with `pip install pandas`."
-        )
+    return tasks_df
 
-    def push_tasks_df(tasks_df) -> None:
-        raise ImportError(
-            "phospho.push_tasks_df() requires the pandas library. Install it with `pip install pandas`."
-        )
+
+def push_tasks_df(tasks_df: "pd.DataFrame") -> None:
+    """
+    Update the tasks of a project from a pandas DataFrame. Warning! This will overwrite the tasks.
+
+    The format of the input DataFrame must be the same as the one returned by `phospho.tasks_df()`.
+
+    Supported columns:
+    - task_id
+    - task_metadata
+    - task_eval
+    - task_eval_source
+    - task_eval_at
+
+    To update only some fields, send a dataframe with only the fields to update.
+
+    Example: The following will label the first 3 tasks as "success".
+
+    ```
+    tasks_df = phospho.tasks_df().head(3)
+    tasks_df["task_eval"] = "success"
+    phospho.push_tasks_df(tasks_df[["task_id", "task_eval"]])
+    ```
+    """
+    global client
+    if client is None:
+        raise ValueError("Call phospho.init() before calling phospho.push_tasks_df()")
+
+    formatted_tasks_df = tasks_df
+
+    # Convert date to timestamp
+    for col in [
+        "task_created_at",
+        "task_eval_at",
+        "event_created_at",
+    ]:
+        if col in formatted_tasks_df.columns:
+            formatted_tasks_df[col] = formatted_tasks_df[col].astype(int) / 10**9
+
+    # TODO : split the dataframe in chunks if too big
+    flat_tasks_dict = formatted_tasks_df.to_dict(orient="records")
+    flattened_tasks = [
+        models.FlattenedTask.model_validate(task) for task in flat_tasks_dict
+    ]
+    client.update_tasks_flat(flattened_tasks)
@@ -2,11 +2,14 @@
 phospho client to interact with the phospho API
 """
 
+import asyncio
+import gzip
 import logging
 import os
-from typing import Dict, List, Literal, Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Literal, Optional, Tuple, Union
 
 import requests
+from requests.adapters import HTTPAdapter
 
 import phospho.config as config
 from phospho.models import (
@@ -17,6 +20,11 @@ from phospho.models import (
 )
 from phospho.sessions import SessionCollection
 from phospho.tasks import TaskCollection, TaskEntity
+from phospho.utils import json_dumps
+
+if TYPE_CHECKING:
+    import httpx
+    import pyarrow as pa
 
 logger = logging.getLogger(__name__)
 
@@ -37,7 +45,19 @@ class Client:
         api_key: Optional[str] = None,
         project_id: Optional[str] = None,
         base_url: Optional[str] = None,
+        pool_maxsize: int = 10,
+        compress: bool = True,
+        async_http_client: Optional["httpx.AsyncClient"] = None,
     ) -> None:
+        """
+        :param pool_maxsize: The maximum number of keep-alive connections to the phospho backend.
+        :param compress: Whether to gzip the batches of log events sent to the backend. If
+            the backend rejects a gzipped body, the batch is sent again uncompressed. If it's
+            then accepted (eg. a self-hosted backend that doesn't support gzip), compression
+            is disabled.
+        :param async_http_client: An httpx.AsyncClient used to send logs in async mode. Pass
+            the one of your app to share its connection pool. If None, one is created.
+        """
         self.__api_key = api_key
         self.__project_id = project_id
         # If no api_key is provided, verify that there is an environment variable
@@ -52,6 +72,36 @@ class Client:
         else:
             self.base_url = base_url
 
+        self.compress = compress
+        self.pool_maxsize = pool_maxsize
+        # Keep-alive connections, reused across calls
+        self._session = self._create_session()
+        # Used in async mode
+        self._async_http_client = async_http_client
+        self._async_http_client_is_external = async_http_client is not None
+        self._async_http_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _create_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def close(self) -> None:
+        """Close the connections to the phospho backend"""
+        self._session.close()
+
+    def _reinit_after_fork(self) -> None:
+        """
+        Called in the child process after a fork: the connections of the parent must not be
+        shared, so new connection pools are created.
+        """
+        self._session = self._create_session()
+        if not self._async_http_client_is_external:
+            self._async_http_client = None
+            self._async_http_client_loop = None
+
     def _api_key(self) -> str:
         token = self.__api_key
         # Evaluate lazily in case environment variable is set with dotenv, or something
@@ -107,7 +157,7 @@ class Client:
     ) -> requests.Response:
         # Defaults to V2 API
         url = f"{self.base_url}/v2{path}"
-        response = requests.get(url, headers=self._headers(), params=params)
+        response = self._session.get(url, headers=self._headers(), params=params)
 
         if response.status_code >= 200 and response.status_code < 300:
             return response
@@ -124,13 +174,58 @@ class Client:
                 f"Unknwon error {response.status_code} GET {url}: {response.text}"
             )
 
-    def _post(
-        self, path: str, payload: Optional[Dict[str, object]] = None
-    ) -> requests.Response:
+    def _prepare_post(
+        self,
+        path: str,
+        payload: Optional[Dict[str, object]] = None,
+        compress: bool = False,
+    ) -> Tuple[str, Dict[str, str], Optional[bytes]]:
+        """
+        Returns the url, headers and body of a POST request.
+
+        :param compress: If True and the client was created with compress=True, the
+            payload is sent gzipped when it's larger than config.COMPRESSION_MIN_BYTES.
+        """
         # Defaults to V2 API
         url = f"{self.base_url}/v2{path}"
-        response = requests.post(url, headers=self._headers(), json=payload)
+        headers = self._headers()
+        data = None
+        if payload is not None:
+            data = json_dumps(payload)
+            if compress and self.compress and len(data) >= config.COMPRESSION_MIN_BYTES:
+                data = gzip.compress(data, compresslevel=config.COMPRESSION_LEVEL)
+                headers["content-encoding"] = "gzip"
+        return url, headers, data
+
+    def _retry_uncompressed(self, headers: Dict[str, str], response: Any) -> bool:
+        """
+        Whether a gzipped body was rejected by the backend, and the request must be sent
+        again uncompressed. The rejection may also be a genuine validation error of the
+        payload: see _on_uncompressed_retry.
+        """
+        return headers.get("content-encoding") == "gzip" and response.status_code in (
+            400,
+            415,
+            422,
+        )
 
+    def _on_uncompressed_retry(self, response: Any) -> None:
+        """
+        Disable compression if the uncompressed retry succeeded: the backend doesn't
+        support gzip (eg. a self-hosted backend). Otherwise, the payload itself was invalid.
+        """
+        if self.compress and 200 <= response.status_code < 300:
+            logger.warning(
+                f"The phospho backend {self.base_url} rejected a gzipped request but accepted "
+                + "it uncompressed. Sending the logs uncompressed."
+            )
+            self.compress = False
+
+    def _check_post_response(self, url: str, response: Any) -> Any:
+        """
+        Raise an error if the status code of the response to a POST request isn't 2xx.
+        Works with both requests and httpx responses.
+        """
         if response.status_code >= 200 and response.status_code < 300:
             return response
         elif response.status_code >= 400 and response.status_code < 500:
@@ -147,6 +242,57 @@ class Client:
                 f"Uknown error {response.status_code} POST {url}: {response.text}"
             )
 
+    def _post(
+        self,
+        path: str,
+        payload: Optional[Dict[str, object]] = None,
+        compress: bool = False,
+    ) -> requests.Response:
+        url, headers, data = self._prepare_post(path, payload, compress)
+        response = self._session.post(url, headers=headers, data=data)
+        if self._retry_uncompressed(headers, response):
+            url, headers, data = self._prepare_post(path, payload, compress=False)
+            response = self._session.post(url, headers=headers, data=data)
+            self._on_uncompressed_retry(response)
+        return self._check_post_response(url, response)
+
+    def _get_async_http_client(self) -> "httpx.AsyncClient":
+        """
+        Returns the async HTTP client used by _apost. An httpx.AsyncClient is bound
+        to an event loop, so a new one is created if the running loop changed.
+        """
+        if self._async_http_client_is_external:
+            return self._async_http_client
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError(
+                "Please install the `httpx` package to use phospho in async mode: `pip install httpx`"
+            )
+        loop = asyncio.get_running_loop()
+        if self._async_http_client is None or self._async_http_client_loop is not loop:
+            self._async_http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_keepalive_connections=self.pool_maxsize)
+            )
+            self._async_http_client_loop = loop
+        return self._async_http_client
+
+    async def _apost(
+        self,
+        path: str,
+        payload: Optional[Dict[str, object]] = None,
+        compress: bool = False,
+    ) -> "httpx.Response":
+        """Async version of _post"""
+        url, headers, data = self._prepare_post(path, payload, compress)
+        async_http_client = self._get_async_http_client()
+        response = await async_http_client.post(url, headers=headers, content=data)
+        if self._retry_uncompressed(headers, response):
+            url, headers, data = self._prepare_post(path, payload, compress=False)
+            response = await async_http_client.post(url, headers=headers, content=data)
+            self._on_uncompressed_retry(response)
+        return self._check_post_response(url, response)
+
     @property
     def sessions(self) -> SessionCollection:
         """Return a SessionCollection to interact with the sessions of the project"""
@@ -193,16 +339,57 @@ class Client:
         )
         return [Task.model_validate(task) for task in response.json()["tasks"]]
 
+    def fetch_tasks_page(
+        self,
+        filters: Optional[ProjectDataFilters] = None,
+        page_size: int = 1000,
+        cursor: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Get a page of the tasks of a project, from the most recent to the oldest.
+
+        The tasks are returned as dicts, without validation. To iterate over all the
+        tasks, use `client.tasks.iter()`.
+
+        :param cursor: The next_cursor of the previous page. None for the first page.
+        :returns: {"tasks": [...], "next_cursor": ...}. next_cursor is None on the last page.
+        """
+        if filters is None:
+            filters = ProjectDataFilters()
+        response = self._post(
+            f"/projects/{self._project_id()}/tasks/page",
+            payload={
+                "filters": filters.model_dump(),
+                "page_size": page_size,
+                "cursor": cursor,
+            },
+        )
+        return response.json()
+
     def tasks_flat(
         self,
         limit: int = 1000,
         with_events: bool = True,
         with_sessions: bool = True,
         with_removed_events: bool = False,
-    ) -> dict:
+        format: Literal["json", "arrow", "parquet"] = "json",
+    ) -> Union[dict, "pa.Table"]:
         """
         Get the tasks of a project in a flattened format.
+
+        :param format: With "json", returns a dict {"flattened_tasks": [...]}. With
+            "arrow" or "parquet", the tasks are sent in a columnar format, which is
+            smaller and faster to parse, and returned as a pyarrow.Table. Convert it to
+            a pandas DataFrame with `.to_pandas()`.
         """
+        if format != "json":
+            try:
+                import pyarrow as pa
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise ImportError(
+                    f"Please install the `pyarrow` package to use tasks_flat with format={format}: `pip install pyarrow`"
+                )
 
         response = self._post(
             f"/projects/{self._project_id()}/tasks/flat",
@@ -211,8 +398,14 @@ class Client:
                 "with_events": with_events,
                 "with_sessions": with_sessions,
                 "with_removed_events": with_removed_events,
+                "format": format,
             },
         )
+        if format == "arrow":
+            with pa.ipc.open_stream(response.content) as reader:
+                return reader.read_all()
+        elif format == "parquet":
+            return pq.read_table(pa.BufferReader(response.content))
         return response.json()
 
     def update_tasks_flat(self, flattened_tasks: List[FlattenedTask]) -> None:
@@ -6,6 +6,74 @@ import os
 
 BASE_URL = "https://api.phospho.ai"
 
+# Batches of log events smaller than this are sent uncompressed (in bytes)
+COMPRESSION_MIN_BYTES = 1024
+# gzip compression level: low values are faster, high values compress better
+COMPRESSION_LEVEL = 5
+
+# Maximum number of log events, and size in bytes (serialized as json), sent in one request
+MAX_BATCH_SIZE = 1000
+MAX_BATCH_BYTES = 5 * 1024 * 1024
+
+# Log events spilled to disk are stored in segment files of this size (in bytes)
+SPILL_SEGMENT_MAX_BYTES = 16 * 1024 * 1024
+# Number of log events read from the disk spill per request when replaying it
+SPILL_REPLAY_BATCH_SIZE = 1000
+
+# Number of token counts (keyed by tokenizer and hash of the text) kept in memory
+TOKEN_COUNT_CACHE_SIZE = 10_000
+# shorten_text encodes a window of this many characters per token to keep, and drops
+# this many tokens at the edge of the window
+SHORTEN_TEXT_CHARS_PER_TOKEN = 6
+SHORTEN_TEXT_SAFETY_TOKENS = 16
+
+# Default rate limits of the LLM calls made by the lab, per provider and model. Use
+# lab.set_rate_limits to set the limits of a model. None means no limit.
+LLM_REQUESTS_PER_MINUTE = (
+    float(os.environ["PHOSPHO_LLM_REQUESTS_PER_MINUTE"])
+    if os.getenv("PHOSPHO_LLM_REQUESTS_PER_MINUTE")
+    else None
+)
+LLM_TOKENS_PER_MINUTE = (
+    float(os.environ["PHOSPHO_LLM_TOKENS_PER_MINUTE"])
+    if os.getenv("PHOSPHO_LLM_TOKENS_PER_MINUTE")
+    else None
+)
+# Number of times a LLM call is retried after a 429 (Too Many Requests) response, and the
+# time to wait (in seconds, doubled at every retry) if the response has no Retry-After
+LLM_RATE_LIMIT_MAX_RETRIES = 3
+LLM_RATE_LIMIT_DEFAULT_RETRY_AFTER = 1.0
+
+# Cache of the LLM responses of the lab: "memory", or the path of a SQLite file. None
+# disables the cache. Entries expire after LLM_CACHE_TTL seconds (None: never).
+LLM_CACHE = os.getenv("PHOSPHO_LLM_CACHE")
+LLM_CACHE_TTL = (
+    float(os.environ["PHOSPHO_LLM_CACHE_TTL"])
+    if os.getenv("PHOSPHO_LLM_CACHE_TTL")
+    else None
+)
+# Maximum number of responses kept by the in-memory cache
+LLM_CACHE_MAX_SIZE = 10_000
+
+# Connection pools of the clients of the LLM providers, shared by the jobs of a process.
+# HTTP/2 is only used if the h2 package is installed.
+LLM_MAX_CONNECTIONS = int(os.getenv("PHOSPHO_LLM_MAX_CONNECTIONS", 100))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.getenv("PHOSPHO_LLM_MAX_KEEPALIVE_CONNECTIONS", 20)
+)
+LLM_HTTP2 = os.getenv("PHOSPHO_LLM_HTTP2", "true").lower() == "true"
+# Maximum number of clients (provider, api_key, base_url) kept per event loop
+LLM_CLIENTS_CACHE_SIZE = 64
+
+# Number of events detected in the same LLM call by the lab (1: one call per event)
+EVENT_DETECTION_BATCH_SIZE = int(os.getenv("PHOSPHO_EVENT_DETECTION_BATCH_SIZE", 1))
+
+# Confidence of the test stopping the evaluation of an alternative config of a job, once
+# its agreement with the current config is unlikely to reach the accuracy threshold
+ALTERNATIVE_CONFIGS_STOPPING_CONFIDENCE = float(
+    os.getenv("PHOSPHO_ALTERNATIVE_CONFIGS_STOPPING_CONFIDENCE", 0.95)
+)
+
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 MISTRAL_API_KEY = os.environ.get("MISTRAL_API_KEY")
 
@@ -1,17 +1,65 @@
+import asyncio
 import atexit
 import logging
 import os
 import time
-from threading import Thread
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, Thread
+from typing import Callable, Dict, List, Optional, Set, Tuple
 
+import pydantic
+
+from . import config
 from .client import Client, PhosphoClientSideError
 from .log_queue import LogQueue
+from .utils import json_dumps
 
 logger = logging.getLogger(__name__)
 
 
-class Consumer(Thread):
-    """Every tick, the consumer tries to send the accumulated logs to the backend."""
+class BatchStats(pydantic.BaseModel):
+    """Stats about a request sending a batch of log events, passed to the stats_hook."""
+
+    nb_events: int
+    # Size of the events serialized as json, before compression
+    nb_bytes: int
+    # Duration of the request, in seconds
+    latency: float
+    success: bool
+    error: Optional[str] = None
+
+
+def split_batch(
+    batch: List[Dict[str, object]],
+    max_events: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+) -> List[Tuple[List[Dict[str, object]], int]]:
+    """
+    Split a batch of log events into chunks of at most max_events events and max_bytes bytes
+    (serialized as json). An event bigger than max_bytes is sent alone.
+
+    :returns: The chunks and their size in bytes.
+    """
+    chunks: List[Tuple[List[Dict[str, object]], int]] = []
+    chunk: List[Dict[str, object]] = []
+    chunk_bytes = 0
+    for event_content in batch:
+        size = len(json_dumps(event_content))
+        if chunk and (
+            (max_events is not None and len(chunk) >= max_events)
+            or (max_bytes is not None and chunk_bytes + size > max_bytes)
+        ):
+            chunks.append((chunk, chunk_bytes))
+            chunk, chunk_bytes = [], 0
+        chunk.append(event_content)
+        chunk_bytes += size
+    if chunk:
+        chunks.append((chunk, chunk_bytes))
+    return chunks
+
+
+class BaseConsumer:
+    """Common logic of the consumers: batching, test mode, retries with backoff."""
 
     def __init__(
         self,
@@ -19,16 +67,31 @@ class Consumer(Thread):
         client: Client,
         tick: float = 0.5,  # How often to try to send logs
         raise_error_on_fail_to_send: bool = False,
+        max_batch_size: Optional[int] = config.MAX_BATCH_SIZE,
+        max_batch_bytes: Optional[int] = config.MAX_BATCH_BYTES,
+        nb_senders: int = 1,
+        stats_hook: Optional[Callable[[BatchStats], None]] = None,
     ) -> None:
+        """
+        :param max_batch_size: The maximum number of log events sent in one request.
+        :param max_batch_bytes: The maximum size of the log events sent in one request
+            (in bytes, serialized as json).
+        :param nb_senders: The number of requests sent in parallel when the log events don't
+            fit in one request (eg. after an outage).
+        :param stats_hook: Called with the BatchStats of every request. With nb_senders > 1,
+            it's called from the sender threads.
+        """
         self.running = True
         self.log_queue = log_queue
         self.client = client
         self.tick = tick
         self.raise_error_on_fail_to_send = raise_error_on_fail_to_send
         self.nb_consecutive_errors = 0
-
-        Thread.__init__(self, daemon=True)
-        atexit.register(self.stop)
+        self.max_batch_size = max_batch_size
+        self.max_batch_bytes = max_batch_bytes
+        self.nb_senders = nb_senders
+        self.stats_hook = stats_hook
+        self._executor: Optional[ThreadPoolExecutor] = None
 
     def get_wait_time(self) -> float:
         """
@@ -39,6 +102,220 @@ class Consumer(Thread):
             return self.tick
         return min(self.tick * (2 ** (self.nb_consecutive_errors - 1)), 60)
 
+    def _prepare_batch(
+        self, batch: List[Dict[str, object]]
+    ) -> Optional[Dict[str, object]]:
+        """
+        Returns the payload to send to the backend, or None if the batch shouldn't be sent.
+        """
+        PHOSPHO_TEST_ID = os.getenv("PHOSPHO_TEST_ID")
+        PHOSPHO_TEST_METRIC = os.getenv("PHOSPHO_TEST_METRIC")
+        if PHOSPHO_TEST_ID is None:
+            # Normal behaviour : send logs to backend
+            return {"batched_log_events": batch}
+        # Test mode: send logs if we are in the right metric
+        if PHOSPHO_TEST_METRIC == "evaluate":
+            # Add the test_id to the log events
+            for event in batch:
+                event["test_id"] = PHOSPHO_TEST_ID
+            return {"batched_log_events": batch}
+        return None
+
+    def _on_send_error(
+        self, e: Exception, batch: List[Dict[str, object]], requeue: bool = True
+    ) -> None:
+        if isinstance(e, PhosphoClientSideError):
+            # If the error is a client-side error, we don't want to retry
+            raise e
+        if self.raise_error_on_fail_to_send:
+            raise e
+        # Retry with an exponential backoff
+        self.nb_consecutive_errors += 1
+        logger.warning(
+            f"Error sending phospho log events: {e}. Retrying in {self.get_wait_time()}s"
+        )
+        if requeue:
+            # Put all the events back into the log queue, so they are logged next tick
+            self.log_queue.add_batch(batch)
+
+    def _report_stats(
+        self,
+        nb_events: int,
+        nb_bytes: int,
+        latency: float,
+        error: Optional[BaseException] = None,
+    ) -> None:
+        if self.stats_hook is None:
+            return
+        try:
+            self.stats_hook(
+                BatchStats(
+                    nb_events=nb_events,
+                    nb_bytes=nb_bytes,
+                    latency=latency,
+                    success=error is None,
+                    error=str(error) if error is not None else None,
+                )
+            )
+        except Exception as e:
+            logger.warning(f"Error in the phospho stats_hook: {e}")
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.nb_senders, thread_name_prefix="phospho-sender"
+            )
+        return self._executor
+
+    def _reinit_after_fork(self) -> None:
+        """
+        Called in the child process after a fork. The threads of the parent don't exist
+        in the child: the consumer is started again on the next call to ensure_started.
+        """
+        self._executor = None
+        self.nb_consecutive_errors = 0
+
+    def _shutdown_executor(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _post_chunk(self, chunk: List[Dict[str, object]], nb_bytes: int) -> None:
+        """Send a chunk of log events in one request. Raises if the request fails."""
+        payload = self._prepare_batch(chunk)
+        if payload is None:
+            return
+        start = time.perf_counter()
+        try:
+            self.client._post(
+                f"/log/{self.client._project_id()}", payload, compress=True
+            )
+        except Exception as e:
+            self._report_stats(len(chunk), nb_bytes, time.perf_counter() - start, e)
+            raise e
+        self._report_stats(len(chunk), nb_bytes, time.perf_counter() - start)
+        self.nb_consecutive_errors = 0
+
+    def _send_events(
+        self, batch: List[Dict[str, object]], requeue: bool = True
+    ) -> bool:
+        """
+        Send the log events in requests of at most max_batch_size events and max_batch_bytes
+        bytes. Only the events of the failed requests are put back in the log queue.
+
+        :returns: True if all the requests succeeded.
+        """
+        chunks = split_batch(batch, self.max_batch_size, self.max_batch_bytes)
+
+        # The executor can't be used anymore once the interpreter is shutting down
+        if self.nb_senders > 1 and len(chunks) > 1 and self.running:
+            executor = self._get_executor()
+            futures = [
+                (chunk, executor.submit(self._post_chunk, chunk, nb_bytes))
+                for chunk, nb_bytes in chunks
+            ]
+            failed_events: List[Dict[str, object]] = []
+            error: Optional[Exception] = None
+            for chunk, future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    failed_events.extend(chunk)
+                    if error is None:
+                        error = e
+            if error is not None:
+                self._on_send_error(error, failed_events, requeue)
+                return False
+            return True
+
+        for i, (chunk, nb_bytes) in enumerate(chunks):
+            try:
+                self._post_chunk(chunk, nb_bytes)
+            except Exception as e:
+                # The next requests would likely fail too: put back all the events not sent
+                not_sent_events = [event for c, _ in chunks[i:] for event in c]
+                self._on_send_error(e, not_sent_events, requeue)
+                return False
+        return True
+
+    def send_batch(self) -> None:
+        batch = self.log_queue.get_batch()
+
+        if len(batch) > 0:
+            logger.debug(f"Sending {len(batch)} log events to {self.client.base_url}")
+            if not self._send_events(batch):
+                return
+
+        self.send_spilled_batches()
+
+    def send_spilled_batches(self) -> None:
+        """Replay the log events spilled to disk, until there are none left or sending fails."""
+        spill = self.log_queue.spill
+        if spill is None:
+            return
+
+        while True:
+            batch, position = spill.read_batch(config.SPILL_REPLAY_BATCH_SIZE)
+            if len(batch) == 0:
+                return
+
+            logger.debug(
+                f"Replaying {len(batch)} spilled log events to {self.client.base_url}"
+            )
+            # If sending fails, the events stay on disk and will be replayed later
+            if not self._send_events(batch, requeue=False):
+                return
+            spill.commit(position)
+
+            if len(batch) < config.SPILL_REPLAY_BATCH_SIZE:
+                return
+
+
+class Consumer(BaseConsumer, Thread):
+    """Every tick, the consumer tries to send the accumulated logs to the backend."""
+
+    def __init__(
+        self,
+        log_queue: LogQueue,
+        client: Client,
+        tick: float = 0.5,  # How often to try to send logs
+        raise_error_on_fail_to_send: bool = False,
+        max_batch_size: Optional[int] = config.MAX_BATCH_SIZE,
+        max_batch_bytes: Optional[int] = config.MAX_BATCH_BYTES,
+        nb_senders: int = 1,
+        stats_hook: Optional[Callable[[BatchStats], None]] = None,
+    ) -> None:
+        BaseConsumer.__init__(
+            self,
+            log_queue=log_queue,
+            client=client,
+            tick=tick,
+            raise_error_on_fail_to_send=raise_error_on_fail_to_send,
+            max_batch_size=max_batch_size,
+            max_batch_bytes=max_batch_bytes,
+            nb_senders=nb_senders,
+            stats_hook=stats_hook,
+        )
+        Thread.__init__(self, daemon=True)
+        # Prevents concurrent calls to ensure_started from starting the thread twice
+        self._start_lock = Lock()
+        atexit.register(self.stop)
+
+    def ensure_started(self) -> None:
+        """Start the consumer thread if it was never started (eg. in a forked child process)."""
+        if not self.running or self.ident is not None:
+            return
+        with self._start_lock:
+            if self.ident is None:
+                self.start()
+
+    def _reinit_after_fork(self) -> None:
+        super()._reinit_after_fork()
+        # A thread can only be started once: reset the thread state, which refers to
+        # the thread of the parent.
+        Thread.__init__(self, name=self.name, daemon=True)
+        self._start_lock = Lock()
+
     def run(self) -> None:
         while self.running:
             self.send_batch()
@@ -46,47 +323,199 @@ class Consumer(Thread):
 
         self.send_batch()
 
-    def send_batch(self) -> None:
+    def stop(self):
+        self.running = False
+        if self.ident is not None:
+            self.join()
+        self._shutdown_executor()
+
+
+class AsyncConsumer(BaseConsumer):
+    """
+    Every tick, the consumer sends the accumulated logs to the backend from an asyncio
+    task running in the event loop of the app, instead of a separate thread.
+
+    The task is started on the running event loop. If there is none when the consumer is
+    started, it's started on the next call to `ensure_started` made from inside a loop.
+    """
+
+    def __init__(
+        self,
+        log_queue: LogQueue,
+        client: Client,
+        tick: float = 0.5,  # How often to try to send logs
+        raise_error_on_fail_to_send: bool = False,
+        max_batch_size: Optional[int] = config.MAX_BATCH_SIZE,
+        max_batch_bytes: Optional[int] = config.MAX_BATCH_BYTES,
+        nb_senders: int = 1,
+        stats_hook: Optional[Callable[[BatchStats], None]] = None,
+    ) -> None:
+        super().__init__(
+            log_queue=log_queue,
+            client=client,
+            tick=tick,
+            raise_error_on_fail_to_send=raise_error_on_fail_to_send,
+            max_batch_size=max_batch_size,
+            max_batch_bytes=max_batch_bytes,
+            nb_senders=nb_senders,
+            stats_hook=stats_hook,
+        )
+        self.task: Optional[asyncio.Task] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        atexit.register(self.stop)
+
+    def start(self) -> None:
+        self.running = True
+        self.ensure_started()
+
+    def _reinit_after_fork(self) -> None:
+        super()._reinit_after_fork()
+        # The task belongs to the event loop of the parent
+        self.task = None
+        self.loop = None
+
+    def ensure_started(self) -> None:
+        """Start the consumer task on the running event loop, if it's not running there yet."""
+        if not self.running:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No running event loop: the task is started later
+            return
+        if self.task is not None and self.loop is loop and not self.task.done():
+            return
+        self.loop = loop
+        self.task = loop.create_task(self.run())
+
+    async def run(self) -> None:
+        while self.running:
+            await self.asend_batch()
+            await asyncio.sleep(self.get_wait_time())
+
+    async def _apost_chunk(self, chunk: List[Dict[str, object]], nb_bytes: int) -> None:
+        """Async version of _post_chunk"""
+        payload = self._prepare_batch(chunk)
+        if payload is None:
+            return
+        start = time.perf_counter()
+        try:
+            await self.client._apost(
+                f"/log/{self.client._project_id()}", payload, compress=True
+            )
+        except Exception as e:
+            self._report_stats(len(chunk), nb_bytes, time.perf_counter() - start, e)
+            raise e
+        self._report_stats(len(chunk), nb_bytes, time.perf_counter() - start)
+        self.nb_consecutive_errors = 0
+
+    async def _asend_events(
+        self,
+        batch: List[Dict[str, object]],
+        requeue: bool = True,
+        sent_events: Optional[Set[int]] = None,
+    ) -> bool:
+        """
+        Async version of _send_events. Up to nb_senders requests are sent concurrently.
+
+        :param sent_events: If provided, the id() of the events sent are added to it as the
+            chunks are sent. Used to know which events to put back if the send is cancelled.
+        """
+        chunks = split_batch(batch, self.max_batch_size, self.max_batch_bytes)
+
+        async def send_chunk(chunk: List[Dict[str, object]], nb_bytes: int) -> None:
+            await self._apost_chunk(chunk, nb_bytes)
+            if sent_events is not None:
+                sent_events.update(id(event) for event in chunk)
+
+        if self.nb_senders > 1 and len(chunks) > 1:
+            semaphore = asyncio.Semaphore(self.nb_senders)
+
+            async def post_chunk(chunk: List[Dict[str, object]], nb_bytes: int) -> None:
+                async with semaphore:
+                    await send_chunk(chunk, nb_bytes)
+
+            results = await asyncio.gather(
+                *[post_chunk(chunk, nb_bytes) for chunk, nb_bytes in chunks],
+                return_exceptions=True,
+            )
+            failed_events: List[Dict[str, object]] = []
+            error: Optional[Exception] = None
+            for (chunk, _), result in zip(chunks, results):
+                if isinstance(result, Exception):
+                    failed_events.extend(chunk)
+                    if error is None:
+                        error = result
+            if error is not None:
+                self._on_send_error(error, failed_events, requeue)
+                return False
+            return True
+
+        for i, (chunk, nb_bytes) in enumerate(chunks):
+            try:
+                await send_chunk(chunk, nb_bytes)
+            except Exception as e:
+                # The next requests would likely fail too: put back all the events not sent
+                not_sent_events = [event for c, _ in chunks[i:] for event in c]
+                self._on_send_error(e, not_sent_events, requeue)
+                return False
+        return True
+
+    async def asend_batch(self) -> None:
         batch = self.log_queue.get_batch()
 
         if len(batch) > 0:
             logger.debug(f"Sending {len(batch)} log events to {self.client.base_url}")
 
+            sent_events: Set[int] = set()
             try:
-                PHOSPHO_TEST_ID = os.getenv("PHOSPHO_TEST_ID")
-                PHOSPHO_TEST_METRIC = os.getenv("PHOSPHO_TEST_METRIC")
-                if PHOSPHO_TEST_ID is None:
-                    # Normal behaviour : send logs to backend
-                    self.client._post(
-                        f"/log/{self.client._project_id()}",
-                        {"batched_log_events": batch},
-                    )
-                    self.nb_consecutive_errors = 0
-                elif PHOSPHO_TEST_ID is not None:
-                    # Test mode: send logs if we are in the right metric
-                    if PHOSPHO_TEST_METRIC == "evaluate":
-                        # Add the test_id to the log events
-                        for event in batch:
-                            event["test_id"] = PHOSPHO_TEST_ID
-                        self.client._post(
-                            f"/log/{self.client._project_id()}",
-                            {"batched_log_events": batch},
-                        )
-                        self.nb_consecutive_errors = 0
-            except PhosphoClientSideError as e:
-                # If the error is a client-side error, we don't want to retry
-                raise e
-            except Exception as e:
-                if self.raise_error_on_fail_to_send:
-                    raise e
-                # Retry with an exponential backoff
-                self.nb_consecutive_errors += 1
-                logger.warning(
-                    f"Error sending phospho log events: {e}. Retrying in {self.get_wait_time()}s"
-                )
-                # Put all the events back into the log queue, so they are logged next tick
-                self.log_queue.add_batch(batch)
+                success = await self._asend_events(batch, sent_events=sent_events)
+            except asyncio.CancelledError:
+                # The chunks not sent yet may not have been received: keep them for the
+                # next send. The chunks already sent are not sent again.
+                not_sent_events = [
+                    event for event in batch if id(event) not in sent_events
+                ]
+                if len(not_sent_events) > 0:
+                    self.log_queue.add_batch(not_sent_events)
+                raise
+            if not success:
+                return
+
+        await self.asend_spilled_batches()
+
+    async def asend_spilled_batches(self) -> None:
+        """Async version of send_spilled_batches"""
+        spill = self.log_queue.spill
+        if spill is None:
+            return
+
+        while True:
+            batch, position = await asyncio.to_thread(
+                spill.read_batch, config.SPILL_REPLAY_BATCH_SIZE
+            )
+            if len(batch) == 0:
+                return
+
+            logger.debug(
+                f"Replaying {len(batch)} spilled log events to {self.client.base_url}"
+            )
+            # If sending fails, the events stay on disk and will be replayed later
+            if not await self._asend_events(batch, requeue=False):
+                return
+            await asyncio.to_thread(spill.commit, position)
+
+            if len(batch) < config.SPILL_REPLAY_BATCH_SIZE:
+                return
 
     def stop(self):
         self.running = False
-        self.join()
+        if (
+            self.task is not None
+            and self.loop is not None
+            and not self.loop.is_closed()
+        ):
+            self.loop.call_soon_threadsafe(self.task.cancel)
+        # The event loop is usually closed at exit: send the last logs synchronously
+        self.send_batch()
+        self._shutdown_executor()
@@ -4,7 +4,7 @@ from typing import Any, Callable, Dict, Optional, Tuple, Union
 
 import pydantic
 
-from .utils import filter_nonjsonable_keys, is_jsonable
+from .utils import filter_nonjsonable_keys, is_loggable
 
 RawDataType = Union[Dict[str, Any], pydantic.BaseModel]
 
@@ -279,7 +279,7 @@ def extract_data_from_output(
             raw_output_to_log = output
         else:
             output_to_log = output_to_str_function(output)
-            if not is_jsonable(output):
+            if not is_loggable(output):
                 raw_output_to_log = filter_nonjsonable_keys(convert_to_dict(output))
             else:
                 raw_output_to_log = output
@@ -288,7 +288,7 @@ def extract_data_from_output(
 
     # If raw output is specified, override
     if raw_output is not None:
-        if not is_jsonable(raw_output):
+        if not is_loggable(raw_output):
             raw_output_to_log = filter_nonjsonable_keys(convert_to_dict(raw_output))
         else:
             raw_output_to_log = raw_output
@@ -341,14 +341,14 @@ def extract_data_from_input(
     else:
         # Extract input str representation from input
         input_to_log = input_to_str_function(input)
-        if not is_jsonable(input):
+        if not is_loggable(input):
             raw_input_to_log = filter_nonjsonable_keys(convert_to_dict(input))
         else:
             raw_input_to_log = input
 
     # If raw input is specified, override
     if raw_input is not None:
-        if not is_jsonable(raw_input):
+        if not is_loggable(raw_input):
             raw_input_to_log = filter_nonjsonable_keys(convert_to_dict(raw_input))
         else:
             raw_input_to_log = raw_input
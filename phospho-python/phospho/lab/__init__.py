@@ -1,7 +1,23 @@
 from . import job_library as job_library
 from . import utils as utils
+from .checkpoints import CheckpointStore, JSONLCheckpointStore, SQLiteCheckpointStore
 from .lab import Job, Workload
-from .language_models import get_async_client, get_provider_and_model, get_sync_client
+from .language_models import (
+    aclose_clients,
+    close_clients,
+    get_async_client,
+    get_provider_and_model,
+    get_sync_client,
+)
+from .llm_cache import (
+    InMemoryLLMCache,
+    LLMCache,
+    SQLiteLLMCache,
+    cached_chat_completion,
+    get_llm_cache,
+    set_llm_cache,
+)
+from .matchers import KeywordAutomaton, PatternMatcher
 from .models import (
     EventConfig,
     EventDefinition,
@@ -11,3 +27,4 @@ from .models import (
     Project,
     ResultType,
 )
+from .rate_limits import RateLimiter, get_rate_limiter, set_rate_limits
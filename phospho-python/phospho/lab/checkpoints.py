@@ -0,0 +1,178 @@
+"""
+Checkpoints of the results of a Workload run, so that a run interrupted (eg. if the
+process dies) resumes where it stopped instead of running all the jobs again.
+
+The JobResults are stored by message id and job id as the jobs complete. Set a checkpoint
+store on the workload to skip the (message, job) pairs already completed:
+
+```python
+from phospho import lab
+
+workload = lab.Workload.from_phospho()
+workload.checkpoint_store = lab.SQLiteCheckpointStore("backtest.sqlite")
+# If interrupted, running this again only runs the jobs that didn't complete
+workload.run(messages)
+```
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from phospho.models import JobResult, ResultType
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointStore:
+    """
+    Base class of the checkpoint stores. Subclasses implement _load and _save. The results
+    are stored as json strings.
+    """
+
+    def __init__(self, autocommit: bool = True) -> None:
+        """
+        :param autocommit: If True, the results are persisted as soon as they are set. If
+            False, they are only persisted when commit() is called: eg. once the results
+            are saved somewhere else.
+        """
+        self.autocommit = autocommit
+        self.lock = threading.Lock()
+        # (message_id, job_id) -> result, set but not committed yet
+        self.pending: Dict[Tuple[str, str], str] = {}
+
+    def _load(self, message_id: str, job_id: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def _save(self, entries: List[Tuple[str, str, str]]) -> None:
+        raise NotImplementedError
+
+    def get(self, message_id: str, job_id: str) -> Optional[JobResult]:
+        """Returns the result of the job on the message, if it completed"""
+        with self.lock:
+            value = self.pending.get((message_id, job_id))
+        if value is None:
+            value = self._load(message_id, job_id)
+        if value is None:
+            return None
+        return JobResult.model_validate_json(value)
+
+    def set(self, message_id: str, job_id: str, result: JobResult) -> None:
+        """Checkpoint the result of the job on the message. Errors are not checkpointed."""
+        if result.result_type == ResultType.error:
+            # Eg. a rate limit or a network error: the job runs again on resume
+            return
+        # The job_metadata is the metadata of the job: it's set back by the job
+        value = result.model_dump_json(exclude={"job_metadata"})
+        with self.lock:
+            self.pending[(message_id, job_id)] = value
+        if self.autocommit:
+            self.commit()
+
+    def commit(self, keys: Optional[Iterable[Tuple[str, str]]] = None) -> None:
+        """
+        Persist the results set since the last commit.
+
+        :param keys: The (message_id, job_id) of the results to persist, eg. the ones saved
+            somewhere else. The other results stay pending. If None, all the results set
+            since the last commit are persisted.
+        """
+        with self.lock:
+            if keys is None:
+                keys = list(self.pending.keys())
+            entries = [
+                (message_id, job_id, self.pending.pop((message_id, job_id)))
+                for message_id, job_id in keys
+                if (message_id, job_id) in self.pending
+            ]
+            if len(entries) > 0:
+                self._save(entries)
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteCheckpointStore(CheckpointStore):
+    """Stores the results in a SQLite database"""
+
+    def __init__(self, path: str, autocommit: bool = True) -> None:
+        """
+        :param path: Path of the SQLite file. It's created if it doesn't exist.
+        """
+        super().__init__(autocommit=autocommit)
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints "
+            + "(message_id TEXT NOT NULL, job_id TEXT NOT NULL, result TEXT NOT NULL, "
+            + "PRIMARY KEY (message_id, job_id))"
+        )
+        self.connection.commit()
+
+    def _load(self, message_id: str, job_id: str) -> Optional[str]:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT result FROM checkpoints WHERE message_id = ? AND job_id = ?",
+                (message_id, job_id),
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def _save(self, entries: List[Tuple[str, str, str]]) -> None:
+        # Called with the lock held
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO checkpoints (message_id, job_id, result) VALUES (?, ?, ?)",
+            entries,
+        )
+        self.connection.commit()
+
+    def close(self) -> None:
+        self.commit()
+        with self.lock:
+            self.connection.close()
+
+
+class JSONLCheckpointStore(CheckpointStore):
+    """
+    Appends the results to a JSONL file, one line per result. The file is read when the
+    store is created, and the results are kept in memory.
+    """
+
+    def __init__(self, path: str, autocommit: bool = True) -> None:
+        """
+        :param path: Path of the JSONL file. It's created if it doesn't exist.
+        """
+        super().__init__(autocommit=autocommit)
+        self.path = path
+        self.results: Dict[Tuple[str, str], str] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        self.results[(entry["message_id"], entry["job_id"])] = (
+                            json.dumps(entry["result"])
+                        )
+                    except (json.JSONDecodeError, KeyError):
+                        # The last line may be incomplete if the process died writing it
+                        logger.warning(f"Skipping invalid line in checkpoint {path}")
+
+    def _load(self, message_id: str, job_id: str) -> Optional[str]:
+        with self.lock:
+            return self.results.get((message_id, job_id))
+
+    def _save(self, entries: List[Tuple[str, str, str]]) -> None:
+        # Called with the lock held
+        with open(self.path, "a", encoding="utf-8") as f:
+            for message_id, job_id, value in entries:
+                line = {
+                    "message_id": message_id,
+                    "job_id": job_id,
+                    "result": json.loads(value),
+                }
+                f.write(json.dumps(line) + "\n")
+                self.results[(message_id, job_id)] = value
+            f.flush()
@@ -4,13 +4,20 @@ Each job is a function that takes a message and a set of parameters and returns
 The result is a JobResult object.
 """
 
+import asyncio
+import concurrent.futures
+import json
 import logging
 import math
 import os
 import random
+import threading
 import time
+import weakref
 from collections import defaultdict
-from typing import List, Literal, Optional, Tuple, cast
+from typing import Any, Dict, List, Literal, Optional, Tuple, cast
+
+import phospho.config as config
 
 from phospho.models import (
     DetectionScope,
@@ -30,6 +37,13 @@ except ImportError:
 
 
 from .language_models import get_async_client, get_provider_and_model, get_sync_client
+from .llm_cache import cached_chat_completion
+from .matchers import (
+    compile_keywords,
+    compile_regex,
+    detection_result,
+    get_text_to_search,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -413,8 +427,10 @@ If the event '{event_name}' is not present in the {the_interaction} or you can't
             # Despite the docs saying it does: https://learn.microsoft.com/en-us/azure/ai-services/openai/reference#request-body-2
             # Issue: https://learn.microsoft.com/en-us/answers/questions/1692045/does-gpt-4-1106-preview-support-logprobs
             try:
-                response = await async_openai_client.chat.completions.create(
-                    model=model_name,
+                response, llm_call_metadata = await cached_chat_completion(
+                    async_openai_client,
+                    provider,
+                    model_name,
                     messages=[
                         {
                             "role": "system",
@@ -433,8 +449,10 @@ If the event '{event_name}' is not present in the {the_interaction} or you can't
                 # Fallback to OpenAI API
                 if model_name == "gpt-4o":
                     model_name = "gpt-4o-mini"
-                response = await async_openai_client.chat.completions.create(
-                    model=model_name,
+                response, llm_call_metadata = await cached_chat_completion(
+                    async_openai_client,
+                    "openai",
+                    model_name,
                     messages=[
                         {
                             "role": "system",
@@ -448,8 +466,10 @@ If the event '{event_name}' is not present in the {the_interaction} or you can't
                     top_logprobs=20,
                 )
         else:
-            response = await async_openai_client.chat.completions.create(
-                model=model_name,
+            response, llm_call_metadata = await cached_chat_completion(
+                async_openai_client,
+                provider,
+                model_name,
                 messages=[
                     {
                         "role": "system",
@@ -469,7 +489,8 @@ If the event '{event_name}' is not present in the {the_interaction} or you can't
             value=None,
             logs=[prompt, str(e)],
         )
-    api_call_time = time.time() - start_time
+    # The time spent waiting for the rate limit isn't part of the API call
+    api_call_time = time.time() - start_time - llm_call_metadata["rate_limit_delay"]
     llm_response: Optional[str] = response.choices[0].message.content
     # Metadata
     llm_call = {
@@ -481,6 +502,7 @@ If the event '{event_name}' is not present in the {the_interaction} or you can't
     }
     metadata = {
         "api_call_time": api_call_time,
+        **llm_call_metadata,
         "evaluation_source": EVALUATION_SOURCE,
         "llm_call": llm_call,
     }
@@ -714,6 +736,409 @@ If the event '{event_name}' is not present in the {the_interaction} or you can't
     return JobResult(result_type=result_type, value=detected_event, metadata=metadata)
 
 
+def _get_text_to_label(
+    message: Message, detection_scope: DetectionScope
+) -> Tuple[Optional[str], Optional[JobResult]]:
+    """
+    Returns the text to label with the events for the detection scope, or the JobResult
+    to return if there is nothing to label.
+    """
+    if detection_scope == "task":
+        return message.latest_interaction(), None
+    if detection_scope in ["task_input_only", "task_output_only"]:
+        role = "user" if detection_scope == "task_input_only" else "assistant"
+        message_list = [m for m in message.as_list() if m.role.lower() == role]
+        if len(message_list) == 0:
+            return None, JobResult(
+                result_type=ResultType.bool,
+                value=False,
+                logs=[f"No {role} message in the interaction"],
+            )
+        return f"{role.capitalize()}: {message_list[-1].content}", None
+    if detection_scope == "session":
+        return message.transcript(with_role=True, with_previous_messages=True), None
+    if detection_scope == "system_prompt":
+        message_task: Optional[Task] = message.metadata.get("task")
+        if not isinstance(message_task, Task) or not isinstance(
+            message_task.metadata, dict
+        ):
+            return None, JobResult(
+                result_type=ResultType.error,
+                value=None,
+                logs=["No task metadata in the message"],
+            )
+        system_prompt_in_message = message_task.metadata.get("system_prompt", None)
+        if not isinstance(system_prompt_in_message, str):
+            return None, JobResult(
+                result_type=ResultType.error,
+                value=None,
+                logs=["No system_prompt string in the task metadata"],
+            )
+        return system_prompt_in_message, None
+    raise ValueError(
+        f"Unknown event_scope : {detection_scope}. Valid values are: {DetectionScope.__args__}"
+    )
+
+
+def _read_event_answer(
+    answer: Any, score_range_settings: ScoreRangeSettings
+) -> Optional[Tuple[ResultType, bool, ScoreRange]]:
+    """
+    Read the answer of the LLM for one event of a multi-event detection.
+
+    :returns: The result type, whether the event is detected and its score, or None if the
+        answer is invalid.
+    """
+    if score_range_settings.score_type == "confidence":
+        if isinstance(answer, bool):
+            answer = "yes" if answer else "no"
+        answer = str(answer).strip().strip(".").lower()
+        if answer not in ["yes", "no"]:
+            return None
+        return (
+            ResultType.bool,
+            answer == "yes",
+            ScoreRange(
+                score_type="confidence",
+                max=1,
+                min=0,
+                value=1 if answer == "yes" else 0,
+                options_confidence={answer: 1},
+            ),
+        )
+    try:
+        score = float(answer)
+    except (TypeError, ValueError):
+        return None
+    if score_range_settings.score_type == "range":
+        if not score_range_settings.min <= score <= score_range_settings.max:
+            return None
+        return (
+            ResultType.bool,
+            # In range mode, the event is always marked as detected
+            True,
+            ScoreRange(
+                score_type="range",
+                max=score_range_settings.max,
+                min=score_range_settings.min,
+                value=score,
+                options_confidence={str(score): 1},
+            ),
+        )
+    categories = score_range_settings.categories or []
+    if score != int(score) or not 0 <= score <= len(categories):
+        return None
+    label = categories[int(score) - 1] if score > 0 else "None"
+    return (
+        ResultType.literal,
+        score > 0,
+        ScoreRange(
+            score_type="category",
+            value=int(score),
+            min=0 if score == 0 else 1,
+            max=len(categories),
+            label=label,
+            options_confidence={label: 1},
+        ),
+    )
+
+
+async def multi_event_detection(
+    message: Message,
+    events: List[Dict[str, Any]],
+    detection_scope: DetectionScope = "task",
+    model: str = "azure:gpt-4o",
+) -> Dict[str, JobResult]:
+    """
+    Detects several events in a message with a single LLM call, which returns the answer
+    for every event as json. The events not answered correctly are detected with one
+    event_detection call each.
+
+    :param events: The events to detect, as dicts with the parameters of event_detection:
+        event_name, event_description and score_range_settings.
+    :returns: A mapping of event_name -> JobResult.
+    """
+    EVALUATION_SOURCE = "phospho-6"
+    MAX_TOKENS = 128_000
+
+    events_by_name: Dict[str, Dict[str, Any]] = {}
+    for event in events:
+        score_range_settings = event.get("score_range_settings") or ScoreRangeSettings()
+        if isinstance(score_range_settings, dict):
+            score_range_settings = ScoreRangeSettings.model_validate(
+                score_range_settings
+            )
+        events_by_name[event["event_name"]] = {
+            **event,
+            "score_range_settings": score_range_settings,
+        }
+
+    text_to_label, empty_result = _get_text_to_label(message, detection_scope)
+    if empty_result is not None:
+        return {
+            event_name: empty_result.model_copy(deep=True)
+            for event_name in events_by_name
+        }
+
+    if detection_scope == "system_prompt":
+        system_prompt = (
+            "You are an impartial judge reading an assistant system prompt. "
+        )
+        during_interaction = "in the system prompt"
+    else:
+        system_prompt = "You are an impartial judge reading a conversation between a user and an assistant. "
+        during_interaction = "during the interaction"
+    system_prompt += f"You must evaluate several events {during_interaction}.\n"
+
+    successful_events = message.metadata.get("successful_events", [])
+    unsuccessful_events = message.metadata.get("unsuccessful_events", [])
+    for i, (event_name, event) in enumerate(events_by_name.items()):
+        score_range_settings = event["score_range_settings"]
+        description = event.get("event_description") or "No description."
+        if score_range_settings.score_type == "confidence":
+            expected_answer = (
+                f'Did the event happen {during_interaction}? Answer "Yes" or "No".'
+            )
+        elif score_range_settings.score_type == "range":
+            expected_answer = f"Answer a whole number between {score_range_settings.min} and {score_range_settings.max}."
+        else:
+            formatted_categories = ", ".join(
+                f"{j + 1}. {category}"
+                for j, category in enumerate(score_range_settings.categories or [])
+            )
+            expected_answer = f"Answer the number of the category ({formatted_categories}), or 0 if the event is not present."
+        system_prompt += f"""
+{i + 1}. '{event_name}': {description}
+{expected_answer}
+"""
+        for examples, happened in [
+            (successful_events, "happened"),
+            (unsuccessful_events, "did not happen"),
+        ]:
+            example = next(
+                (e for e in examples if e.get("event_name") == event_name), None
+            )
+            if example is not None:
+                system_prompt += f"Example of an interaction where '{event_name}' {happened}: {example['input']} -> {example['output']}\n"
+
+    if len(message.previous_messages) > 1 and "task" in detection_scope:
+        truncated_context = shorten_text(
+            message.latest_interaction_context(), MAX_TOKENS, 100, how="right"
+        )
+        system_prompt += f"""
+Here is the context of the conversation:
+[CONTEXT START]
+{truncated_context}
+[CONTEXT END]
+"""
+
+    truncated_text = cast(str, text_to_label)
+    # A token is at least one byte: only count the tokens if the prompt may be too long
+    if len((system_prompt + truncated_text).encode("utf-8")) > MAX_TOKENS:
+        truncated_text = shorten_text(
+            truncated_text,
+            MAX_TOKENS,
+            get_number_of_tokens(system_prompt) + 100,
+            how="right",
+        )
+    prompt = f"""Label the following {"system prompt" if detection_scope == "system_prompt" else "interaction"} with the events:
+[TEXT TO LABEL START]
+{truncated_text}
+[TEXT TO LABEL END]
+
+Respond with a json object mapping the name of every event to your answer, like so:
+{json.dumps({event_name: "..." for event_name in events_by_name})}"""
+
+    provider, model_name = get_provider_and_model(model)
+    async_openai_client = get_async_client(provider)
+    results: Dict[str, JobResult] = {}
+    start_time = time.time()
+    try:
+        response, llm_call_metadata = await cached_chat_completion(
+            async_openai_client,
+            provider,
+            model_name,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt},
+            ],
+            max_tokens=20 * len(events_by_name) + 20,
+            temperature=0,
+            response_format={"type": "json_object"},
+        )
+        api_call_time = time.time() - start_time - llm_call_metadata["rate_limit_delay"]
+        llm_response = response.choices[0].message.content
+        answers = json.loads(llm_response)
+        if not isinstance(answers, dict):
+            raise ValueError(f"The response is not a json object: {llm_response}")
+    except Exception as e:
+        logger.warning(
+            f"multi_event_detection failed: {e}. Falling back to one call per event."
+        )
+        answers = {}
+    else:
+        llm_call = {
+            "model": model_name,
+            "prompt": prompt,
+            "system_prompt": system_prompt,
+            "llm_output": llm_response,
+            "api_call_time": api_call_time,
+        }
+        for event_name, event in events_by_name.items():
+            answer = _read_event_answer(
+                answers.get(event_name), event["score_range_settings"]
+            )
+            if answer is None:
+                continue
+            result_type, detected_event, score_range = answer
+            results[event_name] = JobResult(
+                result_type=result_type,
+                value=detected_event,
+                metadata={
+                    "api_call_time": api_call_time,
+                    **llm_call_metadata,
+                    "evaluation_source": EVALUATION_SOURCE,
+                    # The LLM call is shared by the events of the batch: it's stored once
+                    "llm_call": llm_call if len(results) == 0 else None,
+                    "batched_event_names": list(events_by_name.keys()),
+                    "score_range": score_range,
+                },
+            )
+
+    # Fallback: detect the events without a valid answer one by one
+    missing_event_names = [name for name in events_by_name if name not in results]
+    if len(missing_event_names) > 0:
+        fallback_results = await asyncio.gather(
+            *[
+                event_detection(
+                    message,
+                    event_name=event_name,
+                    event_description=events_by_name[event_name].get(
+                        "event_description"
+                    ),
+                    score_range_settings=events_by_name[event_name][
+                        "score_range_settings"
+                    ],
+                    detection_scope=detection_scope,
+                    model=model,
+                )
+                for event_name in missing_event_names
+            ]
+        )
+        results.update(zip(missing_event_names, fallback_results))
+    return results
+
+
+# Workload -> (message.id, event names of the batch) -> Future of the results of the batch
+_event_detection_batches: "weakref.WeakKeyDictionary[Any, Dict[Tuple[str, ...], Tuple[concurrent.futures.Future, set]]]" = weakref.WeakKeyDictionary()
+_event_detection_batches_lock = threading.Lock()
+
+
+def clear_event_detection_batches(
+    workload: Any, message_id: Optional[str] = None
+) -> None:
+    """
+    Forget the results of the batched_event_detection jobs of the workload, on all the
+    messages or on message_id only. Called by the workload once the jobs completed: the
+    jobs of a batch that didn't run (eg. sampled out or checkpointed) never read them.
+    """
+    with _event_detection_batches_lock:
+        batches = _event_detection_batches.get(workload)
+        if batches is None:
+            return
+        if message_id is None:
+            batches.clear()
+            return
+        for key in [key for key in batches if key[0] == message_id]:
+            del batches[key]
+
+
+def _get_event_detection_batch(
+    workload: Any, event_name: str, event_scope: str, model: str, batch_size: int
+) -> List[Dict[str, Any]]:
+    """
+    Returns the configs of the batched_event_detection jobs of the workload that are
+    detected in the same LLM call as event_name: the jobs with the same scope and model,
+    in chunks of batch_size.
+    """
+    compatible_configs = [
+        job.config.model_dump()
+        for job in workload.jobs.values()
+        if job.job_function is batched_event_detection
+        and getattr(job.config, "event_scope", "task") == event_scope
+        and getattr(job.config, "model", "azure:gpt-4o") == model
+        and getattr(job.config, "batch_size", batch_size) == batch_size
+    ]
+    for i in range(0, len(compatible_configs), batch_size):
+        batch = compatible_configs[i : i + batch_size]
+        if any(event["event_name"] == event_name for event in batch):
+            return batch
+    return []
+
+
+async def batched_event_detection(
+    message: Message,
+    event_name: str,
+    event_description: Optional[str] = None,
+    score_range_settings: Optional[ScoreRangeSettings] = None,
+    event_scope: DetectionScope = "task",
+    model: str = "azure:gpt-4o",
+    batch_size: int = config.EVENT_DETECTION_BATCH_SIZE,
+    workload: Any = None,
+    **kwargs,
+) -> JobResult:
+    """
+    Detects if an event is present in a message, like event_detection, but the event is
+    detected in the same LLM call as up to batch_size - 1 other batched_event_detection jobs
+    of the workload with the same event_scope and model (see multi_event_detection).
+
+    The first job of a batch to run on a message makes the call. The other jobs of the batch
+    reuse its results.
+    """
+    batch = (
+        _get_event_detection_batch(workload, event_name, event_scope, model, batch_size)
+        if workload is not None and batch_size > 1
+        else []
+    )
+    if len(batch) <= 1:
+        return await event_detection(
+            message,
+            event_name=event_name,
+            event_description=event_description,
+            score_range_settings=score_range_settings,
+            detection_scope=event_scope,
+            model=model,
+        )
+
+    key = (message.id, *[event["event_name"] for event in batch])
+    with _event_detection_batches_lock:
+        batches = _event_detection_batches.setdefault(workload, {})
+        is_first_job = key not in batches
+        if is_first_job:
+            # The future is shared with the jobs of the batch, which may run in other
+            # threads and event loops. It's removed once all of them got their result.
+            batches[key] = (concurrent.futures.Future(), set(key[1:]))
+        future, remaining_event_names = batches[key]
+
+    if is_first_job:
+        try:
+            future.set_result(
+                await multi_event_detection(
+                    message, batch, detection_scope=event_scope, model=model
+                )
+            )
+        except BaseException as e:
+            future.set_exception(e)
+    try:
+        results = await asyncio.wrap_future(future)
+    finally:
+        with _event_detection_batches_lock:
+            remaining_event_names.discard(event_name)
+            if len(remaining_event_names) == 0:
+                _event_detection_batches.get(workload, {}).pop(key, None)
+    return results[event_name].model_copy()
+
+
 async def evaluate_task(
     message: Message,
     model: str = "openai:gpt-4o",
@@ -752,6 +1177,7 @@ async def evaluate_task(
 
     # Additional metadata
     api_call_time: Optional[float] = None
+    llm_call_metadata: Dict[str, Any] = {}
     llm_call: Optional[dict] = None
 
     async def evaluation(
@@ -765,6 +1191,7 @@ async def evaluate_task(
         """
         nonlocal api_call_time
         nonlocal llm_call
+        nonlocal llm_call_metadata
 
         if not fits_in_context_window(prompt, max_tokens_input_lenght):
             logger.error("The prompt does not fit in the context window")
@@ -772,8 +1199,10 @@ async def evaluate_task(
             return None
 
         start_time = time.time()
-        response = await async_openai_client.chat.completions.create(
-            model=model_name,
+        response, llm_call_metadata = await cached_chat_completion(
+            async_openai_client,
+            provider,
+            model_name,
             messages=[
                 {
                     "role": "system",
@@ -786,7 +1215,7 @@ async def evaluate_task(
         )
 
         llm_response = response.choices[0].message.content
-        api_call_time = time.time() - start_time
+        api_call_time = time.time() - start_time - llm_call_metadata["rate_limit_delay"]
 
         llm_call = {
             "model": model_name,
@@ -873,6 +1302,7 @@ Give a positive answer if the assistant response was good, to the point, and rel
         logs=[prompt, flag],
         metadata={
             "api_call_time": api_call_time,
+            **llm_call_metadata,
             "llm_call": llm_call,
         },
     )
@@ -904,95 +1334,21 @@ async def keyword_event_detection(
 ) -> JobResult:
     """
     Uses regexes to detect if an event is present in a message.
-    """
-    from re import search
-
-    listExchangeToSearch: List[str] = []
-    if event_scope == "task":
-        listExchangeToSearch = [message.latest_interaction()]
-    elif event_scope == "task_input_only":
-        message_list = message.as_list()
-        # Filter to keep only the user messages
-        listExchangeToSearch = [
-            " " + m.content + " " for m in message_list if m.role.lower() == "user"
-        ]
-    elif event_scope == "task_output_only":
-        message_list = message.as_list()
-        # Filter to keep only the assistant messages
-        listExchangeToSearch = [
-            " " + m.content + " " for m in message_list if m.role.lower() == "assistant"
-        ]
-    elif event_scope == "session":
-        listExchangeToSearch = [
-            message.transcript(with_role=True, with_previous_messages=True)
-        ]
-    elif event_scope == "system_prompt":
-        message_task: Optional[Task] = message.metadata.get("task")
-        if not isinstance(message_task, Task):
-            return JobResult(
-                result_type=ResultType.error,
-                value=None,
-                logs=["No task in the message"],
-            )
-        if not isinstance(message_task.metadata, dict):
-            return JobResult(
-                result_type=ResultType.error,
-                value=None,
-                logs=["No metadata in the task"],
-            )
-        system_prompt_in_message = message_task.metadata.get("system_prompt", None)
-        if system_prompt_in_message is None:
-            return JobResult(
-                result_type=ResultType.error,
-                value=None,
-                logs=["No system_prompt in the task metadata"],
-            )
-        if not isinstance(system_prompt_in_message, str):
-            return JobResult(
-                result_type=ResultType.error,
-                value=None,
-                logs=["system_prompt in the message is not a string"],
-            )
-        listExchangeToSearch = [system_prompt_in_message]
-    else:
-        raise ValueError(
-            f"Unknown event_scope : {event_scope}. Valid values are: {DetectionScope.__args__}"
-        )
 
+    To detect the keyword events of many messages at once, use lab.PatternMatcher.
+    """
+    text, empty_result = get_text_to_search(message, event_scope)
+    if empty_result is not None:
+        return empty_result
     # text to look into for the keywords
-    text = " ".join(listExchangeToSearch).lower()
-
-    # [ ,.:'/\n\r\t+=]{1} is used to match the keyword only if it is a separate word, because we don't want to match substrings
-    keywordlist = [
-        "[ ,.:'/\n\r\t+=]{1}"
-        + keyword.strip().lower()  # we match the keyword in the middle of the text
-        + "[ ,.:'/\n\r\t+=]{1}|^"
-        + keyword.strip().lower()  # we match the keyword at the beginning of the text
-        + "[ ,:'/.\n\r\t]{1}"
-        + "|[ ,:'/.\n\r\t]{1}"
-        + keyword.strip().lower()  # we match the keyword at the end of the text
-        + "$"
-        for keyword in keywords.split(",")
-    ]
-
-    # we use a regex pattern to match the keywords in the text
-    regex_pattern = "|".join(keywordlist)
+    text = cast(str, text).lower()
 
     try:
-        result = search(regex_pattern, text)
-        found = result is not None
+        # The regex is compiled once for all the messages
+        regex = compile_keywords(keywords)
+        found = regex.search(text) is not None
 
-        return JobResult(
-            result_type=ResultType.bool,
-            value=found,
-            logs=[text, regex_pattern],
-            metadata={
-                "evaluation_source": "phospho-keywords",
-                "score_range": ScoreRange(
-                    score_type="confidence", max=1, min=0, value=1 if found else 0
-                ),
-            },
-        )
+        return detection_result(found, "phospho-keywords", logs=[text, regex.pattern])
 
     except Exception as e:
         return JobResult(
@@ -1011,79 +1367,19 @@ async def regex_event_detection(
 ) -> JobResult:
     """
     Uses regexes to detect if an event is present in a message.
-    """
-    from re import search
 
-    listExchangeToSearch: List[str] = []
-    if event_scope == "task":
-        listExchangeToSearch = [message.latest_interaction()]
-
-    elif event_scope == "task_input_only":
-        message_list = message.as_list()
-        # Filter to keep only the user messages
-        listExchangeToSearch = [
-            " " + m.content + " " for m in message_list if m.role.lower() == "user"
-        ]
-    elif event_scope == "task_output_only":
-        message_list = message.as_list()
-        # Filter to keep only the assistant messages
-        listExchangeToSearch = [
-            " " + m.content + " " for m in message_list if m.role.lower() == "assistant"
-        ]
-    elif event_scope == "session":
-        listExchangeToSearch = [
-            message.transcript(with_role=True, with_previous_messages=True)
-        ]
-    elif event_scope == "system_prompt":
-        message_task: Optional[Task] = message.metadata.get("task")
-        if not isinstance(message_task, Task):
-            return JobResult(
-                result_type=ResultType.error,
-                value=None,
-                logs=["No task in the message"],
-            )
-        if not isinstance(message_task.metadata, dict):
-            return JobResult(
-                result_type=ResultType.error,
-                value=None,
-                logs=["No metadata in the task"],
-            )
-        system_prompt_in_message = message_task.metadata.get("system_prompt", None)
-        if system_prompt_in_message is None:
-            return JobResult(
-                result_type=ResultType.error,
-                value=None,
-                logs=["No system_prompt in the task metadata"],
-            )
-        if not isinstance(system_prompt_in_message, str):
-            return JobResult(
-                result_type=ResultType.error,
-                value=None,
-                logs=["system_prompt in the message is not a string"],
-            )
-        listExchangeToSearch = [system_prompt_in_message]
-    else:
-        raise ValueError(
-            f"Unknown event_scope : {event_scope}. Valid values are: {DetectionScope.__args__}"
-        )
-
-    text = " ".join(listExchangeToSearch)
+    To detect the regex events of many messages at once, use lab.PatternMatcher.
+    """
+    text, empty_result = get_text_to_search(message, event_scope)
+    if empty_result is not None:
+        return empty_result
+    text = cast(str, text)
 
     try:
-        result = search(regex_pattern, text)
-        found = result is not None
+        # The regex is compiled once for all the messages
+        found = compile_regex(regex_pattern).search(text) is not None
 
-        return JobResult(
-            result_type=ResultType.bool,
-            value=found,
-            logs=[text, regex_pattern],
-            metadata={
-                "evaluation_source": "phospho-regex",
-                "score_range": ScoreRange(
-                    score_type="confidence", max=1, min=0, value=1 if found else 0
-                ),
-            },
-        )
+        return detection_result(found, "phospho-regex", logs=[text, regex_pattern])
 
     except Exception as e:
         return JobResult(
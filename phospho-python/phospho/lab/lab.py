@@ -2,17 +2,25 @@ import asyncio
 import concurrent.futures
 import itertools
 import logging
+import math
+import operator
+import os
+import pickle
 import random
+import threading
 from typing import (
     Any,
+    AsyncIterator,
     Awaitable,
     Callable,
     Dict,
     Iterable,
+    Iterator,
     List,
     Literal,
     Optional,
     Protocol,
+    Set,
     Tuple,
     Union,
 )
@@ -20,8 +28,12 @@ from typing import (
 from tqdm import tqdm
 
 import phospho.client as client
+import phospho.config as phospho_config
 import phospho.lab.job_library as job_library
 
+from .checkpoints import CheckpointStore
+from .language_models import aclose_clients
+from .matchers import PatternMatcher
 from .models import (
     EvenConfigForRegex,
     EventConfig,
@@ -39,6 +51,88 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 
+class _ThreadEventLoops:
+    """
+    One event loop per worker thread, reused by all the jobs run by the thread, instead of
+    a new event loop per job. The LLM clients are cached per event loop, so the jobs of a
+    thread share their connections. Closing closes the clients and the event loops.
+    """
+
+    def __init__(self) -> None:
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.loops: List[asyncio.AbstractEventLoop] = []
+
+    def run(self, coroutine: Awaitable[Any]) -> Any:
+        loop = getattr(self.local, "loop", None)
+        if loop is None:
+            loop = asyncio.new_event_loop()
+            self.local.loop = loop
+            with self.lock:
+                self.loops.append(loop)
+        return loop.run_until_complete(coroutine)
+
+    def close(self) -> None:
+        with self.lock:
+            loops, self.loops = self.loops, []
+        for loop in loops:
+            try:
+                loop.run_until_complete(aclose_clients())
+                loop.run_until_complete(loop.shutdown_asyncgens())
+            finally:
+                loop.close()
+
+    def __enter__(self) -> "_ThreadEventLoops":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+# (job_id, job_function, config, metadata) of a job run in another process
+JobSpec = Tuple[str, Callable[..., Any], JobConfig, Optional[Dict[str, Any]]]
+# Messages and the ids of the jobs to run on every message
+MessagesChunk = List[Tuple[Message, List[str]]]
+
+
+def _run_jobs_in_process(
+    job_specs: List[JobSpec], chunk: MessagesChunk
+) -> List[Tuple[str, str, JobResult]]:
+    """
+    Run the jobs on a chunk of messages, in a worker process of executor_type="process".
+
+    :returns: The (message.id, job_id, result) of every job run.
+    """
+    workload = Workload()
+    for job_id, job_function, config, metadata in job_specs:
+        workload.add_job(
+            Job(id=job_id, job_function=job_function, config=config, metadata=metadata)
+        )
+
+    async def run_chunk() -> List[Tuple[str, str, JobResult]]:
+        results = []
+        for message, job_ids in chunk:
+            for job_id in job_ids:
+                try:
+                    result = await workload.jobs[job_id].async_run(
+                        message, store_result=False
+                    )
+                except Exception as e:
+                    # Don't lose the results of the rest of the chunk
+                    logger.error(f"Job {job_id} failed on message {message.id}: {e}")
+                    result = JobResult(
+                        result_type=ResultType.error, value=None, logs=[str(e)]
+                    )
+                # Set back by the main process, no need to send it
+                result.job_metadata = {}
+                result.job_id = job_id
+                results.append((message.id, job_id, result))
+        await aclose_clients()
+        return results
+
+    return asyncio.run(run_chunk())
+
+
 class Job:
     id: str
     job_function: Union[
@@ -54,6 +148,12 @@ class Job:
     alternative_results: List[Dict[str, JobResult]]
     # Stores all the possible config from the model
     alternative_configs: List[JobConfig]
+    # For each alternative config, the number of results compared to the results and
+    # the number of them that agree. Used to stop evaluating the configs early.
+    alternative_nb_compared: List[int]
+    alternative_nb_agreements: List[int]
+    # For each alternative config, whether its evaluation was stopped early
+    alternative_stopped: List[bool]
 
     metadata: Optional[Dict[str, Any]] = None
     workload: Optional["Workload"] = None
@@ -147,15 +247,33 @@ class Job:
         self.alternative_results = []
         for c in self.alternative_configs:
             self.alternative_results.append({})
+        self.alternative_nb_compared = [0] * len(self.alternative_configs)
+        self.alternative_nb_agreements = [0] * len(self.alternative_configs)
+        self.alternative_stopped = [False] * len(self.alternative_configs)
 
         self.metadata = metadata
         self.workload = workload
         self.sample = sample
 
-    async def async_run(self, message: Message) -> JobResult:
+    async def async_run(self, message: Message, store_result: bool = True) -> JobResult:
         """
         Asynchronously run the job on a single message.
+
+        :param store_result: Whether to store the result in the results attribute.
         """
+        checkpoint_store = (
+            self.workload.checkpoint_store if self.workload is not None else None
+        )
+        if checkpoint_store is not None:
+            # Completed by a previous run
+            result = checkpoint_store.get(message.id, self.id)
+            if result is not None:
+                logger.debug(f"Job {self.id} on message {message.id} is checkpointed.")
+                result.job_metadata = self.metadata
+                if store_result:
+                    self.results[message.id] = result
+                return result
+
         logger.debug(f"Running job {self.id} on message {message.id}.")
         params = self.config.model_dump()
 
@@ -185,16 +303,91 @@ class Job:
         result.job_id = self.id
         result.job_metadata = self.metadata
         # Store the result
-        self.results[message.id] = result
+        if store_result:
+            self.results[message.id] = result
+        if checkpoint_store is not None:
+            checkpoint_store.set(message.id, self.id, result)
 
         return result
 
+    async def _async_run_alternative_config(
+        self, message: Message, alternative_config_index: int
+    ) -> JobResult:
+        params = self.alternative_configs[alternative_config_index].model_dump()
+        if asyncio.iscoroutinefunction(self.job_function):
+            job_result = await self.job_function(message, **params)
+        else:
+            job_result = self.job_function(message, **params)
+
+        if job_result is None:
+            logger.error(
+                f"Job {self.id} returned None for message {message.id} on alternative config run."
+            )
+            job_result = JobResult(
+                result_type=ResultType.error,
+                value=None,
+            )
+        # Add the job_id to the result
+        job_result.job_id = self.id
+        job_result.job_metadata = self.metadata
+        return job_result
+
+    def _can_reach_accuracy(
+        self,
+        alternative_config_index: int,
+        accuracy_threshold: float,
+        nb_messages: Optional[int] = None,
+        confidence: float = phospho_config.ALTERNATIVE_CONFIGS_STOPPING_CONFIDENCE,
+    ) -> bool:
+        """
+        Sequential test of the agreement of an alternative config with the results, after
+        each compared result. Returns False if the config can't reach the accuracy_threshold:
+        - If the number of messages is known, when the accuracy would stay below the
+        threshold even if all the remaining results agree.
+        - Otherwise, when the threshold is 1 and a result disagrees.
+        - In both cases, when the upper bound of the agreement rate at this confidence
+        is below the threshold. The bound is checked after every result, so it must hold
+        at every check: it's Hoeffding's inequality with a risk of
+        (1 - confidence) / (n * (n + 1)) after n results. By the union bound, a config whose
+        agreement rate reaches the threshold is wrongly stopped with a probability of at
+        most 1 - confidence.
+        """
+        nb_compared = self.alternative_nb_compared[alternative_config_index]
+        nb_agreements = self.alternative_nb_agreements[alternative_config_index]
+        if nb_compared == 0:
+            return True
+        if nb_messages is not None:
+            nb_remaining = max(nb_messages - nb_compared, 0)
+            if nb_agreements + nb_remaining < accuracy_threshold * max(
+                nb_messages, nb_compared
+            ):
+                return False
+        elif accuracy_threshold >= 1 and nb_agreements < nb_compared:
+            return False
+        risk = (1 - confidence) / (nb_compared * (nb_compared + 1))
+        upper_bound = nb_agreements / nb_compared + math.sqrt(
+            math.log(1 / risk) / (2 * nb_compared)
+        )
+        return upper_bound >= accuracy_threshold
+
     async def async_run_on_alternative_configurations(
-        self, message: Message
+        self,
+        message: Message,
+        accuracy_threshold: Optional[float] = None,
+        nb_messages: Optional[int] = None,
     ) -> List[Dict[str, JobResult]]:
         """
         Asynchronously run the job on the message in all the alternative configurations, except the default.
         Results are appended to the job_predictions attribute.
+
+        The alternative configurations are run concurrently. Their calls to the LLM share
+        the rate limits of the models.
+
+        :param accuracy_threshold: If set, the results are compared to the results of the
+            job on the message (if it ran on it). The configurations that can't reach this
+            accuracy are no longer run on the next messages.
+        :param nb_messages: The number of messages the alternative configurations are run
+            on, if known. This allows to stop the configurations sooner.
         """
         if len(self.alternative_configs) == 0:
             logger.warning(
@@ -202,29 +395,62 @@ class Job:
             )
             return [{}]
 
-        for alternative_config_index in range(0, len(self.alternative_configs)):
-            params = self.alternative_configs[alternative_config_index].model_dump()
-            if asyncio.iscoroutinefunction(self.job_function):
-                job_result = await self.job_function(message, **params)
-            else:
-                job_result = self.job_function(message, **params)
+        alternative_config_indexes = [
+            alternative_config_index
+            for alternative_config_index in range(0, len(self.alternative_configs))
+            if not self.alternative_stopped[alternative_config_index]
+        ]
+        job_results = await asyncio.gather(
+            *[
+                self._async_run_alternative_config(message, alternative_config_index)
+                for alternative_config_index in alternative_config_indexes
+            ]
+        )
 
-            if job_result is None:
-                logger.error(
-                    f"Job {self.id} returned None for message {message.id} on alternative config run."
-                )
-                job_result = JobResult(
-                    result_type=ResultType.error,
-                    value=None,
-                )
-            # Add the job_id to the result
-            job_result.job_id = self.id
-            job_result.job_metadata = self.metadata
+        reference_result = self.results.get(message.id)
+        for alternative_config_index, job_result in zip(
+            alternative_config_indexes, job_results
+        ):
             # Add the prediction to the alternative_results
             self.alternative_results[alternative_config_index][message.id] = job_result
+            if accuracy_threshold is None or reference_result is None:
+                continue
+            self.alternative_nb_compared[alternative_config_index] += 1
+            if job_result.value == reference_result.value:
+                self.alternative_nb_agreements[alternative_config_index] += 1
+            if not self._can_reach_accuracy(
+                alternative_config_index, accuracy_threshold, nb_messages
+            ):
+                logger.info(
+                    f"Job {self.id}: Alternative config {alternative_config_index} agrees on "
+                    + f"{self.alternative_nb_agreements[alternative_config_index]}/"
+                    + f"{self.alternative_nb_compared[alternative_config_index]} results and can't "
+                    + f"reach the accuracy {accuracy_threshold}. Stopping its evaluation."
+                )
+                self.alternative_stopped[alternative_config_index] = True
 
         return self.alternative_results
 
+    def _alternative_accuracies(self) -> List[Optional[float]]:
+        """
+        The accuracy of each alternative config compared to the results, or None if its
+        evaluation was stopped.
+        """
+        keys = list(self.results.keys())
+        # Results are considered the groundtruth. Compare the alternative results to this ref
+        reference_values = [self.results[key].value for key in keys]
+        accuracies: List[Optional[float]] = []
+        for alternative_config_index, alternative_result in enumerate(
+            self.alternative_results
+        ):
+            if self.alternative_stopped[alternative_config_index]:
+                accuracies.append(None)
+                continue
+            alternative_values = [alternative_result[key].value for key in keys]
+            nb_agreements = sum(map(operator.eq, alternative_values, reference_values))
+            accuracies.append(nb_agreements / len(keys))
+        return accuracies
+
     def optimize(self, accuracy_threshold: float = 1.0, min_count: int = 10) -> None:
         """
         After having run the job on all the alternative configurations,
@@ -232,7 +458,8 @@ class Job:
         - If the current configuration is the optimal, do nothing.
         - If the current configuration is not the optimal, update the config attribute.
 
-        For now, we just check if the accuracy is above the threshold.
+        For now, we just check if the accuracy is above the threshold. The configurations
+        whose evaluation was stopped early are below the threshold.
         """
         # Check that the alternative_results are not empty
         if len(self.alternative_results) == 0:
@@ -244,8 +471,14 @@ class Job:
             return
 
         # Check that each alternative_result is each the same length as the results
-        for alternative_result in self.alternative_results:
-            if len(alternative_result) != len(self.results):
+        for alternative_config_index, alternative_result in enumerate(
+            self.alternative_results
+        ):
+            if self.alternative_stopped[alternative_config_index]:
+                continue
+            if len(alternative_result) != len(self.results) or any(
+                key not in alternative_result for key in self.results
+            ):
                 logger.error(
                     "Can't run Workload.optimize(): The alternative_results are not the same length as the results. Skipping."
                 )
@@ -258,30 +491,17 @@ class Job:
             )
             return
 
-        accuracies: List[float] = []
-        # For each alternative config, we compute the accuracy_vector
-        for alternative_config_index in range(0, len(self.alternative_configs)):
-            # Results are considered the groundtruth. Compare the alternative results to this ref
-            accuracy_vector = [
-                1
-                if self.alternative_results[alternative_config_index][key].value
-                == self.results[key].value
-                else 0
-                for key in self.results
-            ]
-
-            accuracy = sum(accuracy_vector) / len(accuracy_vector)
-            accuracies.append(accuracy)
-
+        accuracies = self._alternative_accuracies()
         logger.info(f"Accuracies: {accuracies}")
 
         # The latest items are the most preferred ones
         # The instanciated config is the reference one (most truthful)
         # We want to take the latest one that is above the threshold.
         for i in range(len(accuracies) - 1, -1, -1):
-            if accuracies[i] >= accuracy_threshold:
+            accuracy = accuracies[i]
+            if accuracy is not None and accuracy >= accuracy_threshold:
                 logger.info(
-                    f"Found a less costly config with accuracy of {accuracies[i]}. Swapping to it."
+                    f"Found a less costly config with accuracy of {accuracy}. Swapping to it."
                 )
                 # This configuration becames the default configuration
                 self.config = self.alternative_configs[i]
@@ -291,6 +511,9 @@ class Job:
                 # We drop the results of the other sub-optimal configurations
                 # Might be an empty list
                 self.alternative_results = self.alternative_results[i + 1 :]
+                self.alternative_nb_compared = self.alternative_nb_compared[i + 1 :]
+                self.alternative_nb_agreements = self.alternative_nb_agreements[i + 1 :]
+                self.alternative_stopped = self.alternative_stopped[i + 1 :]
                 break
 
     def __repr__(self):
@@ -321,7 +544,14 @@ class Workload:
     project_id: Optional[str] = None
     org_id: Optional[str] = None
 
-    def __init__(self, jobs: Optional[List[Union[Job, MessageCallable]]] = None):
+    # If set, the results are checkpointed and the completed jobs are not run again
+    checkpoint_store: Optional[CheckpointStore] = None
+
+    def __init__(
+        self,
+        jobs: Optional[List[Union[Job, MessageCallable]]] = None,
+        checkpoint_store: Optional[CheckpointStore] = None,
+    ):
         """
         A Workload is a set of jobs to be performed on messages.
 
@@ -338,9 +568,14 @@ class Workload:
 
         await workload.async_run(messages)
         ```
+
+        :param checkpoint_store: Where to checkpoint the results as the jobs complete. The
+            jobs already completed on a message (eg. by a run that was interrupted) are
+            not run again. See `lab.SQLiteCheckpointStore`.
         """
         self.jobs = {}
         self._results = None
+        self.checkpoint_store = checkpoint_store
 
         if jobs is not None:
             for job in jobs:
@@ -439,8 +674,17 @@ class Workload:
 
     @classmethod
     def from_phospho_events(
-        cls, event_definitions: List[EventDefinition]
+        cls,
+        event_definitions: List[EventDefinition],
+        batch_size: int = phospho_config.EVENT_DETECTION_BATCH_SIZE,
     ) -> "Workload":
+        """
+        Create a workload with a detection job per event.
+
+        :param batch_size: Number of events with the llm_detection engine and the same
+            detection_scope that are detected in the same LLM call. If 1, every event is
+            detected with its own LLM call.
+        """
         workload = cls()
 
         for event_definition in event_definitions:
@@ -452,7 +696,22 @@ class Workload:
             )
 
             # We stick to the LLM detection engine
-            if event_definition.detection_engine == "llm_detection":
+            if event_definition.detection_engine == "llm_detection" and batch_size > 1:
+                workload.add_job(
+                    Job(
+                        id=event_name,
+                        job_function=job_library.batched_event_detection,
+                        config=EventConfig(
+                            event_name=event_name,
+                            event_description=event_definition.description,
+                            event_scope=event_definition.detection_scope,
+                            score_range_settings=event_definition.score_range_settings,
+                            batch_size=batch_size,
+                        ),
+                        metadata=event_definition.model_dump(),
+                    )
+                )
+            elif event_definition.detection_engine == "llm_detection":
                 workload.add_job(
                     Job(
                         id=event_name,
@@ -547,18 +806,24 @@ class Workload:
     def from_phospho_project_config(
         cls,
         project_config: Project,
+        batch_size: int = phospho_config.EVENT_DETECTION_BATCH_SIZE,
     ):
         """
         Create a workload from a phospho project configuration.
 
         To fetch the project configuration, look at `Workload.from_phospho()`
+
+        :param batch_size: Number of events detected in the same LLM call. See
+            `Workload.from_phospho_events()`
         """
         project_events = project_config.settings.events
         if project_events is None:
             logger.warning(f"Project with id {project_config.id} has no event setup")
             return cls()
 
-        workload = cls.from_phospho_events(list(project_events.values()))
+        workload = cls.from_phospho_events(
+            list(project_events.values()), batch_size=batch_size
+        )
         workload.project_id = project_config.id
         workload.org_id = project_config.org_id
         return workload
@@ -587,20 +852,31 @@ class Workload:
     async def async_run(
         self,
         messages: Iterable[Message],
-        executor_type: Literal["parallel", "sequential", "parallel_jobs"] = "parallel",
+        executor_type: Literal[
+            "parallel", "sequential", "parallel_jobs", "process"
+        ] = "parallel",
         max_parallelism: int = 10,
+        chunk_size: Optional[int] = None,
     ) -> Dict[str, Dict[str, JobResult]]:
         """
         Runs all the jobs on the message.
 
         Args:
         :param messages: The messages to run the jobs on.
-        :param executor_type: The type of executor to use. Can be "parallel" or "sequential".
-        :param max_parallelism: The maximum number of parallel jobs to run per seconds.
-            Use this to adhere to rate limits. Only used if executor_type is "parallel" or "parallel_jobs".
+        :param executor_type: The type of executor to use. Can be "parallel", "parallel_jobs",
+            "sequential" or "process". "process" runs the jobs in a pool of processes, for
+            CPU-bound jobs: the job functions and configs must be picklable.
+        :param max_parallelism: The maximum number of jobs running concurrently. Only used if
+            executor_type is "parallel" or "parallel_jobs". The LLM calls of the jobs are also
+            rate limited per provider and model: see `lab.set_rate_limits`. With "process",
+            the number of processes, up to the number of CPUs.
+        :param chunk_size: With "process", the number of messages sent to a process at once.
+            By default, the messages are split in about 4 chunks per process.
 
         Returns: a mapping of message.id -> job_id -> job_result
         """
+        # The batched jobs don't reuse the LLM calls of a previous run
+        job_library.clear_event_detection_batches(self)
 
         # Run the jobs sequentially on every message
         # TODO : For Jobs, implement a batched_run method that takes a list of messages
@@ -615,7 +891,7 @@ class Workload:
                     t = tqdm()
 
                 async def job_limit_wrap(message: Message):
-                    # Account for the semaphore (rate limit, max_parallelism)
+                    # Account for the semaphore (max_parallelism)
                     async with semaphore:
                         if job.sample >= 1 or random.random() < job.sample:
                             await job.async_run(message)
@@ -641,18 +917,18 @@ class Workload:
 
             async def message_job_limit_wrap(message_and_job: Tuple[Message, Job]):
                 message, job = message_and_job
-                if job.sample >= 1 or random.random() < job.sample:
-                    await job.async_run(message)
+                # Account for the semaphore (max_parallelism)
+                async with semaphore:
+                    if job.sample >= 1 or random.random() < job.sample:
+                        await job.async_run(message)
                 # Update the progress bar
                 t.update()
 
-            async with semaphore:
-                # Account for the semaphore (rate limit, max_parallelism)
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    # Submit tasks to the executor
-                    executor_results = executor.map(
-                        message_job_limit_wrap, messages_and_jobs
-                    )
+            with concurrent.futures.ThreadPoolExecutor() as executor:
+                # Submit tasks to the executor
+                executor_results = executor.map(
+                    message_job_limit_wrap, messages_and_jobs
+                )
 
             t.display()
             await asyncio.gather(*executor_results)
@@ -662,10 +938,32 @@ class Workload:
                 for one_message in tqdm(messages):
                     if job.sample >= 1 or random.random() < job.sample:
                         await job.async_run(one_message)
+        elif executor_type == "process":
+            executor, job_specs, chunk_size = self._process_executor(
+                messages, max_parallelism, chunk_size
+            )
+            loop = asyncio.get_running_loop()
+            with executor:
+                with tqdm(
+                    total=len(messages) if hasattr(messages, "__len__") else None
+                ) as t:
+                    futures = [
+                        loop.run_in_executor(
+                            executor, _run_jobs_in_process, job_specs, chunk
+                        )
+                        for chunk in self._messages_chunks(messages, chunk_size)
+                    ]
+                    for future in asyncio.as_completed(futures):
+                        chunk_results = await future
+                        self._store_process_results(chunk_results)
+                        t.update(
+                            len({message_id for message_id, _, _ in chunk_results})
+                        )
         else:
             raise NotImplementedError(
                 f"Executor type {executor_type} is not implemented"
             )
+        job_library.clear_event_detection_batches(self)
 
         # Collect the results:
         # Result is a mapping of message.id -> job_id -> job_result
@@ -680,35 +978,160 @@ class Workload:
         self._results = results
         return results
 
+    async def astream(
+        self,
+        messages: Iterable[Message],
+        max_parallelism: int = 10,
+        keep_results: bool = False,
+    ) -> AsyncIterator[Tuple[str, str, JobResult]]:
+        """
+        Runs all the jobs on the messages, and yields the results as soon as they are
+        available, in the order they complete. Use this to process the results in
+        micro-batches instead of waiting for the whole workload.
+
+        ```python
+        async for message_id, job_id, job_result in workload.astream(messages):
+            ...
+        ```
+
+        The messages are consumed lazily: with keep_results=False, the memory used doesn't
+        grow with the number of messages.
+
+        If the workload has a checkpoint_store, the jobs already completed on a message by
+        a previous run are skipped, and their results are not yielded again.
+
+        Args:
+        :param messages: The messages to run the jobs on. Can be a generator.
+        :param max_parallelism: The maximum number of jobs running concurrently.
+        :param keep_results: Whether to also store the results in the jobs and the workload,
+            as async_run does.
+
+        Yields: (message.id, job_id, job_result)
+        """
+        if keep_results and self._results is None:
+            self._results = {}
+
+        async def run_job(message: Message, job: Job) -> Tuple[str, str, JobResult]:
+            job_result = await job.async_run(message, store_result=keep_results)
+            return message.id, job.id, job_result
+
+        def jobs_to_run() -> Iterator[Tuple[Message, Job]]:
+            for message in messages:
+                for job in self.jobs.values():
+                    if self.checkpoint_store is not None:
+                        job_result = self.checkpoint_store.get(message.id, job.id)
+                        if job_result is not None:
+                            job_result.job_metadata = job.metadata
+                            if keep_results and self._results is not None:
+                                job.results[message.id] = job_result
+                                self._results.setdefault(message.id, {})[job.id] = (
+                                    job_result
+                                )
+                            continue
+                    if job.sample >= 1 or random.random() < job.sample:
+                        yield message, job
+
+        pending: Set[asyncio.Task] = set()
+        jobs_iterator = jobs_to_run()
+        # message.id -> number of jobs running on it. The jobs of a message are started
+        # before the ones of the next message.
+        nb_running_jobs: Dict[str, int] = {}
+        last_started_message_id: Optional[str] = None
+
+        def on_message_done(message_id: str) -> None:
+            # The batched jobs of the message that didn't run never read their results
+            del nb_running_jobs[message_id]
+            job_library.clear_event_detection_batches(self, message_id)
+
+        job_library.clear_event_detection_batches(self)
+        try:
+            while True:
+                # Start jobs until max_parallelism jobs are running
+                for message, job in itertools.islice(
+                    jobs_iterator, max(max_parallelism - len(pending), 0)
+                ):
+                    if (
+                        last_started_message_id is not None
+                        and last_started_message_id != message.id
+                        and nb_running_jobs.get(last_started_message_id) == 0
+                    ):
+                        on_message_done(last_started_message_id)
+                    last_started_message_id = message.id
+                    nb_running_jobs[message.id] = nb_running_jobs.get(message.id, 0) + 1
+                    pending.add(asyncio.ensure_future(run_job(message, job)))
+                if not pending:
+                    return
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for finished in done:
+                    message_id, job_id, job_result = finished.result()
+                    nb_running_jobs[message_id] -= 1
+                    if (
+                        nb_running_jobs[message_id] == 0
+                        and message_id != last_started_message_id
+                    ):
+                        on_message_done(message_id)
+                    if self.org_id is not None or self.project_id is not None:
+                        job_result.org_id = self.org_id
+                        job_result.project_id = self.project_id
+                    if keep_results and self._results is not None:
+                        self._results.setdefault(message_id, {})[job_id] = job_result
+                    yield message_id, job_id, job_result
+        finally:
+            # The caller stopped iterating, or a job failed
+            for task in pending:
+                task.cancel()
+            job_library.clear_event_detection_batches(self)
+
     async def async_run_on_alternative_configurations(
         self,
         messages: Iterable[Message],
         executor_type: Literal["parallel", "sequential"] = "parallel",
+        accuracy_threshold: Optional[float] = None,
+        max_parallelism: int = 10,
     ) -> None:
         """
-        Runs all the jobs on the message.
-
-        Returns: a mapping of message.id -> job_id -> job_result
+        Runs all the jobs on the message, in all their alternative configurations.
+
+        :param executor_type: If "parallel", the jobs run concurrently on up to
+            max_parallelism messages, and the alternative configurations of a job run
+            concurrently on each message. Their calls to the LLM share the rate limits.
+        :param accuracy_threshold: If set, the evaluation of an alternative configuration
+            stops as soon as it can't reach this accuracy compared to the results of the
+            jobs. Pass the same threshold to optimize_jobs.
         """
+        messages = list(messages)
+        if executor_type == "parallel":
+            semaphore = asyncio.Semaphore(max_parallelism)
 
-        # Run the jobs sequentially on every message
-        # TODO : Run the jobs in parallel on every message
-        for job_id, job in self.jobs.items():
-            if executor_type == "parallel":
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    # Submit tasks to the executor
-                    executor_predictions = executor.map(
-                        job.async_run_on_alternative_configurations, messages
+            async def run_job_on_message(job: Job, message: Message) -> None:
+                async with semaphore:
+                    await job.async_run_on_alternative_configurations(
+                        message,
+                        accuracy_threshold=accuracy_threshold,
+                        nb_messages=len(messages),
                     )
-                # Await all the results
-                await asyncio.gather(*executor_predictions)
-            elif executor_type == "sequential":
+
+            await asyncio.gather(
+                *[
+                    run_job_on_message(job, message)
+                    for message in messages
+                    for job in self.jobs.values()
+                ]
+            )
+        elif executor_type == "sequential":
+            for job_id, job in self.jobs.items():
                 for one_message in messages:
-                    await job.async_run_on_alternative_configurations(one_message)
-            else:
-                raise NotImplementedError(
-                    f"Executor type {executor_type} is not implemented"
-                )
+                    await job.async_run_on_alternative_configurations(
+                        one_message,
+                        accuracy_threshold=accuracy_threshold,
+                        nb_messages=len(messages),
+                    )
+        else:
+            raise NotImplementedError(
+                f"Executor type {executor_type} is not implemented"
+            )
 
         # We do not collect the results here, as we want to keep the alternative results
         # They are stored in the job object, in the alternative_results attribute
@@ -716,20 +1139,31 @@ class Workload:
     def run(
         self,
         messages: Iterable[Message],
-        executor_type: Literal["parallel", "sequential", "parallel_jobs"] = "parallel",
+        executor_type: Literal[
+            "parallel", "sequential", "parallel_jobs", "process"
+        ] = "parallel",
         max_parallelism: int = 10,
+        chunk_size: Optional[int] = None,
     ):
         """
         Runs all the jobs on the message.
 
         Args:
         :param messages: The messages to run the jobs on.
-        :param executor_type: The type of executor to use. Can be "parallel" or "sequential".
-        :param max_parallelism: The maximum number of parallel jobs to run per seconds.
-            Use this to adhere to rate limits. Only used if executor_type is "parallel" or "parallel_jobs".
+        :param executor_type: The type of executor to use. Can be "parallel", "parallel_jobs",
+            "sequential" or "process". "process" runs the jobs in a pool of processes, for
+            CPU-bound jobs: the job functions and configs must be picklable.
+        :param max_parallelism: The maximum number of jobs running concurrently. Only used if
+            executor_type is "parallel" or "parallel_jobs". The LLM calls of the jobs are also
+            rate limited per provider and model: see `lab.set_rate_limits`. With "process",
+            the number of processes, up to the number of CPUs.
+        :param chunk_size: With "process", the number of messages sent to a process at once.
+            By default, the messages are split in about 4 chunks per process.
 
         Returns: a mapping of message.id -> job_id -> job_result
         """
+        # The batched jobs don't reuse the LLM calls of a previous run
+        job_library.clear_event_detection_batches(self)
 
         # Run the jobs sequentially on every message
         # TODO : For Jobs, implement a batched_run method that takes a list of messages
@@ -744,16 +1178,17 @@ class Workload:
                 def job_limit_wrap(message: Message):
                     # Account for the semaphore (rate limit, max_parallelism)
                     if job.sample >= 1 or random.random() < job.sample:
-                        asyncio.run(job.async_run(message))
+                        event_loops.run(job.async_run(message))
                     # Update the progress bar
                     t.update()
 
                 t.display()
-                with concurrent.futures.ThreadPoolExecutor(
-                    max_workers=max_parallelism
-                ) as executor:
-                    # Submit tasks to the executor
-                    executor.map(job_limit_wrap, messages)
+                with _ThreadEventLoops() as event_loops:
+                    with concurrent.futures.ThreadPoolExecutor(
+                        max_workers=max_parallelism
+                    ) as executor:
+                        # Submit tasks to the executor
+                        executor.map(job_limit_wrap, messages)
 
                 t.close()
         elif executor_type == "parallel_jobs":
@@ -768,28 +1203,49 @@ class Workload:
             def message_job_limit_wrap(message_and_job: Tuple[Message, Job]):
                 message, job = message_and_job
                 if job.sample >= 1 or random.random() < job.sample:
-                    asyncio.run(job.async_run(message))
+                    event_loops.run(job.async_run(message))
                 # Update the progress bar
                 t.update()
 
             t.display()
             # Account for the semaphore (rate limit, max_parallelism)
-            with concurrent.futures.ThreadPoolExecutor(
-                max_workers=max_parallelism
-            ) as executor:
-                # Submit tasks to the executor
-                executor.map(message_job_limit_wrap, messages_and_jobs)
+            with _ThreadEventLoops() as event_loops:
+                with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=max_parallelism
+                ) as executor:
+                    # Submit tasks to the executor
+                    executor.map(message_job_limit_wrap, messages_and_jobs)
 
             t.close()
         elif executor_type == "sequential":
-            for job_id, job in self.jobs.items():
-                for one_message in tqdm(messages):
-                    if job.sample >= 1 or random.random() < job.sample:
-                        asyncio.run(job.async_run(one_message))
+            with _ThreadEventLoops() as event_loops:
+                for job_id, job in self.jobs.items():
+                    for one_message in tqdm(messages):
+                        if job.sample >= 1 or random.random() < job.sample:
+                            event_loops.run(job.async_run(one_message))
+        elif executor_type == "process":
+            executor, job_specs, chunk_size = self._process_executor(
+                messages, max_parallelism, chunk_size
+            )
+            with executor:
+                with tqdm(
+                    total=len(messages) if hasattr(messages, "__len__") else None
+                ) as t:
+                    futures = [
+                        executor.submit(_run_jobs_in_process, job_specs, chunk)
+                        for chunk in self._messages_chunks(messages, chunk_size)
+                    ]
+                    for future in concurrent.futures.as_completed(futures):
+                        chunk_results = future.result()
+                        self._store_process_results(chunk_results)
+                        t.update(
+                            len({message_id for message_id, _, _ in chunk_results})
+                        )
         else:
             raise NotImplementedError(
                 f"Executor type {executor_type} is not implemented"
             )
+        job_library.clear_event_detection_batches(self)
 
         # Collect the results:
         # Result is a mapping of message.id -> job_id -> job_result
@@ -804,6 +1260,118 @@ class Workload:
         self._results = results
         return results
 
+    def _job_specs(self) -> List[JobSpec]:
+        """The jobs, to run them in other processes. They must be picklable."""
+        job_specs = [
+            (job_id, job.job_function, job.config, job.metadata)
+            for job_id, job in self.jobs.items()
+        ]
+        try:
+            pickle.dumps(job_specs)
+        except Exception as e:
+            raise ValueError(
+                "The jobs can't be sent to other processes with executor_type='process'. "
+                + "Their job_function and config must be picklable: define the "
+                + f"job functions at the top level of a module. Error: {e}"
+            )
+        return job_specs
+
+    def _messages_chunks(
+        self, messages: Iterable[Message], chunk_size: int
+    ) -> Iterator[MessagesChunk]:
+        """Chunks of messages, with the jobs to run on them (according to job.sample)"""
+        chunk: MessagesChunk = []
+        for message in messages:
+            job_ids = []
+            for job_id, job in self.jobs.items():
+                if self.checkpoint_store is not None:
+                    job_result = self.checkpoint_store.get(message.id, job_id)
+                    if job_result is not None:
+                        # Completed by a previous run
+                        job_result.job_metadata = job.metadata
+                        job.results[message.id] = job_result
+                        continue
+                if job.sample >= 1 or random.random() < job.sample:
+                    job_ids.append(job_id)
+            if len(job_ids) == 0:
+                continue
+            chunk.append((message, job_ids))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if len(chunk) > 0:
+            yield chunk
+
+    def _process_executor(
+        self,
+        messages: Iterable[Message],
+        max_parallelism: int,
+        chunk_size: Optional[int],
+    ) -> Tuple[concurrent.futures.ProcessPoolExecutor, List[JobSpec], int]:
+        """The process pool, jobs and chunk size of executor_type="process" """
+        job_specs = self._job_specs()
+        max_workers = max(min(max_parallelism, os.cpu_count() or 1), 1)
+        if chunk_size is None:
+            # A few chunks per process, to balance the load while amortizing the pickling
+            nb_messages = len(messages) if hasattr(messages, "__len__") else 1000
+            chunk_size = max(math.ceil(nb_messages / (max_workers * 4)), 1)
+        return (
+            concurrent.futures.ProcessPoolExecutor(max_workers=max_workers),
+            job_specs,
+            chunk_size,
+        )
+
+    def _store_process_results(self, results: List[Tuple[str, str, JobResult]]) -> None:
+        """Store the results computed in another process in the jobs"""
+        for message_id, job_id, result in results:
+            job = self.jobs[job_id]
+            result.job_metadata = job.metadata
+            job.results[message_id] = result
+            if self.checkpoint_store is not None:
+                self.checkpoint_store.set(message_id, job_id, result)
+
+    def pattern_matcher(self) -> PatternMatcher:
+        """
+        Returns a PatternMatcher detecting the events of the keyword_event_detection and
+        regex_event_detection jobs of the workload. The events are named by the job ids.
+        """
+        matcher = PatternMatcher()
+        for job_id, job in self.jobs.items():
+            params = job.config.model_dump()
+            event_scope = params.get("event_scope", "task")
+            if job.job_function is job_library.keyword_event_detection:
+                matcher.add_keywords(job_id, params["keywords"], event_scope)
+            elif job.job_function is job_library.regex_event_detection:
+                matcher.add_regex(job_id, params["regex_pattern"], event_scope)
+        return matcher
+
+    def run_pattern_jobs(
+        self, messages: Iterable[Message]
+    ) -> Dict[str, Dict[str, JobResult]]:
+        """
+        Runs the keyword and regex detection jobs of the workload on the messages, at once
+        and synchronously: the patterns are compiled once, and the keywords of all the jobs
+        are searched in a single pass over the text of every message. The other jobs are
+        not run.
+
+        The results are stored in the jobs, like with `Workload.run()`.
+
+        Returns: a mapping of message.id -> job_id -> job_result
+        """
+        matcher = self.pattern_matcher()
+        results: Dict[str, Dict[str, JobResult]] = {}
+        for message in messages:
+            results[message.id] = {}
+            for job_id, result in matcher.match(message).items():
+                job = self.jobs[job_id]
+                if job.sample < 1 and random.random() >= job.sample:
+                    continue
+                result.job_id = job_id
+                result.job_metadata = job.metadata
+                job.results[message.id] = result
+                results[message.id][job_id] = result
+        return results
+
     def optimize_jobs(
         self, accuracy_threshold: float = 1.0, min_count: int = 10
     ) -> None:
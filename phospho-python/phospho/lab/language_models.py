@@ -1,5 +1,11 @@
+import asyncio
+import atexit
+import importlib.util
 import os
-from typing import Literal, Optional, Tuple, cast
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, Literal, Optional, Tuple, cast
 
 import phospho.config as config
 
@@ -97,7 +103,7 @@ def get_provider_and_model(
     return provider, model_name
 
 
-def get_async_client(
+def _get_client_params(
     provider: Literal[
         "openai",
         "azure",
@@ -107,80 +113,120 @@ def get_async_client(
         "together",
         "anyscale",
         "fireworks",
-        # phospho means the Tak Search service for now (in private monorepo)
         "phospho",
     ],
     api_key: Optional[str] = None,
-) -> AsyncOpenAI:
+) -> Dict[str, Any]:
     """
-    Return an async OpenAI client for the specified provider.
+    Return the parameters of the OpenAI client of the specified provider: its base_url
+    (or azure_endpoint) and api_key.
     """
-    try:
-        from openai import AsyncAzureOpenAI, AsyncOpenAI
-    except ImportError:
-        raise ImportError(
-            "OpenAI is not installed. Please install it using `pip install openai`"
-        )
-
     if provider == "openai":
-        return AsyncOpenAI()
+        return {"api_key": api_key or os.getenv("OPENAI_API_KEY")}
     if provider == "mistral":
-        return AsyncOpenAI(
-            base_url="https://api.mistral.ai/v1/",
-            api_key=api_key or os.getenv("MISTRAL_API_KEY"),
-        )
+        return {
+            "base_url": "https://api.mistral.ai/v1/",
+            "api_key": api_key or os.getenv("MISTRAL_API_KEY"),
+        }
     if provider == "ollama":
-        return AsyncOpenAI(
-            base_url="http://localhost:11434/v1/",
-            api_key="ollama",
-        )
+        return {"base_url": "http://localhost:11434/v1/", "api_key": "ollama"}
     if provider == "solar":
-        return AsyncOpenAI(
-            base_url="https://api.upstage.ai/v1/solar/",
-            api_key=api_key or os.getenv("SOLAR_API_KEY"),
-        )
+        return {
+            "base_url": "https://api.upstage.ai/v1/solar/",
+            "api_key": api_key or os.getenv("SOLAR_API_KEY"),
+        }
     if provider == "together":
-        return AsyncOpenAI(
-            base_url="https://api.together.xyz/v1/",
-            api_key=api_key or os.getenv("TOGETHER_API_KEY"),
-        )
+        return {
+            "base_url": "https://api.together.xyz/v1/",
+            "api_key": api_key or os.getenv("TOGETHER_API_KEY"),
+        }
     if provider == "anyscale":
-        return AsyncOpenAI(
-            base_url="https://api.endpoints.anyscale.com/v1/",
-            api_key=api_key or os.getenv("ANYSCALE_API_KEY"),
-        )
+        return {
+            "base_url": "https://api.endpoints.anyscale.com/v1/",
+            "api_key": api_key or os.getenv("ANYSCALE_API_KEY"),
+        }
     if provider == "fireworks":
-        return AsyncOpenAI(
-            base_url="https://api.fireworks.ai/inference/v1/",
-            api_key=api_key or os.getenv("FIREWORKS_API_KEY"),
-        )
+        return {
+            "base_url": "https://api.fireworks.ai/inference/v1/",
+            "api_key": api_key or os.getenv("FIREWORKS_API_KEY"),
+        }
     if provider == "azure":
         if os.getenv("AZURE_OPENAI_KEY") is None:
             raise ValueError("AZURE_OPENAI_KEY environment variable is not set.")
         if os.getenv("AZURE_OPENAI_ENDPOINT") is None:
             raise ValueError("AZURE_OPENAI_ENDPOINT environment variable is not set.")
-
-        return AsyncAzureOpenAI(
+        return {
             # https://learn.microsoft.com/azure/ai-services/openai/reference#rest-api-versioning
-            api_version="2023-03-15-preview",
+            "api_version": "2023-03-15-preview",
             # https://learn.microsoft.com/azure/cognitive-services/openai/how-to/create-resource?pivots=web-portal#create-a-resource
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT", ""),
-            api_key=os.environ.get("AZURE_OPENAI_KEY"),
-        )
+            "azure_endpoint": os.getenv("AZURE_OPENAI_ENDPOINT", ""),
+            "api_key": os.environ.get("AZURE_OPENAI_KEY"),
+        }
     if provider == "phospho":
         if os.getenv("TAK_SEARCH_URL") is None:
             raise ValueError("TAK_SEARCH_URL environment variable is not set.")
         if os.getenv("TAK_APP_API_KEY") is None:
             raise ValueError("TAK_APP_API_KEY environment variable is not set.")
-        return AsyncOpenAI(
-            base_url=f"{os.getenv('TAK_SEARCH_URL')}/v1/",
-            api_key=os.getenv("TAK_APP_API_KEY"),
-        )
+        return {
+            "base_url": f"{os.getenv('TAK_SEARCH_URL')}/v1/",
+            "api_key": os.getenv("TAK_APP_API_KEY"),
+        }
 
     raise NotImplementedError(f"Provider {provider} is not supported.")
 
 
-def get_sync_client(
+def _get_client_cache_key(provider: str, params: Dict[str, Any]) -> Tuple[str, ...]:
+    return (
+        provider,
+        params.get("api_key") or "",
+        params.get("base_url") or params.get("azure_endpoint") or "",
+    )
+
+
+def _http_client_kwargs() -> Dict[str, Any]:
+    """Parameters of the httpx clients shared by the OpenAI clients"""
+    import httpx
+
+    return {
+        "limits": httpx.Limits(
+            max_connections=config.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=config.LLM_MAX_KEEPALIVE_CONNECTIONS,
+        ),
+        # HTTP/2 multiplexes the requests on fewer connections. It needs the h2 package.
+        "http2": config.LLM_HTTP2 and importlib.util.find_spec("h2") is not None,
+    }
+
+
+# Clients are cached per (provider, api_key, base_url). The connection pool of an async
+# client is bound to an event loop, so async clients are also cached per event loop.
+_sync_clients: "OrderedDict[Tuple[str, ...], OpenAI]" = OrderedDict()
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, OrderedDict[Tuple[str, ...], AsyncOpenAI]]" = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+
+def _reset_clients_after_fork() -> None:
+    """The connections of the parent process must not be used by the child"""
+    global _sync_clients, _async_clients, _clients_lock
+    _sync_clients = OrderedDict()
+    _async_clients = weakref.WeakKeyDictionary()
+    _clients_lock = threading.Lock()
+
+
+# Not available on Windows, which doesn't fork
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_clients_after_fork)
+
+
+def _cache_client(clients: "OrderedDict[Tuple[str, ...], Any]", key, client) -> None:
+    """Add a client to an LRU cache of clients. The lock must be held."""
+    clients[key] = client
+    while len(clients) > config.LLM_CLIENTS_CACHE_SIZE:
+        # The evicted client isn't closed, as it may be in use: its connections are
+        # closed when it's garbage collected
+        clients.popitem(last=False)
+
+
+def get_async_client(
     provider: Literal[
         "openai",
         "azure",
@@ -190,66 +236,134 @@ def get_sync_client(
         "together",
         "anyscale",
         "fireworks",
+        # phospho means the Tak Search service for now (in private monorepo)
         "phospho",
     ],
     api_key: Optional[str] = None,
-) -> OpenAI:
+) -> AsyncOpenAI:
     """
-    Return a sync OpenAI client for the specified provider.
+    Return an async OpenAI client for the specified provider.
+
+    The clients are shared: the same client, and its pool of connections, is returned
+    for the same provider, api_key and base_url in the same event loop.
     """
     try:
-        from openai import OpenAI
+        import openai
+        from openai import AsyncAzureOpenAI, AsyncOpenAI
     except ImportError:
         raise ImportError(
             "OpenAI is not installed. Please install it using `pip install openai`"
         )
 
-    if provider == "openai":
-        return OpenAI()
-    if provider == "mistral":
-        return OpenAI(
-            base_url="https://api.mistral.ai/v1/",
-            api_key=api_key or os.getenv("MISTRAL_API_KEY"),
-        )
-    if provider == "ollama":
-        return OpenAI(
-            base_url="http://localhost:11434/v1/",
-            api_key="ollama",
-        )
-    if provider == "solar":
-        return OpenAI(
-            base_url="https://api.upstage.ai/v1/solar/",
-            api_key=api_key or os.getenv("SOLAR_API_KEY"),
-        )
-    if provider == "together":
-        return OpenAI(
-            base_url="https://api.together.xyz/v1/",
-            api_key=api_key or os.getenv("TOGETHER_API_KEY"),
-        )
-    if provider == "anyscale":
-        return OpenAI(
-            base_url="https://api.endpoints.anyscale.com/v1/",
-            api_key=api_key or os.getenv("ANYSCALE_API_KEY"),
-        )
-    if provider == "fireworks":
-        return OpenAI(
-            base_url="https://api.fireworks.ai/inference/v1/",
-            api_key=api_key or os.getenv("FIREWORKS_API_KEY"),
-        )
+    params = _get_client_params(provider, api_key)
+    key = _get_client_cache_key(provider, params)
+    try:
+        loop: Optional[asyncio.AbstractEventLoop] = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+
+    if loop is not None:
+        with _clients_lock:
+            client = _async_clients.get(loop, {}).get(key)
+            if client is not None:
+                _async_clients[loop].move_to_end(key)
+                return client
+
+    # DefaultAsyncHttpxClient keeps the defaults of openai (timeouts, redirects)
+    http_client_class = getattr(openai, "DefaultAsyncHttpxClient", None)
+    if http_client_class is None:
+        import httpx
+
+        http_client_class = httpx.AsyncClient
+    http_client = http_client_class(**_http_client_kwargs())
     if provider == "azure":
-        if os.getenv("AZURE_OPENAI_KEY") is None:
-            raise ValueError("AZURE_OPENAI_KEY environment variable is not set.")
-        if os.getenv("AZURE_OPENAI_ENDPOINT") is None:
-            raise ValueError("AZURE_OPENAI_ENDPOINT environment variable is not set.")
+        client = AsyncAzureOpenAI(**params, http_client=http_client)
+    else:
+        client = AsyncOpenAI(**params, http_client=http_client)
 
-        return AzureOpenAI(
-            # https://learn.microsoft.com/azure/ai-services/openai/reference#rest-api-versioning
-            api_version="2023-03-15-preview",
-            # https://learn.microsoft.com/azure/cognitive-services/openai/how-to/create-resource?pivots=web-portal#create-a-resource
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT", ""),
-            api_key=os.environ.get("AZURE_OPENAI_KEY"),
+    if loop is not None:
+        with _clients_lock:
+            clients = _async_clients.setdefault(loop, OrderedDict())
+            # Another task may have created a client in the meantime: keep the first one
+            if key in clients:
+                return clients[key]
+            _cache_client(clients, key, client)
+    return client
+
+
+def get_sync_client(
+    provider: Literal[
+        "openai",
+        "azure",
+        "mistral",
+        "ollama",
+        "solar",
+        "together",
+        "anyscale",
+        "fireworks",
+        "phospho",
+    ],
+    api_key: Optional[str] = None,
+) -> OpenAI:
+    """
+    Return a sync OpenAI client for the specified provider.
+
+    The clients are shared: the same client, and its pool of connections, is returned
+    for the same provider, api_key and base_url.
+    """
+    try:
+        import openai
+        from openai import AzureOpenAI, OpenAI
+    except ImportError:
+        raise ImportError(
+            "OpenAI is not installed. Please install it using `pip install openai`"
         )
+
     if provider == "phospho":
         raise NotImplementedError("phospho provider is not supported for sync client.")
 
-    raise NotImplementedError(f"Provider {provider} is not supported.")
+    params = _get_client_params(provider, api_key)
+    key = _get_client_cache_key(provider, params)
+    with _clients_lock:
+        client = _sync_clients.get(key)
+        if client is not None:
+            _sync_clients.move_to_end(key)
+            return client
+
+        http_client_class = getattr(openai, "DefaultHttpxClient", None)
+        if http_client_class is None:
+            import httpx
+
+            http_client_class = httpx.Client
+        http_client = http_client_class(**_http_client_kwargs())
+        if provider == "azure":
+            client = AzureOpenAI(**params, http_client=http_client)
+        else:
+            client = OpenAI(**params, http_client=http_client)
+        _cache_client(_sync_clients, key, client)
+        return client
+
+
+async def aclose_clients() -> None:
+    """
+    Close the shared async clients of the running event loop, and their connections.
+    Call it before closing the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        clients = _async_clients.pop(loop, OrderedDict())
+    for client in clients.values():
+        await client.close()
+
+
+def close_clients() -> None:
+    """Close the shared sync clients, and their connections"""
+    global _sync_clients
+    with _clients_lock:
+        clients = _sync_clients
+        _sync_clients = OrderedDict()
+    for client in clients.values():
+        client.close()
+
+
+atexit.register(close_clients)
@@ -0,0 +1,260 @@
+"""
+Cache of the LLM responses of the jobs, so that re-running a job on unchanged data
+doesn't call the LLM again.
+
+Responses are keyed by a hash of the provider, the model and all the parameters of the
+request (messages, temperature, max_tokens, ...).
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import phospho.config as config
+
+from .rate_limits import rate_limited_chat_completion
+
+logger = logging.getLogger(__name__)
+
+# Parameters of a request that don't change the response
+IGNORED_PARAMETERS = {"timeout", "extra_headers", "user"}
+
+
+def llm_cache_key(provider: str, model_name: str, **kwargs: Any) -> str:
+    """Hash of the provider, model and parameters of a chat completion request"""
+    request = {
+        "provider": provider,
+        "model": model_name,
+        **{
+            key: value for key, value in kwargs.items() if key not in IGNORED_PARAMETERS
+        },
+    }
+    serialized_request = json.dumps(request, sort_keys=True, default=str)
+    return hashlib.sha256(serialized_request.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Base class of the LLM caches. Subclasses implement _get and _set. The responses are
+    stored as json strings.
+    """
+
+    def __init__(self, ttl: Optional[float] = None) -> None:
+        """
+        :param ttl: Time to live of the entries, in seconds. If None, they never expire.
+        """
+        self.ttl = ttl
+        self.stats_lock = threading.Lock()
+        self.nb_hits = 0
+        self.nb_misses = 0
+
+    def _get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def _set(self, key: str, value: str) -> None:
+        raise NotImplementedError
+
+    def _is_expired(self, created_at: float) -> bool:
+        return self.ttl is not None and time.time() - created_at > self.ttl
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self._get(key)
+        with self.stats_lock:
+            if value is None:
+                self.nb_misses += 1
+            else:
+                self.nb_hits += 1
+        if value is None:
+            return None
+        return json.loads(value)
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        self._set(key, json.dumps(value))
+
+    async def aget(self, key: str) -> Optional[Dict[str, Any]]:
+        """Async version of get. Caches stored on disk don't block the event loop."""
+        return self.get(key)
+
+    async def aset(self, key: str, value: Dict[str, Any]) -> None:
+        """Async version of set"""
+        self.set(key, value)
+
+    def stats(self) -> Dict[str, int]:
+        with self.stats_lock:
+            return {"nb_hits": self.nb_hits, "nb_misses": self.nb_misses}
+
+
+class InMemoryLLMCache(LLMCache):
+    """Keeps the max_size most recently used responses in memory"""
+
+    def __init__(
+        self, max_size: int = config.LLM_CACHE_MAX_SIZE, ttl: Optional[float] = None
+    ) -> None:
+        super().__init__(ttl=ttl)
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        # key -> (created_at, value)
+        self.entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+
+    def _get(self, key: str) -> Optional[str]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            created_at, value = entry
+            if self._is_expired(created_at):
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def _set(self, key: str, value: str) -> None:
+        with self.lock:
+            self.entries[key] = (time.time(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+
+class SQLiteLLMCache(LLMCache):
+    """Stores the responses in a SQLite database, shared by the processes using it"""
+
+    def __init__(self, path: str, ttl: Optional[float] = None) -> None:
+        """
+        :param path: Path of the SQLite file. It's created if it doesn't exist.
+        """
+        super().__init__(ttl=ttl)
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        # Concurrent readers, and commits without waiting for the disk
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache "
+            + "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self.connection.commit()
+
+    def _get(self, key: str) -> Optional[str]:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        value, created_at = row
+        if self._is_expired(created_at):
+            # Deleted by purge_expired
+            return None
+        return value
+
+    def _set(self, key: str, value: str) -> None:
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at) VALUES (?, ?, ?)",
+                (key, value, time.time()),
+            )
+            self.connection.commit()
+
+    async def aget(self, key: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: Dict[str, Any]) -> None:
+        await asyncio.to_thread(self.set, key, value)
+
+    def purge_expired(self) -> None:
+        """Delete the expired entries from the database"""
+        if self.ttl is None:
+            return
+        with self.lock:
+            self.connection.execute(
+                "DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl,)
+            )
+            self.connection.commit()
+
+
+_llm_cache: Optional[LLMCache] = None
+_llm_cache_initialized = False
+_llm_cache_lock = threading.Lock()
+
+
+def set_llm_cache(llm_cache: Optional[LLMCache]) -> None:
+    """
+    Set the cache of the LLM responses of the jobs. None disables the cache.
+
+    ```python
+    from phospho import lab
+
+    lab.set_llm_cache(lab.SQLiteLLMCache("llm_cache.sqlite", ttl=7 * 24 * 3600))
+    ```
+    """
+    global _llm_cache, _llm_cache_initialized
+    with _llm_cache_lock:
+        _llm_cache = llm_cache
+        _llm_cache_initialized = True
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """
+    Returns the cache of the LLM responses. If set_llm_cache wasn't called, it's created
+    from the config (PHOSPHO_LLM_CACHE environment variable).
+    """
+    global _llm_cache, _llm_cache_initialized
+    with _llm_cache_lock:
+        if not _llm_cache_initialized:
+            if config.LLM_CACHE == "memory":
+                _llm_cache = InMemoryLLMCache(ttl=config.LLM_CACHE_TTL)
+            elif config.LLM_CACHE:
+                _llm_cache = SQLiteLLMCache(config.LLM_CACHE, ttl=config.LLM_CACHE_TTL)
+            _llm_cache_initialized = True
+        return _llm_cache
+
+
+async def cached_chat_completion(
+    async_openai_client: Any,
+    provider: str,
+    model_name: str,
+    **kwargs: Any,
+) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Same as rate_limited_chat_completion, but the responses are cached if an LLM cache is
+    set: a request already made is answered from the cache, without calling the LLM.
+
+    :returns: The response, and the metadata of the call to store in the JobResult: the
+        time spent waiting for the rate limit, and if the cache is set, whether the response
+        was in the cache and the number of hits and misses of the cache.
+    """
+    llm_cache = get_llm_cache()
+    if llm_cache is None or kwargs.get("stream"):
+        response, rate_limit_delay = await rate_limited_chat_completion(
+            async_openai_client, provider, model_name, **kwargs
+        )
+        return response, {"rate_limit_delay": rate_limit_delay}
+
+    from openai.types.chat import ChatCompletion
+
+    key = llm_cache_key(provider, model_name, **kwargs)
+    cached_response = await llm_cache.aget(key)
+    if cached_response is not None:
+        response = ChatCompletion.model_validate(cached_response)
+        rate_limit_delay = 0.0
+    else:
+        response, rate_limit_delay = await rate_limited_chat_completion(
+            async_openai_client, provider, model_name, **kwargs
+        )
+        try:
+            await llm_cache.aset(key, response.model_dump(mode="json"))
+        except Exception as e:
+            logger.warning(f"Error caching the LLM response: {e}")
+    return response, {
+        "rate_limit_delay": rate_limit_delay,
+        "llm_cache_hit": cached_response is not None,
+        **{f"llm_cache_{name}": value for name, value in llm_cache.stats().items()},
+    }
@@ -0,0 +1,341 @@
+"""
+Detection of the keyword and regex events, without LLM.
+
+The patterns are compiled once and cached. The PatternMatcher detects all the keyword and
+regex events of a project in a batch of messages: the text of every message is extracted
+once per detection scope, and all the literal keywords are searched in a single pass over
+the text with an Aho-Corasick automaton.
+"""
+
+import functools
+import re
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Pattern, Set, Tuple, cast
+
+from phospho.models import (
+    DetectionScope,
+    JobResult,
+    Message,
+    ResultType,
+    ScoreRange,
+    Task,
+)
+
+# Characters around a keyword in the middle of the text
+KEYWORD_SEPARATORS = " ,.:'/\n\r\t+="
+# Characters after a keyword at the beginning of the text, or before it at the end
+KEYWORD_EDGE_SEPARATORS = " ,:'/.\n\r\t"
+
+
+def get_text_to_search(
+    message: Message, event_scope: DetectionScope
+) -> Tuple[Optional[str], Optional[JobResult]]:
+    """
+    Returns the text in which the keywords or regex of an event are searched, or the
+    JobResult to return if there is no text for this scope.
+    """
+    texts: List[str] = []
+    if event_scope == "task":
+        texts = [message.latest_interaction()]
+    elif event_scope == "task_input_only":
+        # Keep only the user messages
+        texts = [
+            " " + m.content + " " for m in message.as_list() if m.role.lower() == "user"
+        ]
+    elif event_scope == "task_output_only":
+        # Keep only the assistant messages
+        texts = [
+            " " + m.content + " "
+            for m in message.as_list()
+            if m.role.lower() == "assistant"
+        ]
+    elif event_scope == "session":
+        texts = [message.transcript(with_role=True, with_previous_messages=True)]
+    elif event_scope == "system_prompt":
+        message_task: Optional[Task] = message.metadata.get("task")
+        error = None
+        if not isinstance(message_task, Task):
+            error = "No task in the message"
+        elif not isinstance(message_task.metadata, dict):
+            error = "No metadata in the task"
+        elif message_task.metadata.get("system_prompt", None) is None:
+            error = "No system_prompt in the task metadata"
+        elif not isinstance(message_task.metadata["system_prompt"], str):
+            error = "system_prompt in the message is not a string"
+        if error is not None:
+            return None, JobResult(
+                result_type=ResultType.error, value=None, logs=[error]
+            )
+        texts = [message_task.metadata["system_prompt"]]
+    else:
+        raise ValueError(
+            f"Unknown event_scope : {event_scope}. Valid values are: {DetectionScope.__args__}"
+        )
+    return " ".join(texts), None
+
+
+def split_keywords(keywords: str) -> List[str]:
+    """The keywords of a comma separated list, lowercased. Empty keywords are ignored."""
+    return [
+        keyword.strip().lower() for keyword in keywords.split(",") if keyword.strip()
+    ]
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_keywords(keywords: str) -> Pattern:
+    """
+    Compile the regex matching any of the comma separated keywords as a separate word of
+    a lowercased text. The compiled regexes are cached.
+    """
+    keyword_patterns = [
+        # In the middle of the text
+        f"[{re.escape(KEYWORD_SEPARATORS)}]{{1}}{keyword}[{re.escape(KEYWORD_SEPARATORS)}]{{1}}"
+        # At the beginning of the text
+        + f"|^{keyword}[{re.escape(KEYWORD_EDGE_SEPARATORS)}]{{1}}"
+        # At the end of the text
+        + f"|[{re.escape(KEYWORD_EDGE_SEPARATORS)}]{{1}}{keyword}$"
+        for keyword in split_keywords(keywords)
+    ]
+    if len(keyword_patterns) == 0:
+        # Never matches
+        return re.compile(r"(?!)")
+    return re.compile("|".join(keyword_patterns))
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_regex(regex_pattern: str) -> Pattern:
+    """Compile a regex. The compiled regexes are cached."""
+    return re.compile(regex_pattern)
+
+
+def detection_result(found: bool, evaluation_source: str, logs: List[Any]) -> JobResult:
+    return JobResult(
+        result_type=ResultType.bool,
+        value=found,
+        logs=logs,
+        metadata={
+            "evaluation_source": evaluation_source,
+            "score_range": ScoreRange(
+                score_type="confidence", max=1, min=0, value=1 if found else 0
+            ),
+        },
+    )
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton: finds all the occurrences of many keywords in a single pass
+    over a text, whatever the number of keywords.
+    """
+
+    def __init__(self) -> None:
+        # The states are indexes in these lists. 0 is the root.
+        self.transitions: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        # Keywords ending at this state
+        self.keywords: List[List[str]] = [[]]
+        # Keywords ending at this state, including through the fail links
+        self.outputs: List[List[str]] = [[]]
+        self.values: Dict[str, Set[Any]] = defaultdict(set)
+        self.built = False
+
+    def add(self, keyword: str, value: Any) -> None:
+        """Add a keyword. find returns the values of the keywords found."""
+        self.values[keyword].add(value)
+        state = 0
+        for char in keyword:
+            next_state = self.transitions[state].get(char)
+            if next_state is None:
+                next_state = len(self.transitions)
+                self.transitions.append({})
+                self.fail.append(0)
+                self.keywords.append([])
+                self.transitions[state][char] = next_state
+            state = next_state
+        if keyword not in self.keywords[state]:
+            self.keywords[state].append(keyword)
+        self.built = False
+
+    def build(self) -> None:
+        """Compute the fail links, breadth first"""
+        self.outputs = [list(keywords) for keywords in self.keywords]
+        queue = list(self.transitions[0].values())
+        for state in queue:
+            self.fail[state] = 0
+        for state in queue:
+            for char, next_state in self.transitions[state].items():
+                queue.append(next_state)
+                fail_state = self.fail[state]
+                while fail_state and char not in self.transitions[fail_state]:
+                    fail_state = self.fail[fail_state]
+                fallback = self.transitions[fail_state].get(char, 0)
+                self.fail[next_state] = fallback if fallback != next_state else 0
+                self.outputs[next_state] = (
+                    self.outputs[next_state] + self.outputs[self.fail[next_state]]
+                )
+        self.built = True
+
+    def find(self, text: str) -> Set[Any]:
+        """
+        Returns the values of the keywords found as separate words of the text, with the
+        same rules as the regexes of compile_keywords.
+        """
+        if not self.built:
+            self.build()
+        found: Set[Any] = set()
+        transitions, fail, outputs = self.transitions, self.fail, self.outputs
+        text_length = len(text)
+        state = 0
+        for end, char in enumerate(text, start=1):
+            while state and char not in transitions[state]:
+                state = fail[state]
+            state = transitions[state].get(char, 0)
+            for keyword in outputs[state]:
+                start = end - len(keyword)
+                if start > 0 and end < text_length:
+                    is_word = (
+                        text[start - 1] in KEYWORD_SEPARATORS
+                        and text[end] in KEYWORD_SEPARATORS
+                    )
+                elif end < text_length:
+                    is_word = text[end] in KEYWORD_EDGE_SEPARATORS
+                elif start > 0:
+                    is_word = text[start - 1] in KEYWORD_EDGE_SEPARATORS
+                else:
+                    is_word = False
+                if is_word:
+                    found |= self.values[keyword]
+        return found
+
+
+class PatternMatcher:
+    """
+    Detects keyword and regex events in messages, synchronously and without LLM.
+
+    ```python
+    from phospho import lab
+
+    matcher = lab.PatternMatcher()
+    matcher.add_keywords("greeting", "hello, hi")
+    matcher.add_regex("email", r"[\\w.]+@[\\w.]+")
+
+    # message.id -> event_name -> JobResult
+    results = matcher.run(messages)
+    ```
+    """
+
+    def __init__(self) -> None:
+        # event_scope -> automaton of the literal keywords of the events of this scope
+        self.automatons: Dict[str, KeywordAutomaton] = {}
+        # event_scope -> [(event_name, compiled regex, whether it's searched lowercased)]
+        self.regexes: Dict[str, List[Tuple[str, Pattern, bool]]] = defaultdict(list)
+        # event_scope -> event names
+        self.event_names: Dict[str, List[str]] = defaultdict(list)
+        # event_name -> (keywords or regex_pattern, evaluation_source)
+        self.patterns: Dict[str, Tuple[str, str]] = {}
+        # event_name -> error compiling its pattern
+        self.errors: Dict[str, str] = {}
+
+    def _add_event(
+        self,
+        event_name: str,
+        event_scope: DetectionScope,
+        pattern: str,
+        evaluation_source: str,
+    ) -> None:
+        if event_name in self.patterns:
+            raise ValueError(f"Event {event_name} is already in the matcher")
+        self.event_names[event_scope].append(event_name)
+        self.patterns[event_name] = (pattern, evaluation_source)
+
+    def add_keywords(
+        self, event_name: str, keywords: str, event_scope: DetectionScope = "task"
+    ) -> None:
+        """Detect the event if one of the comma separated keywords is in the text"""
+        try:
+            # Same logs as keyword_event_detection: the regex of the keywords
+            pattern = compile_keywords(keywords).pattern
+        except re.error as e:
+            self._add_event(event_name, event_scope, keywords, "phospho-keywords")
+            self.errors[event_name] = str(e)
+            return
+        self._add_event(event_name, event_scope, pattern, "phospho-keywords")
+        for keyword in split_keywords(keywords):
+            if re.escape(keyword) == keyword:
+                self.automatons.setdefault(event_scope, KeywordAutomaton()).add(
+                    keyword, event_name
+                )
+            else:
+                # Keywords with special characters are regexes: search them as such
+                self.regexes[event_scope].append(
+                    (event_name, compile_keywords(keyword), True)
+                )
+
+    def add_regex(
+        self, event_name: str, regex_pattern: str, event_scope: DetectionScope = "task"
+    ) -> None:
+        """Detect the event if the regex is found in the text"""
+        self._add_event(event_name, event_scope, regex_pattern, "phospho-regex")
+        try:
+            regex = compile_regex(regex_pattern)
+        except re.error as e:
+            self.errors[event_name] = str(e)
+        else:
+            self.regexes[event_scope].append((event_name, regex, False))
+
+    def match(self, message: Message) -> Dict[str, JobResult]:
+        """
+        Detect the events in a message.
+
+        :returns: A mapping of event_name -> JobResult.
+        """
+        results: Dict[str, JobResult] = {}
+        for event_scope, event_names in self.event_names.items():
+            text, empty_result = get_text_to_search(
+                message, cast(DetectionScope, event_scope)
+            )
+            if empty_result is not None:
+                for event_name in event_names:
+                    results[event_name] = empty_result.model_copy(deep=True)
+                continue
+            text = cast(str, text)
+            # The keywords are searched in the lowercased text
+            lowercased_text = text.lower()
+            found: Set[str] = set()
+            automaton = self.automatons.get(event_scope)
+            if automaton is not None:
+                found |= automaton.find(lowercased_text)
+            for event_name, regex, lowercased in self.regexes.get(event_scope, []):
+                if event_name not in found and regex.search(
+                    lowercased_text if lowercased else text
+                ):
+                    found.add(event_name)
+
+            for event_name in event_names:
+                pattern, evaluation_source = self.patterns[event_name]
+                if event_name in self.errors:
+                    results[event_name] = JobResult(
+                        result_type=ResultType.error,
+                        value=None,
+                        logs=[self.errors[event_name]],
+                    )
+                    continue
+                results[event_name] = detection_result(
+                    event_name in found,
+                    evaluation_source,
+                    logs=[
+                        lowercased_text
+                        if evaluation_source == "phospho-keywords"
+                        else text,
+                        pattern,
+                    ],
+                )
+        return results
+
+    def run(self, messages: Iterable[Message]) -> Dict[str, Dict[str, JobResult]]:
+        """
+        Detect the events in a batch of messages.
+
+        :returns: A mapping of message.id -> event_name -> JobResult.
+        """
+        return {message.id: self.match(message) for message in messages}
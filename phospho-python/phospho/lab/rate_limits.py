@@ -0,0 +1,236 @@
+"""
+Rate limits of the LLM calls made by the jobs, shared by all the jobs of a process.
+
+Every provider and model has a RateLimiter, which spaces the requests to stay under a
+number of requests per minute and of tokens per minute. When a provider still answers
+429 (Too Many Requests), all the calls to this model are paused for the Retry-After delay.
+"""
+
+import asyncio
+import email.utils
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import phospho.config as config
+from phospho.sampling import TokenBucket
+
+from .language_models import get_provider_and_model
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """
+    Limits the requests per minute and tokens per minute of a provider and model.
+
+    The limiter is thread safe and isn't bound to an event loop, as Workload.run runs the
+    jobs in several threads with their own event loop.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+    ) -> None:
+        """
+        :param requests_per_minute: If None, the number of requests isn't limited.
+        :param tokens_per_minute: If None, the number of tokens isn't limited.
+        """
+        self.lock = threading.Lock()
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        # Bursts of up to one second of requests and tokens
+        self.requests_bucket = (
+            TokenBucket(requests_per_minute / 60)
+            if requests_per_minute is not None
+            else None
+        )
+        self.tokens_bucket = (
+            TokenBucket(tokens_per_minute / 60)
+            if tokens_per_minute is not None
+            else None
+        )
+        # Set after a 429 response: no request is sent before this time (time.monotonic)
+        self.paused_until = 0.0
+
+        # Stats
+        self.nb_requests = 0
+        self.nb_rate_limited_requests = 0
+        # Total time spent waiting for the rate limit, in seconds
+        self.total_delay = 0.0
+
+    def reserve(self, nb_tokens: float = 0) -> float:
+        """
+        Reserve a request using nb_tokens. Never blocks.
+
+        :returns: The time to wait (in seconds) before sending the request.
+        """
+        delay = 0.0
+        if self.requests_bucket is not None:
+            delay = max(delay, self.requests_bucket.reserve(1))
+        if self.tokens_bucket is not None and nb_tokens > 0:
+            delay = max(delay, self.tokens_bucket.reserve(nb_tokens))
+        with self.lock:
+            delay = max(delay, self.paused_until - time.monotonic())
+            self.nb_requests += 1
+            self.total_delay += delay
+        return delay
+
+    async def acquire(self, nb_tokens: float = 0) -> float:
+        """
+        Wait until a request using nb_tokens can be sent.
+
+        :returns: The time waited, in seconds.
+        """
+        delay = self.reserve(nb_tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+    def pause(self, retry_after: float) -> None:
+        """Don't send any request for retry_after seconds (eg. after a 429 response)"""
+        with self.lock:
+            self.nb_rate_limited_requests += 1
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            return {
+                "nb_requests": self.nb_requests,
+                "nb_rate_limited_requests": self.nb_rate_limited_requests,
+                "total_delay": self.total_delay,
+            }
+
+
+# (provider, model_name) -> RateLimiter
+_rate_limiters: Dict[Tuple[str, str], RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def set_rate_limits(
+    model: str,
+    requests_per_minute: Optional[float] = None,
+    tokens_per_minute: Optional[float] = None,
+) -> RateLimiter:
+    """
+    Set the rate limits of the calls to a model, for all the jobs of the process.
+
+    ```python
+    from phospho import lab
+
+    lab.set_rate_limits(
+        "azure:gpt-4o", requests_per_minute=500, tokens_per_minute=80_000
+    )
+    ```
+
+    :param model: The model, in the format "provider:model".
+    :param requests_per_minute: If None, the number of requests isn't limited.
+    :param tokens_per_minute: If None, the number of tokens isn't limited.
+    """
+    key = get_provider_and_model(model)
+    rate_limiter = RateLimiter(
+        requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute
+    )
+    with _rate_limiters_lock:
+        _rate_limiters[key] = rate_limiter
+    return rate_limiter
+
+
+def get_rate_limiter(provider: str, model_name: str) -> RateLimiter:
+    """
+    Returns the RateLimiter of a provider and model. If no limits were set with
+    set_rate_limits, the defaults of the config are used.
+    """
+    key = (provider, model_name)
+    with _rate_limiters_lock:
+        rate_limiter = _rate_limiters.get(key)
+        if rate_limiter is None:
+            rate_limiter = RateLimiter(
+                requests_per_minute=config.LLM_REQUESTS_PER_MINUTE,
+                tokens_per_minute=config.LLM_TOKENS_PER_MINUTE,
+            )
+            _rate_limiters[key] = rate_limiter
+    return rate_limiter
+
+
+def estimate_nb_tokens(
+    messages: List[Dict[str, Any]], max_tokens: Optional[int] = None
+) -> int:
+    """
+    Estimate the number of tokens counted by the rate limit of a chat completion: about
+    4 characters per token of prompt, plus the max_tokens of the completion. This is the
+    estimation made by the providers, and it doesn't need a tokenizer.
+    """
+    nb_chars = sum(len(str(message.get("content") or "")) for message in messages)
+    return nb_chars // 4 + (max_tokens or 0)
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """
+    Returns the delay (in seconds) asked by the Retry-After headers of the response
+    of a failed request, or None if there is none.
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if headers is None:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms is not None:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if retry_after is None:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    # Retry-After can also be an HTTP date
+    try:
+        retry_date = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_date.timestamp() - time.time(), 0.0)
+
+
+async def rate_limited_chat_completion(
+    async_openai_client: Any,
+    provider: str,
+    model_name: str,
+    **kwargs: Any,
+) -> Tuple[Any, float]:
+    """
+    Call async_openai_client.chat.completions.create(model=model_name, **kwargs) within
+    the rate limits of the provider and model. After a 429 response, all the calls to the
+    model are paused for the Retry-After delay, and the call is retried.
+
+    :returns: The response, and the time spent waiting for the rate limit (in seconds).
+    """
+    rate_limiter = get_rate_limiter(provider, model_name)
+    nb_tokens = estimate_nb_tokens(kwargs.get("messages", []), kwargs.get("max_tokens"))
+    total_delay = 0.0
+    attempt = 0
+    while True:
+        total_delay += await rate_limiter.acquire(nb_tokens)
+        try:
+            response = await async_openai_client.chat.completions.create(
+                model=model_name, **kwargs
+            )
+            return response, total_delay
+        except Exception as e:
+            if (
+                getattr(e, "status_code", None) != 429
+                or attempt >= config.LLM_RATE_LIMIT_MAX_RETRIES
+            ):
+                raise e
+            retry_after = get_retry_after(e)
+            if retry_after is None:
+                retry_after = config.LLM_RATE_LIMIT_DEFAULT_RETRY_AFTER * 2**attempt
+            logger.warning(
+                f"Rate limited by {provider}:{model_name}. Retrying in {retry_after}s"
+            )
+            rate_limiter.pause(retry_after)
+            attempt += 1
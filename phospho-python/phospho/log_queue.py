@@ -1,36 +1,248 @@
+import logging
+import random
 import threading
-from typing import Dict, List
+import time
+from typing import Dict, List, Literal, Optional
 
 import pydantic
 
-from .utils import generate_uuid
+from .spill import DiskSpill
+from .utils import generate_uuid, json_dumps
+
+logger = logging.getLogger(__name__)
+
+OverflowPolicy = Literal["drop_oldest", "drop_newest", "block", "sample"]
 
 
 class Event(pydantic.BaseModel, extra="allow"):
     id: str
     content: Dict[str, object]
     to_log: bool = True
+    # Streamed output chunks. They are appended in O(1) and only joined into
+    # content["output"] when the event is materialized.
+    output_parts: Optional[List[str]] = None
+    # Streamed raw outputs. This list is also content["raw_output"], extended inplace.
+    raw_output_parts: Optional[List[object]] = None
+
+    def materialize(self) -> Dict[str, object]:
+        """Join the streamed output chunks into the content, and return the content."""
+        if self.output_parts is not None:
+            output = "".join(self.output_parts)
+            self.output_parts = [output]
+            self.content["output"] = output
+        return self.content
+
+
+def estimate_event_size(event: Event) -> int:
+    """Estimate the size in bytes of an event, once serialized to json"""
+    return len(json_dumps(event.materialize()))
 
 
 class LogQueue:
     """Queue logs here to group them in batchs"""
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        max_events: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        overflow_policy: OverflowPolicy = "drop_oldest",
+        block_timeout: float = 1.0,
+        spill: Optional[DiskSpill] = None,
+    ) -> None:
+        """
+        :param max_events: The maximum number of events in the queue. If None, the number
+            of events is not bounded.
+        :param max_bytes: The maximum total size (in bytes, once serialized to json) of the
+            events in the queue. If None, the size of the queue is not bounded.
+        :param overflow_policy: What to do with a new event when the queue is full.
+            - "drop_oldest": evict the oldest events to make room for the new one.
+            - "drop_newest": drop the new event.
+            - "block": wait up to `block_timeout` seconds for the consumer to make room,
+                then drop the new event.
+            - "sample": keep a uniform random sample of the events received while the
+                queue is full (reservoir sampling).
+        :param block_timeout: How long to wait for room in the queue with the "block" policy
+            (in seconds).
+        :param spill: If set, events are written to disk instead of being dropped when the
+            queue is full, and batches that couldn't be sent are written to disk instead of
+            being put back in memory. The consumer replays them.
+        """
+        if overflow_policy not in ["drop_oldest", "drop_newest", "block", "sample"]:
+            raise ValueError(f"Unknown overflow_policy: {overflow_policy}")
+
         self.lock = threading.Lock()
+        # Notified every time events leave the queue
+        self.not_full = threading.Condition(self.lock)
         # The queue itself is a dictionary. Each event has a unique id.
         self.events: Dict[str, Event] = {}
 
+        self.max_events = max_events
+        self.max_bytes = max_bytes
+        self.overflow_policy = overflow_policy
+        self.block_timeout = block_timeout
+        self.spill = spill
+
+        # Size in bytes of the events. Only tracked if max_bytes is set.
+        self.events_size: Dict[str, int] = {}
+        self.total_bytes = 0
+        # Number of events received while the queue was full (for the "sample" policy)
+        self.nb_overflow_events = 0
+        # Number of events dropped because the queue was full
+        self.nb_dropped_events = 0
+
+    def _reinit_after_fork(self) -> None:
+        """
+        Called in the child process after a fork. The lock may have been held by a thread
+        of the parent, which doesn't exist in the child: it's replaced. The events are
+        left to the parent, which sends them, so that they are not logged twice.
+        """
+        self.lock = threading.Lock()
+        self.not_full = threading.Condition(self.lock)
+        self.events = {}
+        self.events_size = {}
+        self.total_bytes = 0
+        self.nb_overflow_events = 0
+        if self.spill is not None:
+            self.spill._reinit_after_fork()
+
+    def _event_size(self, event: Event) -> int:
+        if self.max_bytes is None:
+            return 0
+        return estimate_event_size(event)
+
+    def _has_room(self, size: int) -> bool:
+        if self.max_events is not None and len(self.events) >= self.max_events:
+            return False
+        if self.max_bytes is not None and self.total_bytes + size > self.max_bytes:
+            return False
+        return True
+
+    def _pop(self, event_id: str) -> None:
+        self.events.pop(event_id, None)
+        self.total_bytes -= self.events_size.pop(event_id, 0)
+
+    def _insert(self, event: Event, size: int) -> None:
+        self.events[event.id] = event
+        if self.max_bytes is not None:
+            self.events_size[event.id] = size
+            self.total_bytes += size
+
+    def _drop(self, nb_events: int = 1) -> None:
+        if self.nb_dropped_events == 0:
+            logger.warning(
+                f"phospho log queue is full (max_events={self.max_events}, max_bytes={self.max_bytes}). "
+                + f"Dropping log events with policy {self.overflow_policy}."
+            )
+        self.nb_dropped_events += nb_events
+
+    def _admit(self, event: Event, blocking: bool) -> Optional[Event]:
+        """Insert an event in the queue, applying the overflow policy if it's full.
+        The lock must be held.
+
+        :returns: The event if it must be spilled to disk instead. It's written by the
+            caller once the lock is released, so that logging isn't blocked by the disk.
+        """
+        size = self._event_size(event)
+
+        # Updating an event already in the queue (eg. streaming) replaces it
+        if event.id in self.events:
+            self._pop(event.id)
+
+        fits = self.max_bytes is None or size <= self.max_bytes
+        if fits and self._has_room(size):
+            self._insert(event, size)
+            return None
+
+        if self.spill is not None and event.to_log:
+            # Events still being updated (to_log=False) must stay in memory
+            return event
+
+        if not fits:
+            # This event can never fit in the queue
+            self._drop()
+            return None
+
+        policy = self.overflow_policy
+        if policy == "block" and not blocking:
+            policy = "drop_newest"
+
+        if policy == "drop_oldest":
+            while self.events and not self._has_room(size):
+                self._pop(next(iter(self.events)))
+                self._drop()
+            self._insert(event, size)
+        elif policy == "drop_newest":
+            self._drop()
+        elif policy == "block":
+            deadline = time.monotonic() + self.block_timeout
+            while not self._has_room(size):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.not_full.wait(remaining):
+                    if not self._has_room(size):
+                        self._drop()
+                        return None
+            self._insert(event, size)
+        elif policy == "sample":
+            # Reservoir sampling: every event received while the queue is full
+            # has the same probability of being kept
+            self.nb_overflow_events += 1
+            capacity = max(len(self.events), 1)
+            if random.random() < capacity / (capacity + self.nb_overflow_events):
+                while self.events and not self._has_room(size):
+                    self._pop(random.choice(list(self.events.keys())))
+                    self._drop()
+                self._insert(event, size)
+            else:
+                self._drop()
+        return None
+
+    def _spill(self, events: List[Event]) -> None:
+        """Write events to the spill. Called without the lock held: the spill has its own."""
+        if self.spill is not None and len(events) > 0:
+            self.spill.write([event.materialize() for event in events])
+
     def append(self, event: Event) -> None:
         with self.lock:
-            self.events[event.id] = event
+            event_to_spill = self._admit(event, blocking=True)
+        if event_to_spill is not None:
+            self._spill([event_to_spill])
 
     def extend(self, events_queue: Dict[str, Event]) -> None:
+        events_to_spill: List[Event] = []
         with self.lock:
-            self.events.update(events_queue)
+            for event in events_queue.values():
+                event_to_spill = self._admit(event, blocking=True)
+                if event_to_spill is not None:
+                    events_to_spill.append(event_to_spill)
+        self._spill(events_to_spill)
+
+    def resize(self, event_id: str, nb_added_bytes: Optional[int] = None) -> None:
+        """Update the size of an event that was modified inplace (eg. streaming).
+
+        :param nb_added_bytes: The size of what was added to the event. If None, the size
+            of the event is computed again from scratch.
+        """
+        if self.max_bytes is None:
+            return
+        with self.lock:
+            event = self.events.get(event_id)
+            if event is not None:
+                self.total_bytes -= self.events_size.get(event_id, 0)
+                if nb_added_bytes is not None:
+                    self.events_size[event_id] = (
+                        self.events_size.get(event_id, 0) + nb_added_bytes
+                    )
+                else:
+                    self.events_size[event_id] = self._event_size(event)
+                self.total_bytes += self.events_size[event_id]
 
     def add_batch(self, events_content_list: List[Dict[str, object]]) -> None:
         """This is used to add back events to the log queue, eg when they
         couldn't be sent."""
+        if self.spill is not None:
+            self.spill.write(events_content_list)
+            return
+
         with self.lock:
             # Create new event with id task_id
             def get_event_id(event: object) -> str:
@@ -46,18 +258,36 @@ class LogQueue:
                 )
                 for event_content in events_content_list
             }
-            self.events.update(new_events)
+            # Those events are older than the ones currently in the queue: they only
+            # take the room left, and are put first so that they are the first to be evicted.
+            # Never block here, as this is called by the consumer itself.
+            requeued_events: Dict[str, Event] = {}
+            for event in new_events.values():
+                if event.id in self.events:
+                    continue
+                size = self._event_size(event)
+                if self._has_room(size):
+                    self._insert(event, size)
+                    requeued_events[event.id] = event
+                else:
+                    self._drop()
+            for event_id, event in self.events.items():
+                if event_id not in requeued_events:
+                    requeued_events[event_id] = event
+            self.events = requeued_events
 
     def get_batch(self) -> List[Dict[str, object]]:
         if self.lock.acquire(False):  # non-blocking
             try:
                 # The batch is only made of events marked as to_log
-                events_to_log = filter(lambda e: e.to_log, self.events.values())
+                events_to_log = [e for e in self.events.values() if e.to_log]
                 # Events not marked as to_log will stay in queue
-                self.events = dict(
-                    filter(lambda pair: not pair[1].to_log, self.events.items())
-                )
-                return [e.content for e in events_to_log]
+                for event in events_to_log:
+                    self._pop(event.id)
+                if len(events_to_log) > 0:
+                    self.nb_overflow_events = 0
+                    self.not_full.notify_all()
+                return [e.materialize() for e in events_to_log]
             finally:
                 self.lock.release()
         else:
@@ -0,0 +1,139 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# Number of task_id for which the sampling decision is remembered, so that all the
+# chunks of a streamed task get the same decision
+MAX_REMEMBERED_TASKS = 10_000
+
+
+def session_sampled_in(session_id: str, sample_rate: float) -> bool:
+    """
+    Deterministic sampling of a session: the same session_id always gets the same
+    decision, in every process, so sessions are never split.
+    """
+    if sample_rate >= 1:
+        return True
+    if sample_rate <= 0:
+        return False
+    digest = hashlib.blake2b(session_id.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") < sample_rate * 2**64
+
+
+class TokenBucket:
+    """
+    Allow up to `rate` events per second on average, with bursts of up to `capacity`
+    events. Thread safe.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None) -> None:
+        """
+        :param rate: Number of tokens added per second.
+        :param capacity: Maximum number of tokens. Defaults to rate (ie. bursts of one
+            second of events).
+        """
+        if rate <= 0:
+            raise ValueError(f"rate must be positive, got {rate}")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _reinit_after_fork(self) -> None:
+        self.lock = threading.Lock()
+
+    def _refill(self) -> None:
+        """The lock must be held."""
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.last_refill) * self.rate
+        )
+        self.last_refill = now
+
+    def try_acquire(self) -> bool:
+        """Take a token if one is available. Never blocks."""
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def reserve(self, nb_tokens: float = 1) -> float:
+        """
+        Take nb_tokens, even if they are not available yet: the bucket goes into debt, so
+        the callers are served in the order of their reservations. Never blocks.
+
+        :returns: The time to wait (in seconds) until the tokens are available.
+        """
+        with self.lock:
+            self._refill()
+            self.tokens -= nb_tokens
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+
+class Sampler:
+    """
+    Decide which tasks are logged: sessions are sampled with session_sampled_in, then
+    the number of logged tasks per second is capped with a TokenBucket.
+
+    The decision is taken once per task_id, on its first log event.
+    """
+
+    def __init__(
+        self,
+        sample_rate: float = 1.0,
+        max_events_per_second: Optional[float] = None,
+    ) -> None:
+        if not 0 <= sample_rate <= 1:
+            raise ValueError(f"sample_rate must be between 0 and 1, got {sample_rate}")
+        self.sample_rate = sample_rate
+        self.token_bucket = (
+            TokenBucket(max_events_per_second)
+            if max_events_per_second is not None
+            else None
+        )
+        self.lock = threading.Lock()
+        # task_id -> sampling metadata, or None if the task isn't logged
+        self.decisions: "OrderedDict[str, Optional[Dict[str, object]]]" = OrderedDict()
+        # Tasks sampled in, but dropped by the rate limit since the last logged task
+        self.nb_rate_limited_events = 0
+
+    def _reinit_after_fork(self) -> None:
+        """Called in the child process after a fork: the locks may have been held."""
+        self.lock = threading.Lock()
+        if self.token_bucket is not None:
+            self.token_bucket._reinit_after_fork()
+
+    def sample(self, task_id: str, session_id: str) -> Optional[Dict[str, object]]:
+        """
+        :returns: None if the task must not be logged. Otherwise, the metadata to log
+            with it, to extrapolate the total number of tasks: the sample_rate, and the
+            number of tasks dropped by the rate limit since the previous logged task.
+        """
+        with self.lock:
+            if task_id in self.decisions:
+                return self.decisions[task_id]
+
+        decision: Optional[Dict[str, object]] = None
+        if session_sampled_in(session_id, self.sample_rate):
+            if self.token_bucket is None or self.token_bucket.try_acquire():
+                decision = {"sample_rate": self.sample_rate}
+                if self.token_bucket is not None:
+                    with self.lock:
+                        decision["nb_rate_limited_events"] = self.nb_rate_limited_events
+                        self.nb_rate_limited_events = 0
+            else:
+                with self.lock:
+                    self.nb_rate_limited_events += 1
+
+        with self.lock:
+            self.decisions[task_id] = decision
+            if len(self.decisions) > MAX_REMEMBERED_TASKS:
+                self.decisions.popitem(last=False)
+        return decision
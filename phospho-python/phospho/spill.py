@@ -0,0 +1,247 @@
+import json
+import logging
+import os
+import shutil
+import threading
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: processes are not forked, so there is no pid directory to adopt
+    fcntl = None  # type: ignore
+
+from . import config
+from .utils import json_dumps
+
+logger = logging.getLogger(__name__)
+
+# (segment number, offset in bytes in the segment)
+SpillPosition = Tuple[int, int]
+
+
+class DiskSpill:
+    """
+    Append-only, on-disk storage of log events that couldn't be kept in memory or sent.
+
+    Events are appended as json lines to segment files (`segment_00000001.jsonl`, ...).
+    An offset index (`index.json`) stores the position up to which events were delivered.
+    Reading returns a batch of events and the position after it: the position is only
+    committed once the batch was sent, so events are delivered at least once, even if
+    the process restarts in between. Fully delivered segments are deleted.
+
+    A directory must only be used by one process at a time. Forked processes spill to a
+    `pid_<pid>` subdirectory. Before the first read, the events of the subdirectories of
+    processes that are no longer running are adopted: moved to this directory, then
+    replayed.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_max_bytes: int = config.SPILL_SEGMENT_MAX_BYTES,
+    ) -> None:
+        """
+        :param directory: Where to store the segment files and the offset index.
+        :param segment_max_bytes: Size after which a new segment file is started.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.lock = threading.Lock()
+        self.index_path = os.path.join(directory, "index.json")
+
+        # Read position
+        self.segment, self.offset = self._read_index()
+        # Always write to a new segment, in case the last one was left truncated
+        segments = self._segments()
+        self.write_segment = max(segments + [self.segment - 1]) + 1
+        self.write_segment_size = 0
+
+        self.nb_spilled_events = 0
+        # Directories whose stale pid_<pid> subdirectories are adopted before the first
+        # read, by the consumer: not when the spill is created, eg. in a fork hook.
+        self.directories_to_adopt: List[str] = [directory]
+        self.adoption_lock = threading.Lock()
+
+    def _reinit_after_fork(self) -> None:
+        """
+        Called in the child process after a fork. As a directory must only be used by one
+        process, the child spills to a subdirectory named after its pid. The child also
+        adopts the directories of its stopped siblings (eg. prefork workers restarted),
+        on its first read.
+        """
+        parent_directory = self.directory
+        self.__init__(  # type: ignore
+            os.path.join(parent_directory, f"pid_{os.getpid()}"),
+            segment_max_bytes=self.segment_max_bytes,
+        )
+        self.directories_to_adopt.append(parent_directory)
+
+    def adopt_stale_directories(self) -> None:
+        """Adopt the stale pid_<pid> subdirectories, if it wasn't done yet."""
+        with self.adoption_lock:
+            while self.directories_to_adopt:
+                self._adopt_stale_directories(self.directories_to_adopt.pop(0))
+
+    def _adopt_stale_directories(self, directory: str) -> None:
+        """
+        Move the undelivered events of the pid_<pid> subdirectories of directory whose
+        process is no longer running to this spill, then delete the subdirectories.
+        """
+        if fcntl is None:
+            return
+        lock_file = None
+        try:
+            # Only one process adopts the directories at a time
+            lock_file = open(os.path.join(directory, "adopt.lock"), "w")
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            for file_name in sorted(os.listdir(directory)):
+                stale_directory = os.path.join(directory, file_name)
+                if stale_directory == self.directory or not os.path.isdir(
+                    stale_directory
+                ):
+                    continue
+                pid = _parse_pid(file_name)
+                if pid is None or _is_running(pid):
+                    continue
+                self._adopt(stale_directory)
+        except OSError as e:
+            logger.warning(f"Error adopting the phospho spill of {directory}: {e}")
+        finally:
+            if lock_file is not None:
+                lock_file.close()
+
+    def _adopt(self, stale_directory: str) -> None:
+        stale_spill = DiskSpill(
+            stale_directory, segment_max_bytes=self.segment_max_bytes
+        )
+        nb_adopted_events = 0
+        while True:
+            batch, position = stale_spill.read_batch()
+            if len(batch) == 0:
+                break
+            # Written before the commit: an event is duplicated rather than lost on a crash
+            self.write(batch)
+            stale_spill.commit(position)
+            nb_adopted_events += len(batch)
+        shutil.rmtree(stale_directory, ignore_errors=True)
+        if nb_adopted_events > 0:
+            logger.info(
+                f"Adopted {nb_adopted_events} phospho events spilled by a stopped process in {stale_directory}"
+            )
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"segment_{segment:08d}.jsonl")
+
+    def _segments(self) -> List[int]:
+        segments = []
+        for file_name in os.listdir(self.directory):
+            if file_name.startswith("segment_") and file_name.endswith(".jsonl"):
+                try:
+                    segments.append(int(file_name[len("segment_") : -len(".jsonl")]))
+                except ValueError:
+                    continue
+        return sorted(segments)
+
+    def _read_index(self) -> SpillPosition:
+        try:
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+            return int(index["segment"]), int(index["offset"])
+        except FileNotFoundError:
+            return 1, 0
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(
+                f"Invalid phospho spill index {self.index_path}: {e}. Replaying from the first segment."
+            )
+            return 1, 0
+
+    def _write_index(self) -> None:
+        # Write then rename, so that the index is never left half written
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"segment": self.segment, "offset": self.offset}, f)
+        os.replace(tmp_path, self.index_path)
+
+    def write(self, events_content_list: List[Dict[str, object]]) -> None:
+        """Append events to the current segment file."""
+        if len(events_content_list) == 0:
+            return
+        data = b"".join(
+            json_dumps(event_content) + b"\n" for event_content in events_content_list
+        )
+        with self.lock:
+            if self.write_segment_size >= self.segment_max_bytes:
+                self.write_segment += 1
+                self.write_segment_size = 0
+            with open(self._segment_path(self.write_segment), "ab") as f:
+                f.write(data)
+            self.write_segment_size += len(data)
+            self.nb_spilled_events += len(events_content_list)
+
+    def read_batch(
+        self, max_events: int = config.SPILL_REPLAY_BATCH_SIZE
+    ) -> Tuple[List[Dict[str, object]], SpillPosition]:
+        """
+        Read up to max_events events, starting from the last committed position.
+
+        :returns: The events and the position to commit once they are delivered.
+        """
+        self.adopt_stale_directories()
+        with self.lock:
+            batch: List[Dict[str, object]] = []
+            segment, offset = self.segment, self.offset
+            for current_segment in self._segments():
+                if current_segment < segment:
+                    continue
+                if current_segment > segment:
+                    segment, offset = current_segment, 0
+                with open(self._segment_path(segment), "rb") as f:
+                    f.seek(offset)
+                    while len(batch) < max_events:
+                        line = f.readline()
+                        if not line:
+                            break
+                        offset += len(line)
+                        try:
+                            batch.append(json.loads(line))
+                        except ValueError:
+                            # Truncated line, eg. the process was killed while writing
+                            logger.warning(
+                                f"Skipping invalid line in phospho spill segment {segment}"
+                            )
+                if len(batch) >= max_events:
+                    break
+            return batch, (segment, offset)
+
+    def commit(self, position: SpillPosition) -> None:
+        """Mark the events before position as delivered, and delete the delivered segments."""
+        with self.lock:
+            self.segment, self.offset = position
+            self._write_index()
+            for segment in self._segments():
+                if segment < self.segment:
+                    os.remove(self._segment_path(segment))
+
+
+def _parse_pid(file_name: str) -> Optional[int]:
+    if not file_name.startswith("pid_"):
+        return None
+    try:
+        return int(file_name[len("pid_") :])
+    except ValueError:
+        return None
+
+
+def _is_running(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Eg. the process belongs to another user
+        return True
+    return True
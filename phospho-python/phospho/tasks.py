@@ -1,7 +1,8 @@
-from typing import Dict, List, Literal, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Literal, Optional
 
 from phospho.collection import Collection
-from phospho.models import Task
+from phospho.models import ProjectDataFilters, Task
 
 
 class TaskEntity:
@@ -103,6 +104,57 @@ class TaskCollection(Collection):
 
         return TaskEntity(self._client, response.json()["id"])
 
+    def iter(
+        self,
+        filters: Optional[ProjectDataFilters] = None,
+        page_size: int = 1000,
+        prefetch: bool = True,
+    ) -> Iterator[TaskEntity]:
+        """
+        Iterate over the tasks of the project, from the most recent to the oldest.
+
+        The tasks are fetched page by page, using a cursor: only one or two pages are
+        kept in memory, so this can be used to export all the tasks of a project.
+        The content of the tasks is kept as dicts, it isn't validated.
+
+        :param filters: Filters to apply to the tasks.
+        :param page_size: Number of tasks fetched per request.
+        :param prefetch: If True, the next page is fetched in a background thread while
+            the tasks of the current page are consumed.
+        """
+        executor = None
+        if prefetch:
+            executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="phospho-prefetch"
+            )
+        try:
+            page = self._client.fetch_tasks_page(filters, page_size)
+            while True:
+                next_cursor = page.get("next_cursor")
+                next_page = None
+                if next_cursor is not None and executor is not None:
+                    next_page = executor.submit(
+                        self._client.fetch_tasks_page, filters, page_size, next_cursor
+                    )
+
+                for task in page["tasks"]:
+                    yield TaskEntity(
+                        client=self._client, task_id=task["id"], _content=task
+                    )
+
+                if next_cursor is None:
+                    return
+                if next_page is not None:
+                    page = next_page.result()
+                else:
+                    page = self._client.fetch_tasks_page(
+                        filters, page_size, next_cursor
+                    )
+        finally:
+            if executor is not None:
+                # Don't wait for a prefetched page if the iteration was stopped
+                executor.shutdown(wait=False, cancel_futures=True)
+
     def get_all(self) -> List[TaskEntity]:
         """Returns a list of all of the project tasks"""
         # TODO : Filters
@@ -1,8 +1,9 @@
 import logging
+import weakref
 from typing import Dict, List, Optional, Union
 
 from opentelemetry import trace
-from opentelemetry.context import Context
+from opentelemetry.context import Context, create_key, get_value, set_value
 from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
 from opentelemetry.sdk.resources import Resource
 from opentelemetry.sdk.trace import Span, TracerProvider
@@ -16,6 +17,40 @@ otlp_exporter = None
 batch_span_processor = None
 global_batch_span_processor = None
 
+# Key of the phospho attributes (task_id, session_id, metadata) in the OpenTelemetry context
+PHOSPHO_ATTRIBUTES_KEY = create_key("phospho.attributes")
+
+MetadataType = Dict[
+    str,
+    Union[
+        int,
+        bool,
+        str,
+        float,
+        List[int],
+        List[bool],
+        List[str],
+        List[float],
+    ],
+]
+
+
+def set_phospho_attributes(
+    task_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    metadata: Optional[MetadataType] = None,
+    context: Optional[Context] = None,
+) -> Context:
+    """
+    Returns a copy of the context (by default, the current one) with the phospho attributes.
+    The spans started in this context get these attributes. Use it with `opentelemetry.context.attach`.
+    """
+    return set_value(
+        PHOSPHO_ATTRIBUTES_KEY,
+        {"task_id": task_id, "session_id": session_id, "metadata": metadata},
+        context,
+    )
+
 
 class GlobalBatchSpanProcessor(BatchSpanProcessor):
     """
@@ -33,21 +68,7 @@ class GlobalBatchSpanProcessor(BatchSpanProcessor):
         task_id: Optional[str] = None,
         session_id: Optional[str] = None,
         # OpenTelemetry does not support nested types in attributes
-        metadata: Optional[
-            Dict[
-                str,
-                Union[
-                    int,
-                    bool,
-                    str,
-                    float,
-                    List[int],
-                    List[bool],
-                    List[str],
-                    List[float],
-                ],
-            ]
-        ] = None,
+        metadata: Optional[MetadataType] = None,
     ):
         self.context_name = context_name
         self.task_id = task_id
@@ -62,16 +83,28 @@ class GlobalBatchSpanProcessor(BatchSpanProcessor):
         )
 
     def on_start(self, span: Span, parent_context: Optional[Context] = None) -> None:
+        # The attributes set in the context (see set_phospho_attributes) take precedence
+        # over the ones of the processor
+        attributes = get_value(PHOSPHO_ATTRIBUTES_KEY, parent_context)
+        if isinstance(attributes, dict):
+            task_id = attributes.get("task_id")
+            session_id = attributes.get("session_id")
+            metadata = attributes.get("metadata")
+        else:
+            task_id = self.task_id
+            session_id = self.session_id
+            metadata = self.metadata
+
         # Adds the span to the list of spans to be exported
-        if self.task_id:
+        if task_id:
             if span.attributes.get("phospho.task_id") is None:
-                span.set_attribute("phospho.task_id", self.task_id)
-        if self.session_id:
+                span.set_attribute("phospho.task_id", task_id)
+        if session_id:
             if span.attributes.get("phospho.session_id") is None:
-                span.set_attribute("phospho.session_id", self.session_id)
-        if self.metadata:
+                span.set_attribute("phospho.session_id", session_id)
+        if metadata:
             # Add "phospho.metadata" attribute to each key
-            metadata = {f"phospho.metadata.{k}": v for k, v in self.metadata.items()}
+            metadata = {f"phospho.metadata.{k}": v for k, v in metadata.items()}
             span.set_attributes(metadata)
         return super().on_start(span, parent_context)
 
@@ -87,18 +120,81 @@ class GlobalBatchSpanProcessor(BatchSpanProcessor):
         return super()._export(flush_request)
 
 
-def init_tracing(client: Client):
-    global global_batch_span_processor
+class ClientTracing:
+    """
+    The OTLP exporter, span processors and tracer providers of a Client.
+
+    They are created once per Client and reused by every log: each span processor runs
+    its own export thread, and each tracer provider registers a shutdown handler.
+    """
+
+    def __init__(self, client: Client) -> None:
+        self.otlp_exporter = OTLPSpanExporter(
+            endpoint=f"{client.base_url}/v3/otl/{client._project_id()}",
+            headers={
+                "Authorization": "Bearer " + client._api_key(),
+            },
+        )
+        self._batch_span_processor: Optional[BatchSpanProcessor] = None
+        self._global_batch_span_processor: Optional[GlobalBatchSpanProcessor] = None
+        self._tracer_provider: Optional[TracerProvider] = None
+        self._steps_tracer_provider: Optional[TracerProvider] = None
+
+    @property
+    def batch_span_processor(self) -> BatchSpanProcessor:
+        if self._batch_span_processor is None:
+            self._batch_span_processor = BatchSpanProcessor(self.otlp_exporter)
+        return self._batch_span_processor
+
+    @property
+    def global_batch_span_processor(self) -> GlobalBatchSpanProcessor:
+        if self._global_batch_span_processor is None:
+            self._global_batch_span_processor = GlobalBatchSpanProcessor(
+                span_exporter=self.otlp_exporter
+            )
+        return self._global_batch_span_processor
+
+    @property
+    def tracer_provider(self) -> TracerProvider:
+        """Tracer provider whose spans get the phospho attributes of the context."""
+        if self._tracer_provider is None:
+            otlp_resource = Resource(attributes={"service.name": "service"})
+            self._tracer_provider = TracerProvider(resource=otlp_resource)
+            self._tracer_provider.add_span_processor(self.global_batch_span_processor)
+        return self._tracer_provider
+
+    @property
+    def steps_tracer_provider(self) -> TracerProvider:
+        """Tracer provider for the steps passed to phospho.log"""
+        if self._steps_tracer_provider is None:
+            self._steps_tracer_provider = TracerProvider()
+            self._steps_tracer_provider.add_span_processor(self.batch_span_processor)
+        return self._steps_tracer_provider
+
+
+_clients_tracing: "weakref.WeakKeyDictionary[Client, ClientTracing]" = (
+    weakref.WeakKeyDictionary()
+)
 
-    otlp_resource = Resource(attributes={"service.name": "service"})
-    tracer_provider = TracerProvider(resource=otlp_resource)
 
-    otlp_exporter = get_otlp_exporter(client)
+def get_client_tracing(client: Client) -> ClientTracing:
+    """Returns the tracing objects of the client, creating them on the first call."""
+    client_tracing = _clients_tracing.get(client)
+    if client_tracing is None:
+        client_tracing = ClientTracing(client)
+        _clients_tracing[client] = client_tracing
+    return client_tracing
 
-    global_batch_span_processor = GlobalBatchSpanProcessor(span_exporter=otlp_exporter)
-    tracer_provider.add_span_processor(global_batch_span_processor)
+
+def init_tracing(client: Client):
+    global otlp_exporter
+    global global_batch_span_processor
+
+    client_tracing = get_client_tracing(client)
+    otlp_exporter = client_tracing.otlp_exporter
+    global_batch_span_processor = client_tracing.global_batch_span_processor
     # Sets the global default tracer provider
-    trace.set_tracer_provider(tracer_provider)
+    trace.set_tracer_provider(client_tracing.tracer_provider)
 
     init_instrumentations()
 
@@ -401,14 +497,7 @@ def init_instrumentations():
 def get_otlp_exporter(client: Client) -> OTLPSpanExporter:
     global otlp_exporter
 
-    if otlp_exporter is not None:
-        return otlp_exporter
-    otlp_exporter = OTLPSpanExporter(
-        endpoint=f"{client.base_url}/v3/otl/{client._project_id()}",
-        headers={
-            "Authorization": "Bearer " + client._api_key(),
-        },
-    )
+    otlp_exporter = get_client_tracing(client).otlp_exporter
     return otlp_exporter
 
 
@@ -417,14 +506,8 @@ def get_batch_span_processor(client: Client) -> BatchSpanProcessor:
     Returns a generic batch span processor.
     """
     global batch_span_processor
-    global otlp_exporter
 
-    if batch_span_processor is not None:
-        return batch_span_processor
-    if otlp_exporter is None:
-        otlp_exporter = get_otlp_exporter(client)
-    otlp_exporter = get_otlp_exporter(client)
-    batch_span_processor = BatchSpanProcessor(otlp_exporter)
+    batch_span_processor = get_client_tracing(client).batch_span_processor
     return batch_span_processor
 
 
@@ -433,12 +516,23 @@ def get_global_batch_span_processor(client: Client) -> GlobalBatchSpanProcessor:
     Returns a global batch span processor. This processor adds task_id and session_id to the spans.
     """
     global global_batch_span_processor
-    global otlp_exporter
 
-    if global_batch_span_processor is not None:
-        return global_batch_span_processor
-    if otlp_exporter is None:
-        otlp_exporter = get_otlp_exporter(client)
-    otlp_exporter = get_otlp_exporter(client)
-    global_batch_span_processor = GlobalBatchSpanProcessor(otlp_exporter)
+    global_batch_span_processor = get_client_tracing(client).global_batch_span_processor
     return global_batch_span_processor
+
+
+def get_tracer(client: Client) -> trace.Tracer:
+    """
+    Returns the tracer used to log the phospho.log span. Its spans get the phospho attributes
+    of the context.
+    """
+    get_global_batch_span_processor(client)
+    return get_client_tracing(client).tracer_provider.get_tracer("phospho.log")
+
+
+def get_steps_tracer(client: Client) -> trace.Tracer:
+    """
+    Returns the tracer used to log the steps passed to phospho.log
+    """
+    get_batch_span_processor(client)
+    return get_client_tracing(client).steps_tracer_provider.get_tracer("phospho.log")
@@ -1,22 +1,41 @@
 import datetime
+import functools
+import hashlib
+import itertools
 import json
 import logging
+import sys
+import threading
 import time
 import uuid
+from collections import OrderedDict
 from random import choice
 from typing import (
+    TYPE_CHECKING,
     Any,
     AsyncGenerator,
     Callable,
     Dict,
     Generator,
+    List,
     Literal,
     Optional,
+    Tuple,
     Union,
 )
 
 import pydantic
 
+from . import config
+
+if TYPE_CHECKING:
+    import tiktoken
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
 
@@ -115,14 +134,137 @@ def generate_version_id(with_date: bool = True) -> str:
         return f"{choice(adjectives)}-{choice(animals)}"
 
 
+# Types that json.dumps serializes as is. Subclasses (eg. str enums) are accepted too.
+_JSON_SCALAR_TYPES = (str, int, float)
+# With these options, orjson fails on the types json.dumps doesn't serialize, except
+# the types it supports natively (eg. UUIDs, enums).
+_ORJSON_STRICT_OPTIONS = (
+    (
+        orjson.OPT_PASSTHROUGH_DATETIME
+        | orjson.OPT_PASSTHROUGH_DATACLASS
+        | orjson.OPT_PASSTHROUGH_SUBCLASS
+    )
+    if orjson is not None
+    else None
+)
+
+
+def _is_valid_json_key(key: Any) -> bool:
+    return key is None or isinstance(key, _JSON_SCALAR_TYPES)
+
+
 def is_jsonable(x: Any) -> bool:
+    """
+    Returns True if x can be serialized with json.dumps.
+
+    The structure is walked once, without serializing it.
+    """
+    if x is None or isinstance(x, _JSON_SCALAR_TYPES):
+        return True
+    if isinstance(x, dict):
+        return all(
+            _is_valid_json_key(key) and is_jsonable(value) for key, value in x.items()
+        )
+    if isinstance(x, (list, tuple)):
+        return all(is_jsonable(item) for item in x)
+    return False
+
+
+def _orjson_can_serialize(x: Any) -> bool:
+    if orjson is None:
+        return False
     try:
-        json.dumps(x)
+        orjson.dumps(x, option=_ORJSON_STRICT_OPTIONS)
         return True
     except TypeError:
         return False
 
 
+def is_loggable(x: Any) -> bool:
+    """
+    Returns True if x can be logged as is, ie. serialized with `json_dumps` without
+    converting values to str.
+
+    This is `is_jsonable`, unless orjson is installed: then x is checked with orjson,
+    which also serializes some types natively (eg. UUIDs, enums).
+    """
+    # If orjson fails, x can still be serializable, eg. if it has int keys
+    return _orjson_can_serialize(x) or is_jsonable(x)
+
+
+def _sanitize_content(content: Any) -> Tuple[Any, bool]:
+    if content is None or isinstance(content, _JSON_SCALAR_TYPES):
+        return content, True
+
+    if isinstance(content, dict):
+        new_content: Optional[Dict[Any, Any]] = None
+        is_valid = True
+        for index, (key, value) in enumerate(content.items()):
+            new_value, value_is_valid = _sanitize_content(value)
+            is_valid = is_valid and value_is_valid and _is_valid_json_key(key)
+            if new_value is not value and new_content is None:
+                # Copy the values that were left unchanged so far
+                new_content = dict(itertools.islice(content.items(), index))
+            if new_content is not None:
+                new_content[key] = new_value
+        if new_content is None:
+            return content, is_valid
+        return new_content, is_valid
+
+    if isinstance(content, (list, tuple)):
+        new_items = [_sanitize_content(item) for item in content]
+        if all(
+            new_item is item and item_is_valid
+            for item, (new_item, item_is_valid) in zip(content, new_items)
+        ):
+            return content, True
+        if isinstance(content, list):
+            # Special case for list
+            return str([new_item for new_item, _ in new_items]), True
+        return str(content), True
+
+    if isinstance(content, pydantic.BaseModel):
+        return _sanitize_content(content.model_dump())
+    # pydantic.v1 models can only exist if pydantic.v1 was imported
+    pydantic_v1 = sys.modules.get("pydantic.v1")
+    if pydantic_v1 is not None and isinstance(content, pydantic_v1.BaseModel):
+        return _sanitize_content(content.dict())
+    if isinstance(content, bytes):
+        # Probably a byte representation of json
+        try:
+            return _sanitize_content(json.loads(content.decode()))
+        except ValueError:
+            return str(content), True
+
+    # Fallback to str
+    logger.debug(
+        f"Unknwon type {type(content)} for content {content}. Fallback to str."
+    )
+    return str(content), True
+
+
+def sanitize_content(content: Any) -> Tuple[Any, bool]:
+    """
+    Convert content to json serializable content, in a single traversal.
+
+    Nested dicts are converted value by value. A list or tuple containing a value that
+    isn't json serializable is converted to its str representation. Pydantic models are
+    dumped to dicts, bytes are parsed as json and other objects fall back to str.
+
+    Values that are already json serializable are returned as is: containers are only
+    copied when one of their values is converted. If orjson is installed, it's used to
+    detect content with nothing to convert, and the types it serializes natively
+    (eg. UUIDs, enums) are kept as is.
+
+    :returns: The converted content, and whether it's json serializable. It can only be
+        False if a dict has keys that aren't json serializable.
+    """
+    if _orjson_can_serialize(content):
+        # Fast path: nothing to convert
+        return content, True
+    return _sanitize_content(content)
+
+
 def filter_nonjsonable_keys(arg_dict: dict, verbose: bool = False) -> Dict[str, object]:
     if not isinstance(arg_dict, dict):
         raise TypeError(f"Expected a dict, got {type(arg_dict)}")
@@ -146,32 +288,31 @@ def convert_content_to_loggable_content(
 ) -> Union[Dict[str, object], str, None]:
     """
     Convert objects to json serializable content. Notably, nested dicts and lists are converted.
+
+    See `sanitize_content`.
     """
-    if is_jsonable(content):
-        return content
+    return sanitize_content(content)[0]
 
-    if isinstance(content, dict):
-        new_content = {
-            key: convert_content_to_loggable_content(value)
-            for key, value in content.items()
-        }
-        return new_content
-    elif isinstance(content, list):
-        # Special case for list
-        return str([convert_content_to_loggable_content(x) for x in content])
-    elif isinstance(content, pydantic.BaseModel):
-        return content.model_dump()
-    elif isinstance(content, pydantic.v1.BaseModel):
-        return content.dict()
-    elif isinstance(content, bytes):
-        # Probably a byte representation of json
-        return json.loads(content.decode())
-    else:
-        # Fallback to str
-        logger.debug(
-            f"Unknwon type {type(content)} for content {content}. Fallback to str."
-        )
-        return str(content)
+
+def json_dumps(content: Any) -> bytes:
+    """
+    Serialize content to json bytes, with orjson if it's installed. Values that aren't
+    json serializable are converted to str.
+    """
+    if orjson is not None:
+        try:
+            # Like json.dumps, convert datetimes and dataclasses with str
+            return orjson.dumps(
+                content,
+                default=str,
+                option=orjson.OPT_NON_STR_KEYS
+                | orjson.OPT_PASSTHROUGH_DATETIME
+                | orjson.OPT_PASSTHROUGH_DATACLASS,
+            )
+        except TypeError:
+            # Not supported by orjson, eg. integers larger than 64 bits
+            pass
+    return json.dumps(content, default=str).encode("utf-8")
 
 
 class MutableGenerator:
@@ -220,36 +361,107 @@ class MutableAsyncGenerator:
         return value
 
 
-def fits_in_context_window(prompt: str, context_window_size: int) -> bool:
+@functools.lru_cache(maxsize=256)
+def get_tokenizer(model: Optional[str] = None) -> "tiktoken.Encoding":
     """
-    Check if the prompt fits in the context window
-    context_window_size is the number of tokens of the context window
+    Returns the tiktoken tokenizer of a model, or the cl100k_base tokenizer if the model
+    is None or unknown. Tokenizers are loaded once per process.
     """
     try:
         import tiktoken
     except ImportError:
         raise ImportError(
-            "Please install the `tiktoken` package to use the `fits_in_context_window` function."
+            "Please install the `tiktoken` package to use the `get_tokenizer` function."
         )
 
-    encoding = tiktoken.get_encoding("cl100k_base")
-    num_tokens = len(encoding.encode(prompt))
-    return num_tokens <= context_window_size
+    if model is None:
+        return tiktoken.get_encoding("cl100k_base")
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+# Token counts, keyed by (tokenizer name, hash of the text)
+_token_counts: "OrderedDict[Tuple[str, bytes], int]" = OrderedDict()
+_token_counts_lock = threading.Lock()
+
+
+def count_tokens(text: str, model: Optional[str] = None, tokenizer=None) -> int:
+    """
+    Get the number of tokens in a text. The counts of the last texts are cached
+    (see config.TOKEN_COUNT_CACHE_SIZE), so counting the same text again is cheap.
+
+    :param model: Model whose tokenizer is used. Defaults to cl100k_base.
+    :param tokenizer: Tokenizer to use instead of the model's one.
+    """
+    if tokenizer is None:
+        tokenizer = get_tokenizer(model)
+    tokenizer_name = getattr(tokenizer, "name", None)
+    if tokenizer_name is None:
+        # Can't tell tokenizers apart, so don't cache
+        return len(tokenizer.encode(text))
+
+    # Hash the text, to not keep the texts in memory
+    digest = hashlib.blake2b(
+        text.encode("utf-8", errors="surrogatepass"), digest_size=16
+    ).digest()
+    key = (tokenizer_name, digest)
+    with _token_counts_lock:
+        nb_tokens = _token_counts.get(key)
+        if nb_tokens is not None:
+            _token_counts.move_to_end(key)
+            return nb_tokens
+
+    nb_tokens = len(tokenizer.encode(text))
+    with _token_counts_lock:
+        _token_counts[key] = nb_tokens
+        if len(_token_counts) > config.TOKEN_COUNT_CACHE_SIZE:
+            _token_counts.popitem(last=False)
+    return nb_tokens
+
+
+def fits_in_context_window(prompt: str, context_window_size: int) -> bool:
+    """
+    Check if the prompt fits in the context window
+    context_window_size is the number of tokens of the context window
+    """
+    return count_tokens(prompt) <= context_window_size
 
 
 def get_number_of_tokens(prompt: str) -> int:
     """
     Get the number of tokens in a string
     """
-    try:
-        import tiktoken
-    except ImportError:
-        raise ImportError(
-            "Please install the `tiktoken` package to use the `get_number_of_tokens` function."
-        )
+    return count_tokens(prompt)
 
-    encoding = tiktoken.get_encoding("cl100k_base")
-    return len(encoding.encode(prompt))
+
+def _encode_window(
+    encoding: "tiktoken.Encoding",
+    prompt: str,
+    nb_tokens: int,
+    from_end: bool = False,
+) -> Optional[List[int]]:
+    """
+    Encode only the beginning (or the end) of the prompt, with at least nb_tokens tokens
+    to keep and a safety margin of tokens that may be split at the window's edge.
+
+    Returns None if the window would cover the whole prompt.
+    """
+    nb_tokens_needed = nb_tokens + config.SHORTEN_TEXT_SAFETY_TOKENS
+    window_size = nb_tokens_needed * config.SHORTEN_TEXT_CHARS_PER_TOKEN
+    while window_size < len(prompt):
+        window = prompt[-window_size:] if from_end else prompt[:window_size]
+        tokens = encoding.encode(window)
+        if len(tokens) >= nb_tokens_needed:
+            # Drop the tokens at the edge of the window, which may differ from the
+            # tokens of the full prompt
+            if from_end:
+                return tokens[config.SHORTEN_TEXT_SAFETY_TOKENS :]
+            return tokens[: -config.SHORTEN_TEXT_SAFETY_TOKENS]
+        # Fewer characters per token than expected: try a bigger window
+        window_size *= 2
+    return None
 
 
 def shorten_text(
@@ -257,38 +469,62 @@ def shorten_text(
     max_length: int,
     margin: int = 20,
     how: Literal["left", "right", "center"] = "left",
+    bounded: bool = True,
 ) -> str:
     """
     Shorten the prompt to fit in the max_length by only keeping some part of the text.
-    """
-    try:
-        import tiktoken
-    except ImportError:
-        raise ImportError(
-            "Please install the `tiktoken` package to use the `shorten_text` function."
-        )
 
+    :param max_length: Maximum number of tokens of the prompt. Prompts that are too long
+        are shortened to max_length - margin tokens.
+    :param how: Keep the beginning ("left"), the end ("right") or both ends ("center")
+        of the prompt.
+    :param bounded: If True, only a window of characters proportional to max_length is
+        encoded at each end of the prompt, instead of the whole prompt. The full prompt
+        is only encoded if it's close to max_length tokens.
+    """
     if prompt is None:
         return ""
-    encoding = tiktoken.get_encoding("cl100k_base")
-    tokens = encoding.encode(prompt)
-    number_of_tokens = len(tokens)
-    if number_of_tokens <= max_length:
+    if how not in ("left", "right", "center"):
+        raise ValueError(f"Unknown value for how: {how}")
+    # A token is at least one byte
+    if len(prompt.encode("utf-8", errors="surrogatepass")) <= max_length:
         return prompt
-    else:
-        if how == "left":
-            return encoding.decode(tokens[: max_length - margin])
-        elif how == "right":
-            return encoding.decode(tokens[-(max_length - margin) :])
-        elif how == "center":
-            # Keep the beginning and the end of the text, with [...] in the middle
-            return (
-                encoding.decode(tokens[: (max_length - margin) // 2])
-                + " [...] "
-                + encoding.decode(tokens[-(max_length - margin) // 2 :])
+
+    encoding = get_tokenizer()
+    nb_tokens_to_keep = max_length - margin
+    if bounded and nb_tokens_to_keep > 0:
+        # More than max_length tokens at one end proves that the prompt is too long
+        tokens = _encode_window(
+            encoding, prompt, max(max_length, nb_tokens_to_keep) + 1, how == "right"
+        )
+        if tokens is not None:
+            if how == "left":
+                return encoding.decode(tokens[:nb_tokens_to_keep])
+            elif how == "right":
+                return encoding.decode(tokens[-nb_tokens_to_keep:])
+            end_tokens = _encode_window(
+                encoding, prompt, nb_tokens_to_keep // 2 + 1, from_end=True
             )
-        else:
-            raise ValueError(f"Unknown value for how: {how}")
+            if end_tokens is not None:
+                return (
+                    encoding.decode(tokens[: nb_tokens_to_keep // 2])
+                    + " [...] "
+                    + encoding.decode(end_tokens[-nb_tokens_to_keep // 2 :])
+                )
+
+    if count_tokens(prompt) <= max_length:
+        return prompt
+    tokens = encoding.encode(prompt)
+    if how == "left":
+        return encoding.decode(tokens[:nb_tokens_to_keep])
+    elif how == "right":
+        return encoding.decode(tokens[-nb_tokens_to_keep:])
+    # Keep the beginning and the end of the text, with [...] in the middle
+    return (
+        encoding.decode(tokens[: nb_tokens_to_keep // 2])
+        + " [...] "
+        + encoding.decode(tokens[-nb_tokens_to_keep // 2 :])
+    )
 
 
 def flatten_dict(
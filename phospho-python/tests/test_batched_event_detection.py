@@ -0,0 +1,155 @@
+import json
+
+from openai.types.chat import ChatCompletion, ChatCompletionMessage
+from openai.types.chat.chat_completion import Choice
+
+from phospho import lab
+from phospho.lab import job_library
+from phospho.models import EventDefinition, ScoreRangeSettings
+
+
+def make_response(content: str) -> ChatCompletion:
+    return ChatCompletion(
+        id="chatcmpl-test",
+        choices=[
+            Choice(
+                finish_reason="stop",
+                index=0,
+                message=ChatCompletionMessage(content=content, role="assistant"),
+            )
+        ],
+        created=1700819716,
+        model="gpt-4o",
+        object="chat.completion",
+    )
+
+
+class FakeCompletions:
+    def __init__(self, answers: dict):
+        self.answers = answers
+        self.calls = []
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        if "response_format" in kwargs:
+            return make_response(json.dumps(self.answers))
+        # Single event detection
+        return make_response("Yes")
+
+
+class FakeClient:
+    def __init__(self, answers: dict):
+        self.chat = self
+        self.completions = FakeCompletions(answers)
+
+
+EVENTS = [
+    EventDefinition(event_name="greeting", description="The user says hi"),
+    EventDefinition(event_name="question", description="The user asks a question"),
+    EventDefinition(
+        event_name="tone",
+        description="Tone of the user",
+        score_range_settings=ScoreRangeSettings(
+            score_type="category", categories=["polite", "rude"]
+        ),
+    ),
+    EventDefinition(
+        event_name="system_prompt_event",
+        description="Only in the system prompt",
+        detection_scope="system_prompt",
+    ),
+]
+
+
+async def run_workload(monkeypatch, answers: dict, batch_size: int):
+    client = FakeClient(answers)
+    monkeypatch.setattr(job_library, "get_async_client", lambda provider: client)
+    workload = lab.Workload.from_phospho_events(EVENTS[:3], batch_size=batch_size)
+    messages = [
+        lab.Message(id=f"message_{i}", role="user", content="Hi ! How are you ?")
+        for i in range(2)
+    ]
+    results = await workload.async_run(messages, executor_type="parallel_jobs")
+    return client.chat.completions.calls, results
+
+
+async def test_batched_event_detection(monkeypatch):
+    calls, results = await run_workload(
+        monkeypatch, {"greeting": "Yes", "question": "No", "tone": 1}, batch_size=10
+    )
+    # One call per message for the 3 events
+    assert len(calls) == 2
+    for message_results in results.values():
+        assert message_results["greeting"].value is True
+        assert message_results["question"].value is False
+        assert message_results["tone"].value is True
+        assert message_results["tone"].metadata["score_range"].label == "polite"
+        # The LLM call is stored once per batch
+        llm_calls = [result.metadata["llm_call"] for result in message_results.values()]
+        assert sum(llm_call is not None for llm_call in llm_calls) == 1
+
+    # With a batch size of 2, the 3 events need 2 calls per message
+    calls, _ = await run_workload(
+        monkeypatch, {"greeting": "Yes", "question": "No", "tone": 1}, batch_size=2
+    )
+    assert len(calls) == 4
+
+
+async def test_batched_event_detection_fallback(monkeypatch):
+    single_event_names = []
+
+    async def event_detection(message, event_name, **kwargs):
+        single_event_names.append(event_name)
+        return lab.JobResult(result_type=lab.ResultType.bool, value=True)
+
+    monkeypatch.setattr(job_library, "event_detection", event_detection)
+    # "tone" has an invalid answer: it's detected with its own call
+    calls, results = await run_workload(
+        monkeypatch, {"greeting": "Yes", "question": "No", "tone": 7}, batch_size=10
+    )
+    assert len(calls) == 2
+    assert single_event_names == ["tone", "tone"]
+    assert results["message_0"]["question"].value is False
+    assert results["message_0"]["tone"].value is True
+
+    # If the response can't be parsed, all the events are detected one by one
+    single_event_names.clear()
+    calls, results = await run_workload(monkeypatch, ["Yes"], batch_size=10)
+    assert sorted(single_event_names) == sorted(["greeting", "question", "tone"] * 2)
+
+
+def test_batches_are_per_detection_scope():
+    workload = lab.Workload.from_phospho_events(EVENTS, batch_size=10)
+    batch = job_library._get_event_detection_batch(
+        workload, "greeting", "task", "azure:gpt-4o", 10
+    )
+    assert [event["event_name"] for event in batch] == ["greeting", "question", "tone"]
+    # Without batching, the events are detected one by one
+    workload = lab.Workload.from_phospho_events(EVENTS)
+    assert workload.jobs["greeting"].job_function is job_library.event_detection
+
+
+async def test_batches_are_cleared_when_jobs_are_skipped(monkeypatch):
+    client = FakeClient({"greeting": "Yes", "question": "No", "tone": 1})
+    monkeypatch.setattr(job_library, "get_async_client", lambda provider: client)
+    workload = lab.Workload.from_phospho_events(EVENTS[:3], batch_size=10)
+    # "tone" never reads the results of its batch
+    workload.jobs["tone"].sample = 0
+    messages = [
+        lab.Message(id=f"message_{i}", role="user", content="Hi ! How are you ?")
+        for i in range(5)
+    ]
+    nb_batches = []
+    async for _ in workload.astream(messages, max_parallelism=2):
+        nb_batches.append(len(job_library._event_detection_batches[workload]))
+    assert len(nb_batches) == 10
+    # The batches of a message are cleared once its jobs completed
+    assert max(nb_batches) <= 2
+    assert len(client.chat.completions.calls) == 5
+    assert job_library._event_detection_batches.get(workload) == {}
+
+    # A new run calls the LLM again
+    client.chat.completions.answers = {"greeting": "No", "question": "No", "tone": 1}
+    results = await workload.async_run(messages[:1], executor_type="sequential")
+    assert results["message_0"]["greeting"].value is False
+    assert job_library._event_detection_batches.get(workload) == {}
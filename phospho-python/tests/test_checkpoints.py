@@ -0,0 +1,132 @@
+import pytest
+
+from phospho import lab
+
+NB_MESSAGES = 6
+
+
+def make_workload(calls: list, checkpoint_store: lab.CheckpointStore) -> lab.Workload:
+    async def word_count(message: lab.Message) -> lab.JobResult:
+        calls.append(message.id)
+        return lab.JobResult(
+            result_type=lab.ResultType.literal, value=len(message.content.split())
+        )
+
+    workload = lab.Workload(checkpoint_store=checkpoint_store)
+    workload.add_job(lab.Job(id="word_count", job_function=word_count))
+    return workload
+
+
+MESSAGES = [
+    lab.Message(id=f"message_{i}", content="word " * i) for i in range(NB_MESSAGES)
+]
+
+
+@pytest.mark.parametrize(
+    "store_class", [lab.SQLiteCheckpointStore, lab.JSONLCheckpointStore]
+)
+async def test_resume_interrupted_run(tmp_path, store_class):
+    path = str(tmp_path / "checkpoint")
+    calls: list = []
+    workload = make_workload(calls, store_class(path))
+    # The run is interrupted after 2 results
+    async for _ in workload.astream(MESSAGES, max_parallelism=1):
+        if len(calls) == 2:
+            break
+    assert calls == ["message_0", "message_1"]
+
+    # A new process resumes the run
+    calls.clear()
+    workload = make_workload(calls, store_class(path))
+    results = await workload.async_run(MESSAGES)
+    assert sorted(calls) == [f"message_{i}" for i in range(2, NB_MESSAGES)]
+    assert {
+        message_id: job_results["word_count"].value
+        for message_id, job_results in results.items()
+    } == {f"message_{i}": i for i in range(NB_MESSAGES)}
+
+    # Everything is completed: the jobs are not run again
+    calls.clear()
+    workload = make_workload(calls, store_class(path))
+    results = await workload.async_run(MESSAGES, executor_type="sequential")
+    assert results["message_3"]["word_count"].value == 3
+    assert calls == []
+    # astream doesn't yield the results again
+    assert [result async for result in workload.astream(MESSAGES)] == []
+
+
+def word_count(message: lab.Message) -> lab.JobResult:
+    return lab.JobResult(
+        result_type=lab.ResultType.literal, value=len(message.content.split())
+    )
+
+
+def test_resume_process_run(tmp_path):
+    path = str(tmp_path / "checkpoint.jsonl")
+    store = lab.JSONLCheckpointStore(path)
+    store.set("message_1", "word_count", lab.JobResult(result_type="literal", value=-1))
+
+    workload = lab.Workload(checkpoint_store=lab.JSONLCheckpointStore(path))
+    workload.add_job(lab.Job(id="word_count", job_function=word_count))
+    results = workload.run(MESSAGES, executor_type="process", max_parallelism=2)
+    # The checkpointed result is not computed again
+    assert results["message_1"]["word_count"].value == -1
+    assert results["message_2"]["word_count"].value == 2
+    assert lab.JSONLCheckpointStore(path).get("message_5", "word_count").value == 5
+
+
+def test_checkpoint_store_commit(tmp_path):
+    path = str(tmp_path / "checkpoint.sqlite")
+    store = lab.SQLiteCheckpointStore(path, autocommit=False)
+    result = lab.JobResult(
+        result_type=lab.ResultType.bool, value=True, metadata={"score": 0.5}
+    )
+    store.set("message", "job", result)
+    assert store.get("message", "job") == result
+    # Not persisted until the commit
+    assert lab.SQLiteCheckpointStore(path).get("message", "job") is None
+    store.commit()
+    assert lab.SQLiteCheckpointStore(path).get("message", "job") == result
+
+
+def test_jsonl_checkpoint_store_ignores_incomplete_lines(tmp_path):
+    path = str(tmp_path / "checkpoint.jsonl")
+    store = lab.JSONLCheckpointStore(path)
+    store.set("message", "job", lab.JobResult(result_type="bool", value=True))
+    with open(path, "a") as f:
+        # The process died while writing
+        f.write('{"message_id": "message_2", "job_id": "job", "res')
+    store = lab.JSONLCheckpointStore(path)
+    assert store.get("message", "job").value is True
+    assert store.get("message_2", "job") is None
+
+
+def test_checkpoint_store_commit_keys(tmp_path):
+    path = str(tmp_path / "checkpoint.sqlite")
+    store = lab.SQLiteCheckpointStore(path, autocommit=False)
+    result = lab.JobResult(result_type=lab.ResultType.bool, value=True)
+    store.set("message_1", "job", result)
+    store.set("message_2", "job", result)
+    # Only the results saved are committed, the others stay pending
+    store.commit([("message_1", "job")])
+    assert lab.SQLiteCheckpointStore(path).get("message_1", "job") == result
+    assert lab.SQLiteCheckpointStore(path).get("message_2", "job") is None
+    assert store.get("message_2", "job") == result
+    store.commit()
+    assert lab.SQLiteCheckpointStore(path).get("message_2", "job") == result
+
+
+async def test_errors_are_not_checkpointed(tmp_path):
+    path = str(tmp_path / "checkpoint.sqlite")
+    calls: list = []
+
+    async def rate_limited(message: lab.Message) -> lab.JobResult:
+        calls.append(message.id)
+        return lab.JobResult(result_type=lab.ResultType.error, value=None)
+
+    for _ in range(2):
+        workload = lab.Workload(checkpoint_store=lab.SQLiteCheckpointStore(path))
+        workload.add_job(lab.Job(id="rate_limited", job_function=rate_limited))
+        await workload.async_run(MESSAGES[:2])
+    # The errors are run again on resume
+    assert sorted(calls) == ["message_0", "message_0", "message_1", "message_1"]
@@ -0,0 +1,130 @@
+import gzip
+import json
+
+import pytest
+
+from phospho.client import Client, PhosphoClientSideError
+
+BASE_URL = "http://phospho.test"
+
+
+def test_post_log_batch_is_gzipped(requests_mock):
+    client = Client(api_key="key", project_id="project", base_url=BASE_URL)
+    requests_mock.post(f"{BASE_URL}/v2/log/project", json={"logged_events": []})
+
+    batch = [{"task_id": f"task_{i}", "input": "hello " * 100} for i in range(10)]
+    client._post("/log/project", {"batched_log_events": batch}, compress=True)
+
+    request = requests_mock.last_request
+    assert request.headers["content-encoding"] == "gzip"
+    assert json.loads(gzip.decompress(request.body)) == {"batched_log_events": batch}
+
+
+def test_post_small_payload_is_not_compressed(requests_mock):
+    client = Client(api_key="key", project_id="project", base_url=BASE_URL)
+    requests_mock.post(f"{BASE_URL}/v2/log/project", json={"logged_events": []})
+
+    client._post("/log/project", {"batched_log_events": []}, compress=True)
+    request = requests_mock.last_request
+    assert "content-encoding" not in request.headers
+    assert request.json() == {"batched_log_events": []}
+
+    # Compression can be disabled on the client
+    client = Client(
+        api_key="key", project_id="project", base_url=BASE_URL, compress=False
+    )
+    client._post("/log/project", {"input": "hello " * 1000}, compress=True)
+    assert "content-encoding" not in requests_mock.last_request.headers
+
+
+def test_post_falls_back_to_uncompressed(requests_mock):
+    client = Client(api_key="key", project_id="project", base_url=BASE_URL)
+    payload = {"batched_log_events": [{"input": "hello " * 1000}]}
+
+    def log_project(request, context):
+        # A backend that doesn't support gzipped bodies
+        if request.headers.get("content-encoding") == "gzip":
+            context.status_code = 422
+            return {"detail": "Invalid body"}
+        return {"logged_events": []}
+
+    requests_mock.post(f"{BASE_URL}/v2/log/project", json=log_project)
+    client._post("/log/project", payload, compress=True)
+    assert [
+        request.headers.get("content-encoding")
+        for request in requests_mock.request_history
+    ] == ["gzip", None]
+    assert requests_mock.last_request.json() == payload
+
+    # The fallback is remembered
+    client._post("/log/project", payload, compress=True)
+    assert requests_mock.call_count == 3
+    assert "content-encoding" not in requests_mock.last_request.headers
+
+
+def test_post_invalid_payload_keeps_compression(requests_mock):
+    client = Client(api_key="key", project_id="project", base_url=BASE_URL)
+    payload = {"batched_log_events": [{"input": "hello " * 1000}]}
+    # A validation error of the payload, gzipped or not
+    requests_mock.post(
+        f"{BASE_URL}/v2/log/project", status_code=422, json={"detail": "Invalid"}
+    )
+    with pytest.raises(PhosphoClientSideError):
+        client._post("/log/project", payload, compress=True)
+    assert requests_mock.call_count == 2
+    assert client.compress is True
+
+    requests_mock.post(f"{BASE_URL}/v2/log/project", json={"logged_events": []})
+    client._post("/log/project", payload, compress=True)
+    assert requests_mock.last_request.headers["content-encoding"] == "gzip"
+
+
+def test_session_is_reused(requests_mock):
+    client = Client(api_key="key", project_id="project", base_url=BASE_URL)
+    requests_mock.get(f"{BASE_URL}/v2/tasks/task_0", json={})
+
+    session = client._session
+    client._get("/tasks/task_0")
+    client._get("/tasks/task_0")
+    assert client._session is session
+    assert requests_mock.call_count == 2
+
+
+def test_tasks_iter(requests_mock):
+    client = Client(api_key="key", project_id="project", base_url=BASE_URL)
+    pages = {
+        None: {"tasks": [{"id": "task_3"}, {"id": "task_2"}], "next_cursor": "c1"},
+        "c1": {"tasks": [{"id": "task_1"}], "next_cursor": None},
+    }
+    requests_mock.post(
+        f"{BASE_URL}/v2/projects/project/tasks/page",
+        json=lambda request, context: pages[request.json()["cursor"]],
+    )
+
+    for prefetch in [True, False]:
+        tasks = client.tasks.iter(page_size=2, prefetch=prefetch)
+        assert [task.id for task in tasks] == ["task_3", "task_2", "task_1"]
+        request = requests_mock.last_request.json()
+        assert request["page_size"] == 2
+        assert request["cursor"] == "c1"
+
+    # The content is kept as a dict
+    task = next(client.tasks.iter())
+    assert task.content == {"id": "task_3"}
+
+
+def test_tasks_flat_arrow(requests_mock):
+    pa = pytest.importorskip("pyarrow")
+    client = Client(api_key="key", project_id="project", base_url=BASE_URL)
+    table = pa.table({"task_id": ["task_0", "task_1"], "task_created_at": [1, 2]})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    requests_mock.post(
+        f"{BASE_URL}/v2/projects/project/tasks/flat",
+        content=sink.getvalue().to_pybytes(),
+        headers={"content-type": "application/vnd.apache.arrow.stream"},
+    )
+
+    assert client.tasks_flat(format="arrow").equals(table)
+    assert requests_mock.last_request.json()["format"] == "arrow"
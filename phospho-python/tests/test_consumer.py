@@ -0,0 +1,220 @@
+import asyncio
+import atexit
+import gzip
+import json
+import threading
+
+import httpx
+import phospho
+from phospho.client import Client
+from phospho.consumer import AsyncConsumer, BatchStats, Consumer, split_batch
+from phospho.log_queue import Event, LogQueue
+from phospho.utils import json_dumps
+
+BASE_URL = "http://phospho.test"
+
+
+def make_async_http_client(received: list, status_code: int = 200):
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = request.content
+        if request.headers.get("content-encoding") == "gzip":
+            body = gzip.decompress(body)
+        received.append(json.loads(body))
+        return httpx.Response(status_code, json={"logged_events": []})
+
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+async def test_async_consumer_sends_batch():
+    received: list = []
+    client = Client(
+        api_key="key",
+        project_id="project",
+        base_url=BASE_URL,
+        async_http_client=make_async_http_client(received),
+    )
+    log_queue = LogQueue()
+    consumer = AsyncConsumer(log_queue=log_queue, client=client, tick=0.01)
+    consumer.start()
+
+    log_queue.append(Event(id="task_0", content={"task_id": "task_0"}))
+    await asyncio.sleep(0.1)
+    assert received == [{"batched_log_events": [{"task_id": "task_0"}]}]
+
+    consumer.running = False
+    await asyncio.sleep(0.05)
+    assert consumer.task is not None and consumer.task.done()
+
+
+async def test_async_consumer_requeues_on_error():
+    received: list = []
+    client = Client(
+        api_key="key",
+        project_id="project",
+        base_url=BASE_URL,
+        async_http_client=make_async_http_client(received, status_code=500),
+    )
+    log_queue = LogQueue()
+    consumer = AsyncConsumer(log_queue=log_queue, client=client)
+
+    log_queue.append(Event(id="task_0", content={"task_id": "task_0"}))
+    await consumer.asend_batch()
+    assert len(received) == 1
+    assert consumer.nb_consecutive_errors == 1
+    assert list(log_queue.events.keys()) == ["task_0"]
+    log_queue.get_batch()
+
+
+async def test_init_async_mode():
+    received: list = []
+    phospho.init(
+        api_key="key",
+        project_id="project",
+        base_url=BASE_URL,
+        async_mode=True,
+        async_http_client=make_async_http_client(received),
+        tick=60,
+    )
+    assert isinstance(phospho.consumer, AsyncConsumer)
+
+    phospho.log(input="hello", output="world")
+    await phospho.aflush()
+    assert len(received) > 0
+    batch = [e for r in received for e in r["batched_log_events"]]
+    assert batch[-1]["input"] == "hello"
+    assert batch[-1]["output"] == "world"
+    phospho.consumer.running = False
+
+
+def make_events(nb_events: int):
+    return [{"task_id": f"task_{i}", "input": "hello"} for i in range(nb_events)]
+
+
+def test_split_batch():
+    batch = make_events(10)
+    event_size = len(json_dumps(batch[0]))
+
+    chunks = split_batch(batch, max_events=3)
+    assert [len(chunk) for chunk, _ in chunks] == [3, 3, 3, 1]
+    assert [event for chunk, _ in chunks for event in chunk] == batch
+    assert chunks[0][1] == 3 * event_size
+
+    chunks = split_batch(batch, max_bytes=4 * event_size)
+    assert [len(chunk) for chunk, _ in chunks] == [4, 4, 2]
+
+    # An event bigger than max_bytes is sent alone
+    chunks = split_batch(batch[:2], max_bytes=1)
+    assert [len(chunk) for chunk, _ in chunks] == [1, 1]
+
+
+def test_consumer_splits_batch(requests_mock):
+    client = Client(api_key="key", project_id="project", base_url=BASE_URL)
+    stats: list = []
+    log_queue = LogQueue()
+    consumer = Consumer(
+        log_queue=log_queue,
+        client=client,
+        max_batch_size=4,
+        stats_hook=stats.append,
+    )
+    # The consumer thread isn't started in this test
+    atexit.unregister(consumer.stop)
+
+    # The second request fails: only the events not sent are put back in the queue
+    requests_mock.post(
+        f"{BASE_URL}/v2/log/project",
+        [{"json": {}}, {"status_code": 503}, {"json": {}}],
+    )
+    for event in make_events(10):
+        log_queue.append(Event(id=event["task_id"], content=event))
+    consumer.send_batch()
+    assert requests_mock.call_count == 2
+    assert list(log_queue.events.keys()) == [f"task_{i}" for i in range(4, 10)]
+    assert [(s.nb_events, s.success) for s in stats] == [(4, True), (4, False)]
+    assert all(isinstance(s, BatchStats) and s.nb_bytes > 0 for s in stats)
+
+    consumer.send_batch()
+    assert requests_mock.call_count == 4
+    assert log_queue.events == {}
+    assert consumer.nb_consecutive_errors == 0
+
+
+def test_consumer_parallel_senders(requests_mock):
+    client = Client(api_key="key", project_id="project", base_url=BASE_URL)
+    log_queue = LogQueue()
+    consumer = Consumer(
+        log_queue=log_queue, client=client, max_batch_size=10, nb_senders=4
+    )
+    atexit.unregister(consumer.stop)
+
+    sender_threads = set()
+
+    def callback(request, context):
+        sender_threads.add(threading.current_thread().name)
+        return {}
+
+    requests_mock.post(f"{BASE_URL}/v2/log/project", json=callback)
+    for event in make_events(100):
+        log_queue.append(Event(id=event["task_id"], content=event))
+    consumer.send_batch()
+    consumer._shutdown_executor()
+
+    assert requests_mock.call_count == 10
+    sent = [
+        e for r in requests_mock.request_history for e in r.json()["batched_log_events"]
+    ]
+    assert sorted(e["task_id"] for e in sent) == sorted(f"task_{i}" for i in range(100))
+    assert all(name.startswith("phospho-sender") for name in sender_threads)
+
+
+async def test_async_consumer_splits_batch():
+    received: list = []
+    client = Client(
+        api_key="key",
+        project_id="project",
+        base_url=BASE_URL,
+        async_http_client=make_async_http_client(received),
+    )
+    log_queue = LogQueue()
+    consumer = AsyncConsumer(
+        log_queue=log_queue, client=client, max_batch_size=3, nb_senders=2
+    )
+    for event in make_events(10):
+        log_queue.append(Event(id=event["task_id"], content=event))
+    await consumer.asend_batch()
+    assert sorted(len(r["batched_log_events"]) for r in received) == [1, 3, 3, 3]
+
+
+async def test_async_consumer_cancelled_requeues_events_not_sent():
+    received: list = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        received.append(json.loads(request.content))
+        if len(received) > 1:
+            # The second request hangs until the send is cancelled
+            await asyncio.sleep(10)
+        return httpx.Response(200, json={"logged_events": []})
+
+    client = Client(
+        api_key="key",
+        project_id="project",
+        base_url=BASE_URL,
+        compress=False,
+        async_http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+    log_queue = LogQueue()
+    consumer = AsyncConsumer(log_queue=log_queue, client=client, max_batch_size=2)
+    for event in make_events(6):
+        log_queue.append(Event(id=event["task_id"], content=event))
+
+    task = asyncio.create_task(consumer.asend_batch())
+    await asyncio.sleep(0.1)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    assert len(received) == 2
+    # The first chunk was sent: only the others are put back
+    assert list(log_queue.events.keys()) == ["task_2", "task_3", "task_4", "task_5"]
+    log_queue.get_batch()
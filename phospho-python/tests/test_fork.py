@@ -0,0 +1,122 @@
+import gzip
+import json
+import multiprocessing
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import phospho
+import pytest
+
+pytestmark = pytest.mark.skipif(
+    sys.platform == "win32", reason="fork is not available on Windows"
+)
+
+NB_WORKERS = 3
+NB_EVENTS_PER_WORKER = 5
+
+
+class LogServer:
+    """Local backend receiving the log events sent by the workers"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.task_ids = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                events = json.loads(body)["batched_log_events"]
+                with server.lock:
+                    server.task_ids.extend(event["task_id"] for event in events)
+                response = json.dumps({"logged_events": []}).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.http_server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.http_server.daemon_threads = True
+        self.thread = threading.Thread(
+            target=self.http_server.serve_forever, daemon=True
+        )
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.http_server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "LogServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.http_server.shutdown()
+        self.http_server.server_close()
+
+
+def worker(worker_id: int) -> None:
+    for i in range(NB_EVENTS_PER_WORKER):
+        phospho.log(
+            input="Say hi",
+            output="Hi",
+            task_id=f"task_{worker_id}_{i}",
+        )
+    # Workers exit without running atexit: send the last logs
+    phospho.consumer.stop()
+
+
+def test_log_from_forked_workers():
+    with LogServer() as server:
+        # phospho.init is called once, in the master process
+        phospho.init(
+            api_key="test", project_id="test", base_url=server.base_url, tick=0.05
+        )
+        context = multiprocessing.get_context("fork")
+        # Simulate a thread of the master logging while the workers are forked
+        with phospho.log_queue.lock:
+            workers = [
+                context.Process(target=worker, args=(worker_id,))
+                for worker_id in range(NB_WORKERS)
+            ]
+            for process in workers:
+                process.start()
+        for process in workers:
+            process.join(timeout=30)
+            assert process.exitcode == 0, "The worker didn't log its events"
+
+        # The master still logs
+        phospho.log(input="Say hi", output="Hi", task_id="task_master")
+        phospho.consumer.stop()
+
+    assert sorted(server.task_ids) == sorted(
+        [
+            f"task_{worker_id}_{i}"
+            for worker_id in range(NB_WORKERS)
+            for i in range(NB_EVENTS_PER_WORKER)
+        ]
+        + ["task_master"]
+    )
+
+
+def test_events_of_the_parent_are_not_inherited():
+    phospho.init(api_key="test", project_id="test", tick=0.05)
+    phospho.consumer.stop()
+    phospho.log(input="Say hi", output="Hi", task_id="task_parent")
+
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    process = context.Process(
+        target=lambda: queue.put(list(phospho.log_queue.events.keys()))
+    )
+    process.start()
+    process.join(timeout=30)
+    assert queue.get(timeout=5) == []
+    assert list(phospho.log_queue.events.keys()) == ["task_parent"]
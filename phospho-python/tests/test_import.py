@@ -0,0 +1,56 @@
+import subprocess
+import sys
+from typing import List
+
+# Heavy optional dependencies that must only be imported when they are used
+LAZY_MODULES = [
+    "pandas",
+    "openai",
+    "tiktoken",
+    "tqdm",
+    "opentelemetry",
+    "phospho.lab",
+    "phospho.testing",
+    "phospho.tracing",
+]
+
+
+def imported_modules(code: str) -> List[str]:
+    """Run code in a fresh interpreter and return the modules it imported."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or line.endswith("| imported package"):
+            continue
+        modules.append(line.split("|")[-1].strip())
+    return modules
+
+
+def test_import_phospho_is_lightweight():
+    modules = imported_modules("import phospho")
+    assert "phospho" in modules
+    for module in LAZY_MODULES:
+        assert not any(
+            m == module or m.startswith(module + ".") for m in modules
+        ), f"`import phospho` should not import {module}"
+
+
+def test_lazy_attributes():
+    import phospho
+
+    assert phospho.lab.Workload is not None
+    from phospho.testing import PhosphoTest
+
+    assert phospho.PhosphoTest is PhosphoTest
+    assert "lab" in dir(phospho)
+
+    try:
+        phospho.does_not_exist
+        assert False, "Unknown attributes should raise AttributeError"
+    except AttributeError:
+        pass
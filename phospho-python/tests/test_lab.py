@@ -1,3 +1,5 @@
+import asyncio
+
 import pytest
 from phospho import lab
 
@@ -117,3 +119,48 @@ async def test_evaluation():
 
     await workload.async_run(messages=messages, executor_type="parallel")
     assert len(workload.results) == 1
+
+
+@pytest.mark.asyncio
+async def test_astream():
+    nb_running = 0
+    max_nb_running = 0
+
+    async def word_count(message: lab.Message) -> lab.JobResult:
+        nonlocal nb_running, max_nb_running
+        nb_running += 1
+        max_nb_running = max(max_nb_running, nb_running)
+        # Longer messages take longer
+        await asyncio.sleep(0.01 * len(message.content))
+        nb_running -= 1
+        return lab.JobResult(
+            result_type=lab.ResultType.literal, value=len(message.content.split())
+        )
+
+    workload = lab.Workload()
+    workload.add_job(lab.Job(id="word_count", job_function=word_count))
+
+    def messages():
+        # Messages can be generated lazily
+        for i in range(10, 0, -1):
+            yield lab.Message(id=f"message_{i}", content="word " * i)
+
+    results = []
+    async for message_id, job_id, job_result in workload.astream(
+        messages(), max_parallelism=3
+    ):
+        results.append((message_id, job_id, job_result.value))
+
+    assert sorted(results) == sorted(
+        [(f"message_{i}", "word_count", i) for i in range(1, 11)]
+    )
+    # Results are yielded as they complete: short messages first
+    assert results[0] == ("message_8", "word_count", 8)
+    assert max_nb_running == 3
+    # The results are not retained
+    assert workload.jobs["word_count"].results == {}
+    assert workload._results is None
+
+    async for _ in workload.astream(messages(), keep_results=True):
+        pass
+    assert workload.results["message_1"]["word_count"].value == 1
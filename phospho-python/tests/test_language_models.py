@@ -0,0 +1,73 @@
+import asyncio
+
+from phospho import lab
+from phospho.lab.language_models import (
+    aclose_clients,
+    close_clients,
+    get_async_client,
+    get_sync_client,
+)
+
+
+async def test_async_clients_are_shared(monkeypatch):
+    monkeypatch.setenv("MISTRAL_API_KEY", "test-mistral")
+    client = get_async_client("mistral")
+    assert get_async_client("mistral") is client
+    assert get_async_client("mistral", api_key="test-mistral") is client
+    # Another api key, or another provider, has its own client
+    assert get_async_client("mistral", api_key="other-key") is not client
+    assert get_async_client("together", api_key="test-together") is not client
+
+    await aclose_clients()
+    assert client.is_closed()
+    assert get_async_client("mistral") is not client
+    await aclose_clients()
+
+
+def test_async_clients_are_per_event_loop(monkeypatch):
+    monkeypatch.setenv("MISTRAL_API_KEY", "test-mistral")
+
+    async def get_client():
+        client = get_async_client("mistral")
+        assert get_async_client("mistral") is client
+        return client
+
+    # The connections of a client can't be used by another event loop
+    assert asyncio.run(get_client()) is not asyncio.run(get_client())
+
+
+def test_sync_clients_are_shared(monkeypatch):
+    monkeypatch.setenv("MISTRAL_API_KEY", "test-mistral")
+    client = get_sync_client("mistral")
+    assert get_sync_client("mistral") is client
+    assert get_sync_client("mistral", api_key="other-key") is not client
+
+    close_clients()
+    assert client.is_closed()
+    assert get_sync_client("mistral") is not client
+    close_clients()
+
+
+def test_workload_run_reuses_clients(monkeypatch):
+    monkeypatch.setenv("MISTRAL_API_KEY", "test-mistral")
+    clients = []
+
+    async def get_client(message: lab.Message) -> lab.JobResult:
+        clients.append(get_async_client("mistral"))
+        return lab.JobResult(result_type=lab.ResultType.bool, value=True)
+
+    workload = lab.Workload()
+    workload.add_job(lab.Job(id="get_client", job_function=get_client))
+    messages = [lab.Message(id=f"message_{i}", content="Hi") for i in range(5)]
+    workload.run(messages, executor_type="sequential")
+
+    # The jobs share the client, which is closed at the end of the run
+    assert len(clients) == 5
+    assert all(client is clients[0] for client in clients)
+    assert clients[0].is_closed()
+
+    clients.clear()
+    workload.run(messages, executor_type="parallel", max_parallelism=2)
+    assert len(clients) == 5
+    assert len(set(map(id, clients))) <= 2
+    assert all(client.is_closed() for client in clients)
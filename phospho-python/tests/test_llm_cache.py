@@ -0,0 +1,140 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from openai.types.chat import ChatCompletion, ChatCompletionMessage
+from openai.types.chat.chat_completion import Choice
+
+from phospho.lab.llm_cache import (
+    InMemoryLLMCache,
+    SQLiteLLMCache,
+    cached_chat_completion,
+    llm_cache_key,
+    set_llm_cache,
+)
+
+MESSAGES = [{"role": "user", "content": "Say hi !"}]
+
+
+def make_response(content: str) -> ChatCompletion:
+    return ChatCompletion(
+        id="chatcmpl-test",
+        choices=[
+            Choice(
+                finish_reason="stop",
+                index=0,
+                message=ChatCompletionMessage(content=content, role="assistant"),
+            )
+        ],
+        created=1700819716,
+        model="gpt-4o",
+        object="chat.completion",
+    )
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.nb_calls = 0
+
+    async def create(self, **kwargs):
+        self.nb_calls += 1
+        return make_response(f"Hello {self.nb_calls}")
+
+
+def test_llm_cache_key():
+    key = llm_cache_key("openai", "gpt-4o", messages=MESSAGES, temperature=0)
+    assert key == llm_cache_key("openai", "gpt-4o", temperature=0, messages=MESSAGES)
+    assert key == llm_cache_key(
+        "openai", "gpt-4o", messages=MESSAGES, temperature=0, timeout=10
+    )
+    assert key != llm_cache_key("openai", "gpt-4o", messages=MESSAGES, temperature=1)
+    assert key != llm_cache_key("azure", "gpt-4o", messages=MESSAGES, temperature=0)
+
+
+def test_in_memory_llm_cache():
+    llm_cache = InMemoryLLMCache(max_size=2)
+    llm_cache.set("a", {"value": 1})
+    llm_cache.set("b", {"value": 2})
+    assert llm_cache.get("a") == {"value": 1}
+    # b is the least recently used
+    llm_cache.set("c", {"value": 3})
+    assert llm_cache.get("b") is None
+    assert llm_cache.get("c") == {"value": 3}
+    assert llm_cache.stats() == {"nb_hits": 2, "nb_misses": 1}
+
+    llm_cache = InMemoryLLMCache(ttl=0.05)
+    llm_cache.set("a", {"value": 1})
+    assert llm_cache.get("a") is not None
+    time.sleep(0.1)
+    assert llm_cache.get("a") is None
+
+
+def test_sqlite_llm_cache(tmp_path):
+    path = str(tmp_path / "llm_cache.sqlite")
+    SQLiteLLMCache(path).set("a", {"value": 1})
+    # The responses are persisted
+    assert SQLiteLLMCache(path).get("a") == {"value": 1}
+    assert SQLiteLLMCache(path).get("b") is None
+
+    llm_cache = SQLiteLLMCache(path, ttl=0.05)
+    time.sleep(0.1)
+    assert llm_cache.get("a") is None
+    llm_cache.set("b", {"value": 2})
+    llm_cache.purge_expired()
+    assert llm_cache.get("b") == {"value": 2}
+
+
+async def test_cached_chat_completion(tmp_path):
+    client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+    try:
+        set_llm_cache(None)
+        response, metadata = await cached_chat_completion(
+            client, "openai", "test-cache", messages=MESSAGES
+        )
+        assert "llm_cache_hit" not in metadata
+
+        set_llm_cache(SQLiteLLMCache(str(tmp_path / "llm_cache.sqlite")))
+        responses = []
+        for _ in range(2):
+            response, metadata = await cached_chat_completion(
+                client, "openai", "test-cache", messages=MESSAGES, max_tokens=5
+            )
+            responses.append(response)
+        # The second call is answered from the cache
+        assert client.chat.completions.nb_calls == 2
+        assert isinstance(responses[1], ChatCompletion)
+        assert responses[1].choices[0].message.content == "Hello 2"
+        assert responses[1] == responses[0]
+        assert metadata == {
+            "rate_limit_delay": 0.0,
+            "llm_cache_hit": True,
+            "llm_cache_nb_hits": 1,
+            "llm_cache_nb_misses": 1,
+        }
+    finally:
+        set_llm_cache(None)
+
+
+async def test_sqlite_llm_cache_does_not_block_the_event_loop(tmp_path):
+    threads = []
+
+    class RecordingSQLiteLLMCache(SQLiteLLMCache):
+        def _get(self, key):
+            threads.append(threading.get_ident())
+            return super()._get(key)
+
+        def _set(self, key, value):
+            threads.append(threading.get_ident())
+            super()._set(key, value)
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=FakeCompletions()))
+    try:
+        set_llm_cache(RecordingSQLiteLLMCache(str(tmp_path / "llm_cache.sqlite")))
+        await cached_chat_completion(
+            client, "openai", "test-cache-thread", messages=MESSAGES
+        )
+        # The get and the set run in other threads than the one of the event loop
+        assert len(threads) == 2
+        assert threading.get_ident() not in threads
+    finally:
+        set_llm_cache(None)
@@ -8,6 +8,7 @@ from openai.types.chat.chat_completion import Choice
 from openai.types.chat.chat_completion_chunk import Choice as chunk_Choice
 from openai.types.chat.chat_completion_chunk import ChoiceDelta
 from openai.types.completion_usage import CompletionUsage
+from phospho.log_queue import estimate_event_size
 
 logger = logging.getLogger(__name__)
 
@@ -471,3 +472,44 @@ async def test_async_stream():
     assert i <= len(MOCK_OPENAI_STREAM_RESPONSE), str(r)
 
     time.sleep(0.1)
+
+
+def test_stream_fusion():
+    phospho.init(api_key="test", project_id="test", tick=60)
+    task_id = "task_stream_fusion"
+    chunks = ["Hello", " you", None, "!"]
+    for chunk in chunks:
+        phospho._log_single_event(
+            input="Say hi",
+            output=chunk,
+            raw_output={"chunk": chunk},
+            task_id=task_id,
+            to_log=False,
+        )
+    event = phospho.log_queue.events[task_id]
+    # The chunks are accumulated, not concatenated at every step
+    assert event.output_parts == ["Hello", " you", "!"]
+    assert event.content["raw_output"][-1] == {"chunk": "!"}
+    assert phospho.log_queue.get_batch() == []
+
+    phospho._log_single_event(input="Say hi", output=None, task_id=task_id, to_log=True)
+    batch = phospho.log_queue.get_batch()
+    assert len(batch) == 1
+    assert batch[0]["output"] == "Hello you!"
+    assert batch[0]["raw_output"] == [{"chunk": chunk} for chunk in chunks]
+
+
+def test_stream_size_counts_bytes():
+    phospho.init(api_key="test", project_id="test", max_queue_bytes=1_000_000)
+    task_id = "task_stream_size"
+    for _ in range(4):
+        # "é" is 2 bytes in utf-8
+        phospho._log_single_event(
+            input="Dis bonjour", output="é" * 100, task_id=task_id, to_log=False
+        )
+    # The size tracked as the chunks are added matches the size of the event
+    event = phospho.log_queue.events[task_id]
+    assert (
+        abs(phospho.log_queue.events_size[task_id] - estimate_event_size(event)) < 100
+    )
+    phospho.log_queue.get_batch()
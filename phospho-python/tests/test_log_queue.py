@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+from phospho.log_queue import Event, LogQueue
+
+
+def make_event(i: int, to_log: bool = True, text: str = "hello") -> Event:
+    return Event(
+        id=f"task_{i}",
+        content={"task_id": f"task_{i}", "input": text},
+        to_log=to_log,
+    )
+
+
+def test_unbounded_queue():
+    log_queue = LogQueue()
+    for i in range(100):
+        log_queue.append(make_event(i))
+    assert len(log_queue.events) == 100
+    assert len(log_queue.get_batch()) == 100
+    assert log_queue.nb_dropped_events == 0
+
+
+def test_drop_oldest():
+    log_queue = LogQueue(max_events=3, overflow_policy="drop_oldest")
+    for i in range(5):
+        log_queue.append(make_event(i))
+    assert list(log_queue.events.keys()) == ["task_2", "task_3", "task_4"]
+    assert log_queue.nb_dropped_events == 2
+
+
+def test_drop_newest():
+    log_queue = LogQueue(max_events=3, overflow_policy="drop_newest")
+    for i in range(5):
+        log_queue.append(make_event(i))
+    assert list(log_queue.events.keys()) == ["task_0", "task_1", "task_2"]
+    assert log_queue.nb_dropped_events == 2
+
+
+def test_max_bytes():
+    log_queue = LogQueue(max_bytes=200, overflow_policy="drop_oldest")
+    for i in range(10):
+        log_queue.append(make_event(i))
+    assert 0 < log_queue.total_bytes <= 200
+    assert log_queue.nb_dropped_events > 0
+    assert sum(log_queue.events_size.values()) == log_queue.total_bytes
+
+    # An event bigger than the whole queue is always dropped
+    nb_dropped_events = log_queue.nb_dropped_events
+    log_queue.append(make_event(100, text="x" * 1000))
+    assert "task_100" not in log_queue.events
+    assert log_queue.nb_dropped_events == nb_dropped_events + 1
+
+    log_queue.get_batch()
+    assert log_queue.total_bytes == 0
+
+
+def test_sample():
+    log_queue = LogQueue(max_events=10, overflow_policy="sample")
+    for i in range(1000):
+        log_queue.append(make_event(i))
+    assert len(log_queue.events) == 10
+    assert log_queue.nb_dropped_events == 990
+
+
+def test_block():
+    log_queue = LogQueue(max_events=1, overflow_policy="block", block_timeout=0.05)
+    log_queue.append(make_event(0))
+
+    # Nobody drains the queue: the event is dropped after the timeout
+    start = time.monotonic()
+    log_queue.append(make_event(1))
+    assert time.monotonic() - start >= 0.05
+    assert list(log_queue.events.keys()) == ["task_0"]
+    assert log_queue.nb_dropped_events == 1
+
+    # The consumer drains the queue: the event is admitted
+    log_queue.block_timeout = 5
+    drainer = threading.Timer(0.05, log_queue.get_batch)
+    drainer.start()
+    log_queue.append(make_event(2))
+    drainer.join()
+    assert list(log_queue.events.keys()) == ["task_2"]
+    assert log_queue.nb_dropped_events == 1
+
+
+def test_add_batch_is_bounded():
+    log_queue = LogQueue(max_events=5, overflow_policy="block", block_timeout=5)
+    for i in range(3):
+        log_queue.append(make_event(i))
+    batch = log_queue.get_batch()
+    for i in range(3, 6):
+        log_queue.append(make_event(i))
+
+    # Failed batch is put back without blocking, in front of the newer events
+    log_queue.add_batch(batch)
+    assert len(log_queue.events) == 5
+    assert list(log_queue.events.keys()) == [
+        "task_0",
+        "task_1",
+        "task_3",
+        "task_4",
+        "task_5",
+    ]
+    assert log_queue.nb_dropped_events == 1
+
+
+def test_events_not_to_log_stay_in_queue():
+    log_queue = LogQueue(max_events=10)
+    log_queue.append(make_event(0, to_log=False))
+    log_queue.append(make_event(1))
+    assert [e["task_id"] for e in log_queue.get_batch()] == ["task_1"]
+    assert list(log_queue.events.keys()) == ["task_0"]
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        LogQueue(overflow_policy="unknown")  # type: ignore
+
+
+def test_materialize_output_parts():
+    event = make_event(0)
+    event.content["output"] = "Hello"
+    event.output_parts = ["Hello", " you", "!"]
+    log_queue = LogQueue()
+    log_queue.append(event)
+    assert log_queue.get_batch()[0]["output"] == "Hello you!"
+    assert event.output_parts == ["Hello you!"]
@@ -0,0 +1,98 @@
+import random
+
+from phospho import lab
+from phospho.lab import job_library
+from phospho.lab.matchers import KeywordAutomaton, compile_keywords
+from phospho.models import EventDefinition
+
+KEYWORDS = ["hi", "hello", "price", "how much", "ice", "he"]
+
+
+def test_keyword_automaton_matches_the_keywords_regex():
+    automaton = KeywordAutomaton()
+    for keyword in KEYWORDS:
+        automaton.add(keyword, keyword)
+
+    rng = random.Random(0)
+    words = KEYWORDS + ["the", "price:", "hiho", "chi", "much"]
+    for _ in range(500):
+        text = "".join(
+            rng.choice(words) + rng.choice([" ", ",", ".", "+", "\n", "", "-"])
+            for _ in range(rng.randint(1, 6))
+        )
+        expected = {
+            keyword
+            for keyword in KEYWORDS
+            if compile_keywords(keyword).search(text) is not None
+        }
+        assert automaton.find(text) == expected, text
+
+
+def test_pattern_matcher():
+    matcher = lab.PatternMatcher()
+    matcher.add_keywords("greeting", "Hello, hi,")
+    matcher.add_keywords("price", "price, how much", event_scope="task_input_only")
+    matcher.add_regex("email", r"[\w.]+@[\w.]+\.com")
+    matcher.add_regex("invalid", r"(")
+
+    results = matcher.run(
+        [
+            lab.Message(id="1", role="user", content="Hi, how much is it ?"),
+            lab.Message(id="2", role="assistant", content="The price is 10$"),
+            lab.Message(id="3", role="user", content="Write to Me@phospho.com"),
+        ]
+    )
+    assert {
+        message_id: {
+            event_name: result.value for event_name, result in message_results.items()
+        }
+        for message_id, message_results in results.items()
+    } == {
+        "1": {"greeting": True, "price": True, "email": False, "invalid": None},
+        # Only in the user messages
+        "2": {"greeting": False, "price": False, "email": False, "invalid": None},
+        "3": {"greeting": False, "price": False, "email": True, "invalid": None},
+    }
+    assert results["1"]["invalid"].result_type == lab.ResultType.error
+    assert results["1"]["greeting"].metadata["evaluation_source"] == "phospho-keywords"
+
+
+async def test_run_pattern_jobs():
+    workload = lab.Workload.from_phospho_events(
+        [
+            EventDefinition(
+                event_name="greeting",
+                description="The user says hi",
+                detection_engine="keyword_detection",
+                keywords="hello, hi",
+            ),
+            EventDefinition(
+                event_name="question",
+                description="The user asks a question",
+                detection_engine="regex_detection",
+                regex_pattern=r"\?",
+            ),
+        ]
+    )
+    messages = [
+        lab.Message(id="1", role="user", content="Hi ! How are you ?"),
+        lab.Message(id="2", role="user", content="hello there"),
+        lab.Message(id="3", role="user", content="Nothing to see"),
+    ]
+    results = workload.run_pattern_jobs(messages)
+    # Same results as the jobs
+    for message in messages:
+        for job_id, job in workload.jobs.items():
+            job_result = await job.async_run(message, store_result=False)
+            assert results[message.id][job_id].value == job_result.value
+            assert results[message.id][job_id].logs == job_result.logs
+    assert workload.jobs["greeting"].results["2"].value is True
+    assert workload.jobs["question"].results["1"].job_id == "question"
+
+
+async def test_keyword_event_detection_ignores_empty_keywords():
+    message = lab.Message(role="user", content="a  b")
+    result = await job_library.keyword_event_detection(
+        message, event_name="test", keywords="c,,", event_scope="task_input_only"
+    )
+    assert result.value is False
@@ -0,0 +1,113 @@
+import asyncio
+import random
+from typing import Literal
+
+from phospho import lab
+
+
+class CountConfig(lab.JobConfig):
+    model: Literal["exact", "rounded", "wrong"] = "exact"
+
+
+async def count_words(message: lab.Message, model: str) -> lab.JobResult:
+    await asyncio.sleep(0.01)
+    nb_words = len(message.content.split())
+    if model == "rounded":
+        # Agrees with "exact" on the even counts only
+        nb_words = nb_words - nb_words % 2
+    elif model == "wrong":
+        nb_words = -1
+    return lab.JobResult(result_type=lab.ResultType.literal, value=nb_words)
+
+
+def make_workload() -> lab.Workload:
+    workload = lab.Workload()
+    workload.add_job(
+        lab.Job(id="count_words", job_function=count_words, config=CountConfig())
+    )
+    return workload
+
+
+MESSAGES = [
+    lab.Message(id=f"message_{i}", content="word " * (2 * (i // 2) + 1))
+    for i in range(20)
+]
+
+
+async def test_alternative_configurations_stop_early():
+    workload = make_workload()
+    await workload.async_run(MESSAGES)
+    job = workload.jobs["count_words"]
+    assert [config.model for config in job.alternative_configs] == ["rounded", "wrong"]
+
+    # All the counts are odd: both alternative configs disagree on every message
+    await workload.async_run_on_alternative_configurations(
+        MESSAGES, executor_type="sequential", accuracy_threshold=1.0
+    )
+    assert job.alternative_stopped == [True, True]
+    assert [len(results) for results in job.alternative_results] == [1, 1]
+    workload.optimize_jobs(accuracy_threshold=1.0)
+    assert job.config.model == "exact"
+
+
+async def test_optimize_with_concurrent_alternative_configurations():
+    # Even counts: "rounded" agrees with "exact" on every message
+    messages = [
+        lab.Message(id=f"message_{i}", content="word " * (2 * i + 2)) for i in range(20)
+    ]
+    workload = make_workload()
+    await workload.async_run(messages)
+    job = workload.jobs["count_words"]
+
+    await workload.async_run_on_alternative_configurations(
+        messages, accuracy_threshold=0.9, max_parallelism=2
+    )
+    assert job.alternative_stopped == [False, True]
+    assert len(job.alternative_results[0]) == len(messages)
+    # "wrong" stopped once it couldn't reach 0.9 on the 20 messages
+    assert len(job.alternative_results[1]) < len(messages)
+    assert job.alternative_nb_agreements == [20, 0]
+
+    workload.optimize_jobs(accuracy_threshold=0.9)
+    assert job.config.model == "rounded"
+    assert [config.model for config in job.alternative_configs] == ["wrong"]
+    assert job.alternative_stopped == [True]
+
+
+def test_can_reach_accuracy():
+    job = make_workload().jobs["count_words"]
+    job.alternative_nb_compared = [10, 10]
+    job.alternative_nb_agreements = [9, 0]
+    # Unknown number of messages: only the statistical bound applies below 1
+    assert job._can_reach_accuracy(0, 0.9)
+    assert not job._can_reach_accuracy(0, 1.0)
+    assert not job._can_reach_accuracy(1, 0.9)
+    # 9 + 5 agreements on 15 messages at best
+    assert job._can_reach_accuracy(0, 0.9, nb_messages=15)
+    assert not job._can_reach_accuracy(0, 0.95, nb_messages=15)
+
+
+def test_false_stop_rate():
+    job = make_workload().jobs["count_words"]
+    # The Hoeffding bound is the tightest for agreement rates around 0.5
+    accuracy_threshold = 0.5
+    confidence = 0.9
+    nb_seeds = 200
+    nb_false_stops = 0
+    for seed in range(nb_seeds):
+        rng = random.Random(seed)
+        job.alternative_nb_compared = [0, 0]
+        job.alternative_nb_agreements = [0, 0]
+        # The config agrees slightly more often than the threshold
+        for _ in range(2000):
+            job.alternative_nb_compared[0] += 1
+            job.alternative_nb_agreements[0] += (
+                rng.random() < accuracy_threshold + 0.005
+            )
+            # Checked after every result
+            if not job._can_reach_accuracy(
+                0, accuracy_threshold, confidence=confidence
+            ):
+                nb_false_stops += 1
+                break
+    assert nb_false_stops / nb_seeds <= 1 - confidence
@@ -0,0 +1,72 @@
+import asyncio
+import os
+
+import pytest
+
+from phospho import lab
+
+
+def word_count(message: lab.Message) -> lab.JobResult:
+    if message.content == "fail":
+        raise ValueError("Can't count")
+    return lab.JobResult(
+        result_type=lab.ResultType.literal,
+        value=len(message.content.split()),
+        metadata={"pid": os.getpid()},
+    )
+
+
+async def is_question(message: lab.Message) -> lab.JobResult:
+    await asyncio.sleep(0)
+    return lab.JobResult(
+        result_type=lab.ResultType.bool, value=message.content.endswith("?")
+    )
+
+
+def make_workload() -> lab.Workload:
+    workload = lab.Workload()
+    workload.add_job(
+        lab.Job(id="word_count", job_function=word_count, metadata={"kind": "sync"})
+    )
+    workload.add_job(lab.Job(id="is_question", job_function=is_question))
+    return workload
+
+
+MESSAGES = [
+    lab.Message(id=f"message_{i}", content="word " * i + "?") for i in range(10)
+]
+
+
+def test_process_executor():
+    workload = make_workload()
+    results = workload.run(
+        MESSAGES, executor_type="process", max_parallelism=2, chunk_size=3
+    )
+    assert {
+        message_id: {job_id: result.value for job_id, result in job_results.items()}
+        for message_id, job_results in results.items()
+    } == {f"message_{i}": {"word_count": i + 1, "is_question": True} for i in range(10)}
+    # The jobs ran in other processes, and the results are stored in the jobs
+    word_count_results = workload.jobs["word_count"].results
+    assert os.getpid() not in {
+        result.metadata["pid"] for result in word_count_results.values()
+    }
+    assert word_count_results["message_0"].job_metadata == {"kind": "sync"}
+    assert word_count_results["message_0"].job_id == "word_count"
+
+
+async def test_async_process_executor():
+    workload = make_workload()
+    messages = MESSAGES + [lab.Message(id="failing", content="fail")]
+    results = await workload.async_run(messages, executor_type="process")
+    assert results["message_3"]["word_count"].value == 4
+    # A failing job doesn't stop the others
+    assert results["failing"]["word_count"].result_type == lab.ResultType.error
+    assert results["failing"]["is_question"].value is False
+
+
+def test_process_executor_needs_picklable_jobs():
+    workload = lab.Workload()
+    workload.add_job(lab.Job(id="lambda", job_function=lambda message: None))
+    with pytest.raises(ValueError, match="picklable"):
+        workload.run(MESSAGES, executor_type="process")
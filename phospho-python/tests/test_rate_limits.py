@@ -0,0 +1,95 @@
+import time
+from types import SimpleNamespace
+
+from phospho.lab.rate_limits import (
+    RateLimiter,
+    get_rate_limiter,
+    get_retry_after,
+    rate_limited_chat_completion,
+    set_rate_limits,
+)
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+    def __init__(self, headers: dict):
+        super().__init__("Too Many Requests")
+        self.response = SimpleNamespace(headers=headers)
+
+
+class FakeCompletions:
+    def __init__(self, nb_rate_limited_calls: int, headers: dict):
+        self.nb_rate_limited_calls = nb_rate_limited_calls
+        self.headers = headers
+        self.calls = []
+
+    async def create(self, **kwargs):
+        self.calls.append((time.monotonic(), kwargs))
+        if len(self.calls) <= self.nb_rate_limited_calls:
+            raise RateLimitError(self.headers)
+        return "response"
+
+
+def fake_client(nb_rate_limited_calls: int = 0, headers: dict = {}):
+    return SimpleNamespace(
+        chat=SimpleNamespace(
+            completions=FakeCompletions(nb_rate_limited_calls, headers)
+        )
+    )
+
+
+def test_rate_limiter_spaces_requests():
+    # 1 request per second, 60 tokens per second
+    rate_limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=3600)
+    delays = [rate_limiter.reserve(nb_tokens=10) for _ in range(3)]
+    assert delays[0] == 0
+    assert 0.9 < delays[1] <= 1
+    assert 1.9 < delays[2] <= 2
+    # A big request waits for the tokens
+    assert 2.9 < RateLimiter(tokens_per_minute=3600).reserve(nb_tokens=240) <= 3
+
+    rate_limiter.pause(10)
+    assert 9.9 < rate_limiter.reserve() <= 10
+    assert rate_limiter.stats()["nb_rate_limited_requests"] == 1
+    assert rate_limiter.stats()["nb_requests"] == 4
+
+
+def test_get_retry_after():
+    assert get_retry_after(RateLimitError({"retry-after": "2"})) == 2
+    assert get_retry_after(RateLimitError({"retry-after-ms": "500"})) == 0.5
+    assert get_retry_after(RateLimitError({})) is None
+    assert get_retry_after(ValueError()) is None
+    date = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 30))
+    assert 28 < get_retry_after(RateLimitError({"retry-after": date})) <= 30
+
+
+async def test_rate_limited_chat_completion_retries_after_429():
+    client = fake_client(nb_rate_limited_calls=1, headers={"retry-after-ms": "200"})
+    response, delay = await rate_limited_chat_completion(
+        client, "openai", "test-retry", messages=[], max_tokens=5
+    )
+    assert response == "response"
+    calls = client.chat.completions.calls
+    assert len(calls) == 2
+    assert calls[1][1] == {"model": "test-retry", "messages": [], "max_tokens": 5}
+    # The retry waited for the Retry-After delay, which is reported
+    assert calls[1][0] - calls[0][0] >= 0.19
+    assert delay >= 0.19
+    # The other calls to this model are paused too
+    assert (
+        get_rate_limiter("openai", "test-retry").stats()["nb_rate_limited_requests"]
+        == 1
+    )
+
+
+async def test_rate_limits_are_shared():
+    rate_limiter = set_rate_limits("mistral:test-shared", requests_per_minute=120)
+    assert get_rate_limiter("mistral", "test-shared") is rate_limiter
+
+    client = fake_client()
+    for _ in range(3):
+        await rate_limited_chat_completion(client, "mistral", "test-shared")
+    calls = client.chat.completions.calls
+    # 2 requests per second, with bursts of 2 requests
+    assert calls[2][0] - calls[0][0] >= 0.49
@@ -0,0 +1,89 @@
+import phospho
+from phospho.sampling import Sampler, TokenBucket, session_sampled_in
+
+
+def test_session_sampled_in():
+    session_ids = [f"session_{i}" for i in range(10_000)]
+    sampled_in = [s for s in session_ids if session_sampled_in(s, 0.1)]
+    assert 800 < len(sampled_in) < 1200
+    # The decision is deterministic
+    assert sampled_in == [s for s in session_ids if session_sampled_in(s, 0.1)]
+    # A session sampled in at a rate is sampled in at every higher rate
+    assert all(session_sampled_in(s, 0.5) for s in sampled_in)
+    assert session_sampled_in("session_0", 1.0)
+    assert not session_sampled_in("session_0", 0.0)
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=10)
+    nb_acquired = sum(bucket.try_acquire() for _ in range(100))
+    assert nb_acquired == 10
+    bucket.last_refill -= 0.5
+    assert sum(bucket.try_acquire() for _ in range(100)) == 5
+
+
+def test_sampler_rate_limit():
+    sampler = Sampler(max_events_per_second=2)
+    assert sampler.sample("task_1", "session") == {
+        "sample_rate": 1.0,
+        "nb_rate_limited_events": 0,
+    }
+    assert sampler.sample("task_2", "session") is not None
+    assert sampler.sample("task_3", "session") is None
+    assert sampler.sample("task_4", "session") is None
+    # The decision is taken once per task
+    assert sampler.sample("task_1", "session") is not None
+    assert sampler.sample("task_3", "session") is None
+
+    sampler.token_bucket.last_refill -= 1
+    assert sampler.sample("task_5", "session") == {
+        "sample_rate": 1.0,
+        "nb_rate_limited_events": 2,
+    }
+
+
+def test_sampled_out_events_are_not_logged():
+    phospho.init(api_key="test", project_id="test", tick=0.05, sample_rate=0.5)
+    # Keep the events in the log_queue
+    phospho.consumer.stop()
+    sampled_out = next(
+        f"session_{i}"
+        for i in range(100)
+        if not session_sampled_in(f"session_{i}", 0.5)
+    )
+    sampled_in = next(
+        f"session_{i}" for i in range(100) if session_sampled_in(f"session_{i}", 0.5)
+    )
+
+    log_content = phospho.log(input="Say hi", output="Hi", session_id=sampled_out)
+    assert log_content["session_id"] == sampled_out
+    assert "input" not in log_content
+    assert phospho.log_queue.get_batch() == []
+
+    log_content = phospho.log(input="Say hi", output="Hi", session_id=sampled_in)
+    assert log_content["sample_rate"] == 0.5
+    batch = phospho.log_queue.get_batch()
+    assert len(batch) == 1
+    assert batch[0]["session_id"] == sampled_in
+    assert batch[0]["sample_rate"] == 0.5
+
+
+def test_streamed_task_is_fully_logged_or_not():
+    phospho.init(api_key="test", project_id="test", tick=0.05, max_events_per_second=1)
+    phospho.consumer.stop()
+    for task_id in ["task_stream_1", "task_stream_2"]:
+        for chunk in ["Hello", " you", None]:
+            phospho._log_single_event(
+                input="Say hi",
+                output=chunk,
+                task_id=task_id,
+                to_log=chunk is None,
+            )
+    batch = phospho.log_queue.get_batch()
+    # The second task is over the rate limit: none of its chunks are logged
+    assert len(batch) == 1
+    assert batch[0]["task_id"] == "task_stream_1"
+    assert batch[0]["output"] == "Hello you"
+
+    phospho.init(api_key="test", project_id="test", tick=0.05)
+    assert phospho.sampler is None
@@ -0,0 +1,144 @@
+import atexit
+import os
+import subprocess
+import sys
+
+import pytest
+
+from phospho.client import Client
+from phospho.consumer import Consumer
+from phospho.log_queue import Event, LogQueue
+from phospho.spill import DiskSpill
+
+BASE_URL = "http://phospho.test"
+
+
+def make_events(start: int, end: int):
+    return [{"task_id": f"task_{i}", "input": "hello"} for i in range(start, end)]
+
+
+def test_spill_write_read_commit(tmp_path):
+    spill = DiskSpill(str(tmp_path), segment_max_bytes=100)
+    for i in range(10):
+        spill.write(make_events(i, i + 1))
+    # Small segments: the events are spread over several files
+    assert len(spill._segments()) > 1
+
+    batch, position = spill.read_batch(max_events=4)
+    assert batch == make_events(0, 4)
+    # Not committed: the same events are read again
+    assert spill.read_batch(max_events=4)[0] == make_events(0, 4)
+
+    spill.commit(position)
+    batch, position = spill.read_batch(max_events=100)
+    assert batch == make_events(4, 10)
+    spill.commit(position)
+    assert spill.read_batch()[0] == []
+    # Delivered segments are deleted
+    assert len(spill._segments()) <= 1
+
+
+def test_spill_is_replayed_after_restart(tmp_path):
+    spill = DiskSpill(str(tmp_path))
+    spill.write(make_events(0, 5))
+    _, position = spill.read_batch(max_events=2)
+    spill.commit(position)
+    spill.write(make_events(5, 6))
+
+    # The process restarts: undelivered events are still there
+    spill = DiskSpill(str(tmp_path))
+    assert spill.read_batch()[0] == make_events(2, 6)
+
+    # A line left truncated by a crash is skipped
+    with open(os.path.join(str(tmp_path), "segment_00000099.jsonl"), "w") as f:
+        f.write('{"task_id": "task_')
+    spill = DiskSpill(str(tmp_path))
+    spill.write(make_events(6, 7))
+    assert spill.read_batch()[0] == make_events(2, 7)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="fork is not available on Windows")
+def test_spill_adopts_directories_of_stopped_processes(tmp_path):
+    # A worker that has stopped
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    DiskSpill(str(tmp_path / f"pid_{process.pid}")).write(make_events(0, 3))
+    # A worker still running
+    DiskSpill(str(tmp_path / f"pid_{os.getppid()}")).write(make_events(3, 4))
+
+    # The process restarts
+    spill = DiskSpill(str(tmp_path))
+    assert spill.read_batch()[0] == make_events(0, 3)
+    assert not os.path.exists(str(tmp_path / f"pid_{process.pid}"))
+    assert os.path.exists(str(tmp_path / f"pid_{os.getppid()}"))
+
+    # A forked worker adopts the directories of its stopped siblings too
+    sibling_spill = DiskSpill(str(tmp_path / f"pid_{process.pid}"))
+    sibling_spill.write(make_events(4, 6))
+    spill._reinit_after_fork()
+    assert spill.directory == str(tmp_path / f"pid_{os.getpid()}")
+    # Not in the fork hook, but on the first read of the consumer
+    assert os.path.exists(str(tmp_path / f"pid_{process.pid}"))
+    assert spill.read_batch()[0] == make_events(4, 6)
+    assert not os.path.exists(str(tmp_path / f"pid_{process.pid}"))
+
+
+def test_log_queue_spills_when_full(tmp_path):
+    spill = DiskSpill(str(tmp_path))
+    log_queue = LogQueue(max_events=2, spill=spill)
+    for i in range(5):
+        log_queue.append(Event(id=f"task_{i}", content=make_events(i, i + 1)[0]))
+
+    assert list(log_queue.events.keys()) == ["task_0", "task_1"]
+    assert log_queue.nb_dropped_events == 0
+    assert spill.read_batch()[0] == make_events(2, 5)
+
+    # Failed batches are written to disk instead of memory
+    log_queue.add_batch(log_queue.get_batch())
+    assert list(log_queue.events.keys()) == []
+    assert spill.read_batch()[0] == make_events(2, 5) + make_events(0, 2)
+
+
+def test_log_queue_spills_outside_of_the_lock(tmp_path):
+    locked_while_writing = []
+
+    class RecordingSpill(DiskSpill):
+        def write(self, events_content_list):
+            locked_while_writing.append(log_queue.lock.locked())
+            super().write(events_content_list)
+
+    log_queue = LogQueue(max_events=1, spill=RecordingSpill(str(tmp_path)))
+    for i in range(3):
+        log_queue.append(Event(id=f"task_{i}", content=make_events(i, i + 1)[0]))
+    # The other threads can log, and the consumer get a batch, while writing to disk
+    assert locked_while_writing == [False, False]
+    assert log_queue.spill.read_batch()[0] == make_events(1, 3)
+
+
+def test_consumer_replays_spill(tmp_path, requests_mock):
+    client = Client(api_key="key", project_id="project", base_url=BASE_URL)
+    spill = DiskSpill(str(tmp_path))
+    spill.write(make_events(0, 3))
+    log_queue = LogQueue(spill=spill)
+    consumer = Consumer(log_queue=log_queue, client=client)
+    # The consumer thread isn't started in this test
+    atexit.unregister(consumer.stop)
+
+    # The backend is down: the events stay on disk
+    requests_mock.post(f"{BASE_URL}/v2/log/project", status_code=503)
+    log_queue.append(Event(id="task_3", content=make_events(3, 4)[0]))
+    consumer.send_batch()
+    assert consumer.nb_consecutive_errors == 1
+    assert spill.read_batch()[0] == make_events(0, 4)
+
+    # The backend is back: the spill is replayed
+    requests_mock.post(f"{BASE_URL}/v2/log/project", json={"logged_events": []})
+    consumer.send_batch()
+    assert consumer.nb_consecutive_errors == 0
+    sent = [
+        e
+        for r in requests_mock.request_history[1:]
+        for e in r.json()["batched_log_events"]
+    ]
+    assert sent == make_events(0, 4)
+    assert spill.read_batch()[0] == []
@@ -1,6 +1,16 @@
+import threading
+
 import phospho
 import pytest
 from openai import OpenAI
+from opentelemetry import context as otel_context
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from phospho.tracing import (
+    GlobalBatchSpanProcessor,
+    get_client_tracing,
+    set_phospho_attributes,
+)
 
 
 def test_context_tracing():
@@ -167,3 +177,46 @@ def test_tracing_combined():
         steps=[{"some_data": "very important"}],
     )
     phospho.flush()
+
+
+def test_tracing_resources_are_reused():
+    phospho.init(tick=0.05, base_url="http://127.0.0.1:8000", tracing=True)
+    client_tracing = get_client_tracing(phospho.client)
+
+    phospho.log(input="Say hi", output="Hi", steps=[{"some_data": "important"}])
+    nb_threads = threading.active_count()
+    for _ in range(20):
+        phospho.log(input="Say hi", output="Hi", steps=[{"some_data": "important"}])
+
+    # No new exporter thread nor tracer provider per log
+    assert threading.active_count() == nb_threads
+    assert get_client_tracing(phospho.client) is client_tracing
+
+
+def test_phospho_attributes_from_context():
+    span_exporter = InMemorySpanExporter()
+    span_processor = GlobalBatchSpanProcessor(span_exporter)
+    tracer_provider = TracerProvider()
+    tracer_provider.add_span_processor(span_processor)
+    tracer = tracer_provider.get_tracer("test")
+
+    token = otel_context.attach(
+        set_phospho_attributes(
+            task_id="task_0", session_id="session_0", metadata={"user_id": "user"}
+        )
+    )
+    try:
+        with tracer.start_as_current_span("in_context"):
+            pass
+    finally:
+        otel_context.detach(token)
+    with tracer.start_as_current_span("out_of_context"):
+        pass
+
+    span_processor.force_flush()
+    spans = {span.name: span for span in span_exporter.get_finished_spans()}
+    assert spans["in_context"].attributes["phospho.task_id"] == "task_0"
+    assert spans["in_context"].attributes["phospho.session_id"] == "session_0"
+    assert spans["in_context"].attributes["phospho.metadata.user_id"] == "user"
+    assert "phospho.task_id" not in spans["out_of_context"].attributes
+    tracer_provider.shutdown()
@@ -0,0 +1,158 @@
+import datetime
+import json
+import re
+import uuid
+from collections import OrderedDict
+
+import pydantic
+
+from phospho import config, utils
+from phospho.utils import (
+    convert_content_to_loggable_content,
+    count_tokens,
+    filter_nonjsonable_keys,
+    is_jsonable,
+    is_loggable,
+    json_dumps,
+    sanitize_content,
+    shorten_text,
+)
+
+
+class Item(pydantic.BaseModel):
+    name: str
+    created_at: datetime.datetime
+
+
+def test_is_jsonable():
+    assert is_jsonable({"a": [1, 2.0, "3", None, True, (4, 5)], 6: {"b": "c"}})
+    assert not is_jsonable({"a": [1, object()]})
+    assert not is_jsonable({("a", "b"): 1})
+    assert not is_jsonable(b"{}")
+    assert not is_jsonable(uuid.uuid4())
+
+
+def test_is_loggable():
+    assert is_loggable({"a": [1, "b"], 2: None})
+    assert not is_loggable({"a": datetime.datetime(2024, 1, 1)})
+
+
+def test_sanitize_content_keeps_jsonable_content():
+    content = {"messages": [{"role": "user", "content": "hello"}], "n": 1}
+    new_content, is_valid = sanitize_content(content)
+    # Not copied
+    assert new_content is content
+    assert is_valid
+
+
+def test_sanitize_content_converts_nested_values():
+    now = datetime.datetime(2024, 1, 1)
+    content = {
+        "untouched": {"a": 1},
+        "date": now,
+        "nested": {"item": Item(name="x", created_at=now)},
+        "list": [1, now],
+        "tuple": (1, now),
+        "bytes": b'{"a": 1}',
+    }
+    new_content, is_valid = sanitize_content(content)
+    assert is_valid
+    assert new_content == {
+        "untouched": {"a": 1},
+        "date": str(now),
+        "nested": {"item": {"name": "x", "created_at": str(now)}},
+        "list": str([1, str(now)]),
+        "tuple": str((1, now)),
+        "bytes": {"a": 1},
+    }
+    # Unchanged values are not copied, and the input is left untouched
+    assert new_content["untouched"] is content["untouched"]
+    assert content["date"] is now
+    json.dumps(new_content)
+
+    assert convert_content_to_loggable_content(content) == new_content
+
+
+def test_sanitize_content_invalid_keys():
+    content = {"valid": 1, "invalid": {("a", "b"): 1}}
+    new_content, is_valid = sanitize_content(content)
+    assert not is_valid
+    assert filter_nonjsonable_keys(new_content) == {"valid": 1}
+
+
+def test_json_dumps():
+    content = {"a": [1, "b", None], "date": datetime.datetime(2024, 1, 1)}
+    assert json.loads(json_dumps(content)) == json.loads(
+        json.dumps(content, default=str)
+    )
+    # Integers larger than 64 bits are supported
+    assert json.loads(json_dumps({"a": 2**70})) == {"a": 2**70}
+
+
+class WordTokenizer:
+    name = "words"
+
+    def __init__(self):
+        self.nb_calls = 0
+
+    def encode(self, text: str) -> list:
+        self.nb_calls += 1
+        return text.split()
+
+
+def test_count_tokens_is_cached(monkeypatch):
+    monkeypatch.setattr(config, "TOKEN_COUNT_CACHE_SIZE", 2)
+    # Start from an empty cache, whatever the tests run before
+    monkeypatch.setattr(utils, "_token_counts", OrderedDict())
+    tokenizer = WordTokenizer()
+
+    assert count_tokens("hello world", tokenizer=tokenizer) == 2
+    assert count_tokens("hello world", tokenizer=tokenizer) == 2
+    assert tokenizer.nb_calls == 1
+
+    # The least recently used counts are evicted
+    count_tokens("a b c", tokenizer=tokenizer)
+    count_tokens("a b c d", tokenizer=tokenizer)
+    assert tokenizer.nb_calls == 3
+    count_tokens("hello world", tokenizer=tokenizer)
+    assert tokenizer.nb_calls == 4
+
+
+class WordEncoding:
+    """Splits the text in words and whitespaces, the tokens are the words"""
+
+    name = "word_encoding"
+
+    def __init__(self):
+        self.nb_encoded_chars = 0
+
+    def encode(self, text: str) -> list:
+        self.nb_encoded_chars += len(text)
+        return re.findall(r"\S+|\s+", text)
+
+    def decode(self, tokens: list) -> str:
+        return "".join(tokens)
+
+
+def test_shorten_text_bounded(monkeypatch):
+    encoding = WordEncoding()
+    monkeypatch.setattr(utils, "get_tokenizer", lambda model=None: encoding)
+
+    prompt = " ".join(f"word{i}" for i in range(100_000))
+    for how in ["left", "right", "center"]:
+        encoding.nb_encoded_chars = 0
+        shortened = shorten_text(prompt, max_length=100, margin=20, how=how)
+        # Only a window of the prompt was encoded
+        assert encoding.nb_encoded_chars < len(prompt) // 10
+        assert shortened == shorten_text(
+            prompt, max_length=100, margin=20, how=how, bounded=False
+        )
+        assert len(encoding.encode(shortened)) <= 87
+
+    # Prompts close to max_length are encoded fully
+    prompt = " ".join(f"word{i}" for i in range(60))
+    assert shorten_text(prompt, max_length=200, margin=20) == prompt
+    assert shorten_text(prompt, max_length=100, margin=20) == shorten_text(
+        prompt, max_length=100, margin=20, bounded=False
+    )
+    assert shorten_text(None, max_length=100) == ""